@@ -1,10 +1,11 @@
 import os.path
-import sys, re
+import sys, re, datetime
 
 from PySide6 import QtWidgets, QtGui, QtCore
 from PySide6.QtCore import Qt
 
 from apollo.db.library_manager import DataBaseManager
+from apollo.db.database_worker import DataBaseWorker
 from apollo import exe_time
 
 
@@ -23,6 +24,52 @@ class SQLTableModel(QtGui.QStandardItemModel):
         self.DB_FIELDS = self.DBManager.db_fields
         self.DB_TABLE = None
 
+    @staticmethod
+    def DisplayValue(Field: str, Value):
+        """
+        Formats the numeric columns of the library for display, every other value is
+        only converted to a string
+
+        Parameters
+        ----------
+        Field: str
+            name of the column
+        Value: Any
+            value stored in the DB
+
+        Returns
+        -------
+        str
+            value as it is shown in the views
+        """
+        if isinstance(Value, bool) or not isinstance(Value, (int, float)):
+            return str(Value)
+        if Field == "length":
+            return str(datetime.timedelta(seconds = int(Value) // 1000))
+        if Field == "filesize":
+            return f"{round(Value / 1048576, 2)} Mb"
+        if Field == "bitrate":
+            return f"{int(Value / 1000)} Kbps"
+        if Field == "sample_rate":
+            return f"{Value}Hz"
+        return str(Value)
+
+    def CreateItems(self, Row: list):
+        """
+        Creates the display items for a row of the DB table
+
+        Parameters
+        ----------
+        Row: list
+            values of a DB row in column order
+
+        Returns
+        -------
+        List[QtGui.QStandardItem]
+            items for every column of the row
+        """
+        return [QtGui.QStandardItem(self.DisplayValue(Field, Value)) for Field, Value in zip(self.DB_FIELDS, Row)]
+
     def OrderTable(self, Keys):
         """
         Info: Orders table rows accroding to the keys
@@ -32,16 +79,19 @@ class SQLTableModel(QtGui.QStandardItemModel):
         Returns: None
         Errors: None
         """
-        def FilterData(Row):
-            return [QtGui.QStandardItem(str(V)) for V in ResultSet_dict.get(Row)]
-
         self.removeRows(0, self.rowCount())
-        ResultSet = self.DBManager.exec_query(f"SELECT * FROM {self.DB_TABLE}")
 
-        if len(ResultSet) > 0:
-            ResultSet_dict = {Value[0]: Value for Value in ResultSet}
-            for Row in Keys:
-                self.appendRow(FilterData(Row))
+        # rows are placed at the positions of their key while the table is streamed
+        Positions = {}
+        for Row, Key in enumerate(Keys):
+            Positions.setdefault(Key, []).append(Row)
+        self.setRowCount(len(Keys))
+
+        for Batch in self.DBManager.stream_query(f"SELECT * FROM {self.DB_TABLE}"):
+            for Values in Batch:
+                for Row in Positions.get(Values[0], []):
+                    for Col, Item in enumerate(self.CreateItems(Values)):
+                        self.setItem(Row, Col, Item)
 
     def Data_atIndex(self, Indexes: list = [], Rows: list = [], Columns: list = []):
         """
@@ -82,6 +132,75 @@ class SQLTableModel(QtGui.QStandardItemModel):
 
         return list(Table.values())
 
+    def Rows_forKeys(self, Keys: list):
+        """
+        Finds the rows of the model whose file_id is one of the keys
+
+        Parameters
+        ----------
+        Keys: list
+            file_id of the rows to find
+
+        Returns
+        -------
+        Dict
+            {file_id: [Row, Row, ...]}, keys that are not in the model are left out
+        """
+        Rows = {}
+        if len(Keys) <= 64:
+            # a few keys are looked up by the C++ model, skipping a python pass over every row
+            for Key in set(Keys):
+                Items = self.findItems(str(Key), Qt.MatchExactly, 0)
+                if Items:
+                    Rows[Key] = sorted([Item.row() for Item in Items])
+        else:
+            Keys = set(Keys)
+            for Row in range(self.rowCount()):
+                Key = self.item(Row, 0).text()
+                if Key in Keys:
+                    Rows.setdefault(Key, []).append(Row)
+        return Rows
+
+    def RefreshRows(self, Keys: list):
+        """
+        Reloads only the rows of the given keys from the DB, only the cells whose value
+        changed are updated so the views repaint just those cells
+
+        Parameters
+        ----------
+        Keys: list
+            file_id of the rows that changed
+        """
+        Rows = self.Rows_forKeys(Keys)
+        if not Rows:
+            return None
+        for Values in self.DBManager.BulkSelect(self.DB_TABLE, "file_id", list(Rows.keys())):
+            for Row in Rows.get(Values[0], []):
+                for Col, (Field, Value) in enumerate(zip(self.DB_FIELDS, Values)):
+                    Text = self.DisplayValue(Field, Value)
+                    Item = self.item(Row, Col)
+                    if Item is None:
+                        self.setItem(Row, Col, QtGui.QStandardItem(Text))
+                    elif Item.text() != Text:
+                        Item.setText(Text)
+
+    def RemoveKeys(self, Keys: list):
+        """
+        Removes the rows of the given keys from the model, consecutive rows are removed
+        with a single call
+
+        Parameters
+        ----------
+        Keys: list
+            file_id of the removed rows
+        """
+        Rows = sorted([Row for KeyRows in self.Rows_forKeys(Keys).values() for Row in KeyRows], reverse = True)
+        while Rows:
+            End = Start = Rows.pop(0)
+            while Rows and Rows[0] == Start - 1:
+                Start = Rows.pop(0)
+            self.removeRows(Start, (End - Start) + 1)
+
     def RefreshData(self):
         """
         Info: Refreshing the Tablemodel
@@ -92,7 +211,17 @@ class SQLTableModel(QtGui.QStandardItemModel):
         self.removeRows(0, self.rowCount())
         self.LoadData(self.DB_TABLE)
 
-    def LoadTable(self, TableName, Header = None):
+    def RefreshData_Async(self):
+        """
+        Info: Refreshing the Tablemodel on the database worker, the old rows are kept
+        until the new ones are ready
+        Args: None
+        Returns: Future
+        Errors: None
+        """
+        return self.LoadData_Async(self.DB_TABLE)
+
+    def LoadTable(self, TableName, Header = None, Async = False):
         """
         Info: Loads the table model with DB values
         Args:
@@ -100,13 +229,18 @@ class SQLTableModel(QtGui.QStandardItemModel):
             -> DB tablename to get data from
         Header: list(string, string)
             -> header names of the table
-        Orientation: Qt.Horizontal | Qt.vertical
-            -> Orientation of header data
+        Async: bool
+            -> loads the rows on the database worker
         Returns: None
         Errors: None
         """
         self.DB_TABLE = TableName
-        self.LoadData(TableName)
+        if Async:
+            # headers can only be set on existing columns
+            self.setColumnCount(len(self.DB_FIELDS))
+            self.LoadData_Async(TableName)
+        else:
+            self.LoadData(TableName)
         if Header != None:
             self.LoadHeaderData(Header, Qt.Horizontal)
         else:
@@ -121,9 +255,31 @@ class SQLTableModel(QtGui.QStandardItemModel):
         Returns: None
         Errors: None
         """
-        ResultSet = self.DBManager.exec_query(f"SELECT * FROM {TableName}")
-        for Row in ResultSet:
-            self.appendRow(list(map(lambda x: QtGui.QStandardItem(str(x)), Row)))
+        for Batch in self.DBManager.stream_query(f"SELECT * FROM {TableName}"):
+            for Row in Batch:
+                self.appendRow(self.CreateItems(Row))
+
+    def LoadData_Async(self, TableName):
+        """
+        Info: Loads the table model with DB values on the database worker, the items are
+        built off the GUI thread and replace the rows of the model once they are ready
+        Args:
+        TableName: string
+            -> DB tablename to get data from
+        Returns: Future
+        Errors: None
+        """
+        def Load():
+            return [self.CreateItems(Row)
+                    for Batch in self.DBManager.stream_query(f"SELECT * FROM {TableName}")
+                    for Row in Batch]
+
+        def Swap(Rows):
+            self.removeRows(0, self.rowCount())
+            for Row in Rows:
+                self.appendRow(Row)
+
+        return DataBaseWorker.Instance().Submit(Load, slot = Swap, key = f"SQLTableModel.LoadData.{id(self)}")
 
     def LoadHeaderData(self, Header, Orientation = Qt.Horizontal):
         """
@@ -146,16 +302,13 @@ class SQLTableModel(QtGui.QStandardItemModel):
         View: QtTableView
             -> View to delete data from
         Returns: None
-        Errors:
-        1. Rows are not deleted when deleting more than 5000 rows
+        Errors: None
         """
 
         if self.DB_TABLE == "library":
             selectedID = self.Data_atIndex(Indexes = SelectedIndexes, Columns = [0])
-            selectedID = ", ".join([f"'{v}'"for v in selectedID])
-            self.DBManager.exec_query(f"DELETE FROM {self.DB_TABLE} WHERE file_id IN ({selectedID})")
-            self.RefreshData()
             Paths = self.Data_atIndex(SelectedIndexes, [self.DB_FIELDS.index("file_path")])
+            self.RemoveKeys(self.DBManager.BulkDelete(self.DB_TABLE, "file_id", selectedID))
             #TODO: ENABLE IN PRODUCTION
             # if Delete:
             #     for path in Paths:
@@ -183,14 +336,27 @@ class SQLTableModel(QtGui.QStandardItemModel):
         rating: float
             rating to update to
         """
-        Indexes = ", ".join([f"'{v}'" for v in self.Data_atIndex(Indexes = Indexes, Columns = [0])])
-        self.DBManager.exec_query(f"""
-        UPDATE {self.DB_TABLE}
-        SET rating = {rating}
-        WHERE
-            file_id IN ({Indexes})
-        """)
-        self.RefreshData()
+        Indexes = self.Data_atIndex(Indexes = Indexes, Columns = [0])
+        # ratings are stored in the library table, the model can show a view of it
+        self.RefreshRows(self.DBManager.BulkUpdate("library", "file_id", Indexes, {"rating": rating}))
+
+    def MatchedRows(self, query: str):
+        """
+        Searches the library full text index and flags the rows of the model whose
+        file_id matched
+
+        Parameters
+        ----------
+        query: str
+            Query string to search for
+
+        Returns
+        -------
+        List[bool]
+            match flag for every row of the model
+        """
+        Matches = set(self.DBManager.SearchLibrary(query))
+        return [self.index(Row, 0).data() in Matches for Row in range(self.rowCount())]
 
     def SearchModel(self, query: str, View: QtWidgets.QTableView):
         """
@@ -203,22 +369,13 @@ class SQLTableModel(QtGui.QStandardItemModel):
         View: QtWidgets.QTableView
             View to apply mask to
         """
-        if query == "":
+        if query.strip() == "":
             for Row in range(self.rowCount()):
                 View.showRow(Row)
             return None
 
-        for Row in range(self.rowCount()):
-            Query = []
-            for Col in ["album", "albumartist", "artist", "title"]:
-                Col = self.DB_FIELDS.index(Col)
-                data = self.index(Row, Col).data()
-                Query.append(data.find(query) != -1)
-                Query.append(data.find(query.upper()) != -1)
-                Query.append(data.find(query.lower()) != -1)
-                Query.append(data.find(query.title()) != -1)
-
-            if any(Query):
+        for Row, Matched in enumerate(self.MatchedRows(query)):
+            if Matched:
                 View.showRow(Row)
             else:
                 View.hideRow(Row)
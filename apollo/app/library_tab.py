@@ -51,7 +51,7 @@ class LibraryTab:
         """
         self.MainView = self.UI.LDT_TBV_maintable
         self.MainModel = SQLTableModel(self.UI.DBManager, self.MainView)
-        self.MainModel.LoadTable("library", self.MainModel.DB_FIELDS)
+        self.MainModel.LoadTable("library", self.MainModel.DB_FIELDS, Async = True)
         self.DataProvider.AddModel(self.MainModel, "library_model")
         self.MainView.setModel(self.MainModel)
 
@@ -90,7 +90,7 @@ class LibraryTab:
         MainMenu = QtWidgets.QMenu()
 
         BindMenuActions(MainMenu, "Refresh View",
-                        lambda: self.MainModel.RefreshData()
+                        lambda: self.MainModel.RefreshData_Async()
                         )
         MainMenu.addSeparator()
 
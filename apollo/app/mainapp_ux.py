@@ -7,8 +7,9 @@ from PySide6.QtCore import Qt
 from apollo.gui.ui_mainwindow_apollo import Ui_MainWindow as MainWindow
 from apollo.utils import AppConfig
 from apollo.plugins.app_theme import Theme
-from apollo.db import LibraryManager
-from apollo.db.library_manager_app import LibraryManager_App
+from apollo.db import LibraryManager, ConnectionPool, DataBaseWorker, QueryProfiler, DEFAULT_PRAGMA_PROFILE
+from apollo.db import LibraryWatcher, ScanJob, ScanProgress, MIGRATIONS
+from apollo.db.library_manager_app import LibraryManager_App, FileScanner_Thread, LBT_FILE_FILTERS
 from apollo.app.dataproviders import ApolloDataProvider
 from apollo.app.library_tab import LibraryTab
 from apollo.app.nowplaying_tab import NowPlayingTab
@@ -29,6 +30,13 @@ class ApolloUX(QtWidgets.QMainWindow, MainWindow):
         # Init
         self.AppConfig = AppConfig()
         self.Theme = Theme()
+        Profiler = self.AppConfig["QUERY_PROFILER"] or {}
+        QueryProfiler.Configure(Profiler.get("enabled"), Profiler.get("slow_ms"), Profiler.get("slow_log_size"),
+                                Profiler.get("max_statements"))
+        CurrentDB = self.AppConfig["CURRENT_DB"]
+        ConnectionPool.SetProfile(self.AppConfig["current_db_path"],
+                                  self.AppConfig[f"MONITERED_DB/{CurrentDB}/profile"] or DEFAULT_PRAGMA_PROFILE,
+                                  self.AppConfig[f"MONITERED_DB/{CurrentDB}/pragmas"] or {})
         self.DBManager = LibraryManager(self.AppConfig["current_db_path"])
         self.DataProvider = ApolloDataProvider()
 
@@ -46,6 +54,9 @@ class ApolloMain(ApolloUX):
         """
         super().__init__()
         self.InitTabs()
+        self.InitWatcher()
+        self.ResumeScans()
+        self.RunSchemaTasks()
         self.FunctionBindings()
 
     def FunctionBindings(self):
@@ -55,6 +66,9 @@ class ApolloMain(ApolloUX):
         self.actionDataBase_Manager.triggered.connect(lambda: self.Launch_LibraryManagerApp(0))
         self.actionMetadata_Edit.triggered.connect(lambda: self.Launch_LibraryManagerApp(1))
         self.actionFile_Orginizer.triggered.connect(lambda: self.Launch_LibraryManagerApp(2))
+        QtGui.QShortcut(QtGui.QKeySequence("Ctrl+Shift+Q"), self).activated.connect(self.Launch_QueryReport)
+        DataBaseWorker.Instance().JobFailed.connect(
+            lambda future, error: self.statusBar().showMessage(f"Database Job Failed: {type(error).__name__}: {error}"))
 
     def InitTabs(self):
         """
@@ -63,6 +77,47 @@ class ApolloMain(ApolloUX):
         self.NowPlayingTab = NowPlayingTab(self)
         self.LibraryTab = LibraryTab(self)
 
+    def InitWatcher(self):
+        """
+        Starts watching the monitored folders of the current library, changes are shown in the library tab
+        """
+        WatchConfig = self.AppConfig["LIBRARY_WATCH"] or {}
+        CurrentDB = self.AppConfig["CURRENT_DB"]
+        Folders = self.AppConfig[f"MONITERED_DB/{CurrentDB}/file_mon"] or []
+        if not WatchConfig.get("enabled", True) or Folders == []:
+            return None
+        Filters = self.AppConfig[f"MONITERED_DB/{CurrentDB}/filters"] or [1 for _ in LBT_FILE_FILTERS]
+        Include = [K for K, V in zip(LBT_FILE_FILTERS, Filters) if V == 1]
+        ScanConfig = self.AppConfig["LIBRARY_SCAN"] or {}
+        self.LibraryWatcher = LibraryWatcher(self.AppConfig["current_db_path"], Folders, Include,
+                                             WatchConfig.get("debounce_ms"), WatchConfig.get("batch_dirs"),
+                                             ScanConfig.get("chunk_rows"), parent = self)
+        self.LibraryWatcher.LibraryChanged.connect(lambda Result: self.LibraryTab.MainModel.RefreshData_Async())
+        self.LibraryWatcher.StatusChanged.connect(self.statusBar().showMessage)
+
+    def ResumeScans(self):
+        """
+        Resumes the scans of the current library that were interrupted by closing the app or a crash
+        """
+        ScanConfig = self.AppConfig["LIBRARY_SCAN"] or {}
+        for Job in ScanJob.Unfinished(self.DBManager):
+            self.statusBar().showMessage(f"Resuming Scan: {Job.Files} Files Added")
+            FileScanner_Thread(Job.Dirs, [], self.AppConfig["current_db_path"], self.statusBar().showMessage,
+                               ScanConfig.get("chunk_rows"), ScanConfig.get("chunk_bytes"),
+                               ScanConfig.get("workers"), ScanConfig.get("stages"), Job = Job,
+                               Progress = ScanProgress(ScanConfig.get("progress_rate")),
+                               Prune = ScanConfig.get("prune", False),
+                               DeviceThreads = ScanConfig.get("device_threads")).start()
+
+    def RunSchemaTasks(self):
+        """
+        Runs the library upgrades scheduled by the startup migrations on the database worker,
+        their progress and failures are shown in the status bar
+        """
+        MIGRATIONS.Background(self.DBManager, self.statusBar().showMessage,
+                              lambda error: self.statusBar().showMessage(f"Upgrading Library Failed: {error}"),
+                              lambda name: self.LibraryTab.MainModel.RefreshData_Async())
+
     def Launch_LibraryManagerApp(self, TabOpen: int = 0):
         """
         Launches the Library Manager app
@@ -77,6 +132,19 @@ class ApolloMain(ApolloUX):
         self.LibraryManagerApp.raise_()
         self.LibraryManagerApp.show()
 
+    def Launch_QueryReport(self):
+        """
+        Opens a debug window with the top statements by total time and the slow query log
+        """
+        self.QueryReport = QtWidgets.QPlainTextEdit()
+        self.QueryReport.setWindowTitle("Query Report")
+        self.QueryReport.setReadOnly(True)
+        self.QueryReport.setLineWrapMode(QtWidgets.QPlainTextEdit.NoWrap)
+        self.QueryReport.setFont(QtGui.QFontDatabase.systemFont(QtGui.QFontDatabase.FixedFont))
+        self.QueryReport.setPlainText(QueryProfiler.Report(20))
+        self.QueryReport.resize(1200, 600)
+        self.QueryReport.show()
+
     def HeaderActionsBinding(self, Index: int, Model: QtGui.QStandardItemModel, Header: QtWidgets.QHeaderView):
         """
         Creates all the actions and checkboxes for the related header section at given index
@@ -174,6 +242,8 @@ class ApolloMain(ApolloUX):
         """
         if hasattr(self, "LibraryManagerApp"):
             self.LibraryManagerApp.close()
+        if hasattr(self, "QueryReport"):
+            self.QueryReport.close()
 
     def closeEvent(self, event:QtGui.QCloseEvent):
         """
@@ -185,6 +255,11 @@ class ApolloMain(ApolloUX):
             Close Event when the tab is closed
         """
         self.closeSubTabs()
+        if hasattr(self, "LibraryWatcher"):
+            self.LibraryWatcher.Stop()
+        FileScanner_Thread.StopAll()
+        DataBaseWorker.Shutdown()
+        ConnectionPool.CloseAll()
 
 
 if __name__ == "__main__":
@@ -1,3 +1,4 @@
+import random
 import sys
 
 from PySide6 import QtWidgets, QtGui, QtCore, QtSql
@@ -35,14 +36,104 @@ class NowPlayingQueue(SQLTableModel):
         """
         return self.Data_atIndex(Rows = list(range(self.rowCount())), Columns = [Column])
 
-    def PlayNow(self, Indexes: [QtCore.QModelIndex]):
-        """"""
-        Indexes = self.Data_atIndex(Indexes = Indexes, Columns = [0])
-        self.DBManager.CreateView("nowplaying", Indexes)
+    def FileIDs_byField(self, Field: str, Values: list):
+        """
+        Gets the file_id of the library tracks whose field matches one of the values
+
+        Parameters
+        ----------
+        Field: str
+            library field to match
+        Values: list
+            values to match
+
+        Returns
+        -------
+        List
+            file_id of the matched tracks in library order
+        """
+        with self.DBManager.Selection(Values) as Selection:
+            return self.DBManager.exec_query(f"""
+            SELECT file_id
+            FROM library
+            WHERE {Field} IN (SELECT item FROM {Selection})
+            """, 1)
+
+    def PlayTracks(self, FileIDs: list):
+        """
+        Replaces the queue with the given tracks and reloads the model
+
+        Parameters
+        ----------
+        FileIDs: list
+            file_id of the tracks in queue order
+        """
+        self.DBManager.NowPlaying_Fill(FileIDs)
         self.RefreshData()
         self.PlayingQueue.RemoveElements()
         self.PlayingQueue.AddElements(self.Get_columnData(0))
 
+    def InsertTracks(self, Row: int, FileIDs: list):
+        """
+        Inserts tracks into the queue and only adds their rows to the model
+
+        Parameters
+        ----------
+        Row: int
+            row the first track is inserted at
+        FileIDs: list
+            file_id of the tracks in queue order
+        """
+        if len(FileIDs) == 0:
+            return None
+        Tracks = self.DBManager.BulkSelect("library", "file_id", FileIDs)
+        FileIDs = [Values[0] for Values in Tracks]
+
+        Row = min(Row, self.rowCount())
+        self.DBManager.NowPlaying_Insert(FileIDs, Row)
+        for Offset, Values in enumerate(Tracks):
+            self.insertRow(Row + Offset, self.CreateItems(Values))
+        self.PlayingQueue.AddElements(FileIDs, Index = Row)
+
+    def RemoveTracks(self, Rows: list):
+        """
+        Removes the tracks at the given rows from the queue and the model
+
+        Parameters
+        ----------
+        Rows: list
+            rows of the tracks to remove
+        """
+        Rows = sorted(set(Rows), reverse = True)
+        self.DBManager.NowPlaying_Remove(Rows)
+        for Row in Rows:
+            self.removeRow(Row)
+            if Row < len(self.PlayingQueue):
+                self.PlayingQueue.RemoveElements(Index = Row)
+
+    def MoveTracks(self, Rows: list, To: int):
+        """
+        Moves the tracks at the given rows in front of the row To
+
+        Parameters
+        ----------
+        Rows: list
+            rows of the tracks to move
+        To: int
+            row the tracks are placed before, rowCount moves them to the end
+        """
+        Rows = sorted(set(Rows))
+        Target = self.DBManager.NowPlaying_Move(Rows, To)
+        Items = [self.takeRow(Row) for Row in reversed(Rows)][::-1]
+        for Offset, Item in enumerate(Items):
+            self.insertRow(Target + Offset, Item)
+        self.PlayingQueue.RemoveElements()
+        self.PlayingQueue.AddElements(self.Get_columnData(0))
+
+    def PlayNow(self, Indexes: [QtCore.QModelIndex]):
+        """"""
+        self.PlayTracks(self.Data_atIndex(Indexes = Indexes, Columns = [0]))
+
     def PlayShuffled(self, Indexes: [QtCore.QModelIndex]):
         """
         Info: Gets selected indexes from View and adds Shuffled Data to model
@@ -54,10 +145,8 @@ class NowPlayingQueue(SQLTableModel):
         Errors: None
         """
         Indexes = self.Data_atIndex(Indexes = Indexes, Columns = [0])
-        self.DBManager.CreateView("nowplaying", Indexes, Shuffled = True)
-        self.RefreshData()
-        self.PlayingQueue.RemoveElements()
-        self.PlayingQueue.AddElements(self.Get_columnData(0))
+        random.shuffle(Indexes)
+        self.PlayTracks(Indexes)
 
     def PlayArtist(self, Indexes: [QtCore.QModelIndex]):
         """
@@ -70,10 +159,7 @@ class NowPlayingQueue(SQLTableModel):
         Errors: None
         """
         Indexes = self.Data_atIndex(Indexes = Indexes,Columns = [self.DB_FIELDS.index('artist')])
-        self.DBManager.CreateView("nowplaying", Indexes, FilterField  = 'artist', Filter = True)
-        self.RefreshData()
-        self.PlayingQueue.RemoveElements()
-        self.PlayingQueue.AddElements(self.Get_columnData(0))
+        self.PlayTracks(self.FileIDs_byField("artist", Indexes))
 
     def PlayAlbum(self, Indexes: [QtCore.QModelIndex]):
         """
@@ -86,10 +172,7 @@ class NowPlayingQueue(SQLTableModel):
         Errors: None
         """
         Indexes = self.Data_atIndex(Indexes = Indexes, Columns = [self.DB_FIELDS.index('album')])
-        self.DBManager.CreateView("nowplaying", Indexes, FilterField = 'album', Filter = True)
-        self.RefreshData()
-        self.PlayingQueue.RemoveElements()
-        self.PlayingQueue.AddElements(self.Get_columnData(0))
+        self.PlayTracks(self.FileIDs_byField("album", Indexes))
 
     def PlayGenre(self, Indexes: [QtCore.QModelIndex]):
         """
@@ -102,10 +185,7 @@ class NowPlayingQueue(SQLTableModel):
         Errors: None
         """
         Indexes = self.Data_atIndex(Indexes = Indexes, Columns = [self.DB_FIELDS.index('genre')])
-        self.DBManager.CreateView("nowplaying", Indexes, FilterField = 'genre', Filter = True)
-        self.RefreshData()
-        self.PlayingQueue.RemoveElements()
-        self.PlayingQueue.AddElements(self.Get_columnData(0))
+        self.PlayTracks(self.FileIDs_byField("genre", Indexes))
 
     def QueueNext(self, Indexes: [QtCore.QModelIndex]):
         """
@@ -118,10 +198,7 @@ class NowPlayingQueue(SQLTableModel):
         Errors: None
         """
         NewIndexes = self.Data_atIndex(Indexes = Indexes, Columns = [0])
-        self.PlayingQueue.AddNext(NewIndexes)
-        Indexes = self.PlayingQueue.GetQueue()
-        self.DBManager.CreateView("nowplaying", Indexes)
-        self.OrderTable(Indexes)
+        self.InsertTracks(self.PlayingQueue.GetPointer() + 1, NewIndexes)
 
     def QueueLast(self, Indexes: [QtCore.QModelIndex]):
         """
@@ -134,10 +211,7 @@ class NowPlayingQueue(SQLTableModel):
         Errors: None
         """
         NewIndexes = self.Data_atIndex(Indexes = Indexes, Columns = [0])
-        self.PlayingQueue.AddElements(NewIndexes)
-        Indexes = self.PlayingQueue.GetQueue()
-        self.DBManager.CreateView("nowplaying", Indexes)
-        self.OrderTable(Indexes)
+        self.InsertTracks(self.rowCount(), NewIndexes)
 
     def QueueAlbumNext(self, Indexes: [QtCore.QModelIndex]):
         """
@@ -150,17 +224,14 @@ class NowPlayingQueue(SQLTableModel):
         Errors: None
         """
         NewIndexes = self.Data_atIndex(Indexes = Indexes, Columns = [self.DB_FIELDS.index('album')])
-        NewIndexes = ", ".join([f"'{v}'" for v in NewIndexes])
-        NewIndexes = self.DBManager.exec_query(f"""
-        SELECT file_id
-        FROM library
-        WHERE album IN ({NewIndexes})
-        OR lower(album) IN ({NewIndexes})
-        """)
-        self.PlayingQueue.AddNext(NewIndexes)
-        Indexes = self.PlayingQueue.GetQueue()
-        self.DBManager.CreateView("nowplaying", Indexes)
-        self.OrderTable(Indexes)
+        with self.DBManager.Selection(NewIndexes) as Selection:
+            NewIndexes = self.DBManager.exec_query(f"""
+            SELECT file_id
+            FROM library
+            WHERE album IN (SELECT item FROM {Selection})
+            OR lower(album) IN (SELECT item FROM {Selection})
+            """, 1)
+        self.InsertTracks(self.PlayingQueue.GetPointer() + 1, NewIndexes)
 
     def QueueAlbumLast(self, Indexes: [QtCore.QModelIndex]):
         """
@@ -173,17 +244,14 @@ class NowPlayingQueue(SQLTableModel):
         Errors: None
         """
         NewIndexes = self.Data_atIndex(Indexes = Indexes, Columns = [self.DB_FIELDS.index('album')])
-        NewIndexes = ", ".join([f"'{v}'" for v in NewIndexes])
-        NewIndexes = self.DBManager.exec_query(f"""
-        SELECT file_id
-        FROM library
-        WHERE album IN ({NewIndexes})
-        OR lower(album) IN ({NewIndexes})
-        """)
-        self.PlayingQueue.AddElements(NewIndexes)
-        Indexes = self.PlayingQueue.GetQueue()
-        self.DBManager.CreateView("nowplaying", Indexes)
-        self.OrderTable(Indexes)
+        with self.DBManager.Selection(NewIndexes) as Selection:
+            NewIndexes = self.DBManager.exec_query(f"""
+            SELECT file_id
+            FROM library
+            WHERE album IN (SELECT item FROM {Selection})
+            OR lower(album) IN (SELECT item FROM {Selection})
+            """, 1)
+        self.InsertTracks(self.rowCount(), NewIndexes)
 
     def SearchModel(self, query: str, View: QtWidgets.QListView):
         """
@@ -196,25 +264,13 @@ class NowPlayingQueue(SQLTableModel):
         View: QtWidgets.QTableView
             View to apply mask to
         """
-        if query == "":
+        if query.strip() == "":
             for Row in range(self.rowCount()):
                 View.setRowHidden(Row, False)
             return None
 
-        for Row in range(self.rowCount()):
-            Query = []
-            for Col in ["album", "albumartist", "artist", "title"]:
-                Col = self.DB_FIELDS.index(Col)
-                data = self.index(Row, Col).data()
-                Query.append(data.find(query) != -1)
-                Query.append(data.find(query.upper()) != -1)
-                Query.append(data.find(query.lower()) != -1)
-                Query.append(data.find(query.title()) != -1)
-
-            if any(Query):
-                View.setRowHidden(Row, False)
-            else:
-                View.setRowHidden(Row, True)
+        for Row, Matched in enumerate(self.MatchedRows(query)):
+            View.setRowHidden(Row, not Matched)
 
 class NowPlaying_ItemDelegate(QtWidgets.QStyledItemDelegate):
     """
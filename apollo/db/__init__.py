@@ -1,3 +1,12 @@
-from .library_manager import DataBaseManager, FileManager, LibraryManager, Connection
+from .library_manager import DataBaseManager, FileManager, LibraryManager, Connection, ConnectionPool
+from .library_manager import LibraryStats
 from .library_manager import DBStructureError, QueryBuildFailed, QueryExecutionFailed
-from .library_manager import DBFIELDS
+from .library_manager import DBFIELDS, LIBRARY_INDEXES, LIBRARY_SEARCH_FIELDS
+from .library_manager import PRAGMA_PROFILES, DEFAULT_PRAGMA_PROFILE
+from .database_worker import DataBaseWorker
+from .library_watcher import LibraryWatcher
+from .scan_pipeline import ScanPipeline, Stage
+from .scan_jobs import ScanJob
+from .scan_progress import ScanProgress
+from .query_profiler import QueryProfiler
+from .migrations import MigrationRegistry, MIGRATIONS
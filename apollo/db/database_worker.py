@@ -0,0 +1,190 @@
+import itertools
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Callable, Union
+
+from PySide6 import QtCore
+
+from apollo.db.library_manager import ConnectionPool
+
+
+class DataBaseWorker(QtCore.QThread):
+    """
+    Runs database jobs on a single background thread so slow statements never block
+    painting or input on the GUI thread.
+
+    Jobs are callables, usually bound methods of a DataBaseManager, their queries use the
+    worker thread's pooled connection. Pending jobs are ordered by priority and then by
+    submission, so UI reads are picked before queued background writes. Every job returns
+    a Future, the optional slot gets the result on the thread that owns the worker.
+
+    A job submitted with a key supersedes the previous job with the same key, the old job
+    is cancelled if it has not started and its result is dropped if it has.
+
+    The exception of a failed job goes to its error callback, failures of jobs without one
+    are emitted through JobFailed so the app can show them.
+
+    >>> Worker = DataBaseWorker.Instance()
+    >>> Worker.Submit(Manager.TableStats, slot = print, key = "stats")
+    """
+    PRIORITY_READ = 0
+    PRIORITY_WRITE = 10
+    # stops the worker before any pending job is picked
+    PRIORITY_STOP = -1
+
+    JobFinished = QtCore.Signal(object)
+    JobFailed = QtCore.Signal(object, object)
+
+    _instance = None
+
+    def __init__(self, parent: Union[QtCore.QObject, None] = None):
+        """
+        Class Constructor
+
+        Parameters
+        ----------
+        parent: Union[QtCore.QObject, None], optional
+            parent object of the thread, by default None
+        """
+        super().__init__(parent)
+        self.setObjectName("DataBaseWorker")
+        self.Jobs = queue.PriorityQueue()
+        self.Counter = itertools.count()
+        self.Lock = threading.Lock()
+        self.Callbacks = {}
+        self.Keys = {}
+        # results are handed over to the thread that owns the worker through the event loop
+        self.JobFinished.connect(self.Dispatch, QtCore.Qt.QueuedConnection)
+
+    @classmethod
+    def Instance(cls):
+        """
+        Gets the shared worker, it is created and started on the first call
+
+        Returns
+        -------
+        DataBaseWorker
+            running worker shared by the app
+        """
+        if cls._instance is None:
+            cls._instance = cls()
+            cls._instance.start()
+        return cls._instance
+
+    @classmethod
+    def Shutdown(cls):
+        """
+        Stops the shared worker, should be called before the app closes its connections
+        """
+        if cls._instance is not None:
+            cls._instance.Stop()
+            cls._instance = None
+
+    def Submit(self, function: Callable, *args, priority: int = PRIORITY_READ,
+               slot: Union[Callable, None] = None, error: Union[Callable, None] = None,
+               key: Union[str, None] = None):
+        """
+        Queues a job on the worker
+
+        Parameters
+        ----------
+        function: Callable
+            job to run on the worker thread
+        args: Any
+            arguments passed to the job
+        priority: int, optional
+            lower values are run first, by default PRIORITY_READ
+        slot: Union[Callable, None], optional
+            called with the result of the job on the thread owning the worker
+        error: Union[Callable, None], optional
+            called with the exception raised by the job on the thread owning the worker
+        key: Union[str, None], optional
+            jobs with the same key supersede each other
+
+        Returns
+        -------
+        Future
+            future of the job, cancel it to drop the job if it has not started
+        """
+        future = Future()
+        with self.Lock:
+            if key is not None:
+                superseded = self.Keys.get(key)
+                if superseded is not None:
+                    superseded.cancel()
+                self.Keys[key] = future
+            self.Callbacks[future] = (slot, error, key)
+        self.Jobs.put((priority, next(self.Counter), future, function, args))
+        return future
+
+    def Stop(self, timeout: int = 30000):
+        """
+        Stops the worker after its running job, every pending job is cancelled
+
+        Parameters
+        ----------
+        timeout: int, optional
+            milliseconds to wait for the running job, by default 30000
+
+        Returns
+        -------
+        bool
+            True if the thread finished in time
+        """
+        if not self.isRunning():
+            return True
+        self.Jobs.put((self.PRIORITY_STOP, next(self.Counter), None, None, ()))
+        return self.wait(timeout)
+
+    def run(self):
+        """
+        Runs the queued jobs until the worker is stopped
+        """
+        try:
+            while True:
+                _, _, future, function, args = self.Jobs.get()
+                if future is None:
+                    break
+                if future.set_running_or_notify_cancel():
+                    try:
+                        future.set_result(function(*args))
+                    except BaseException as e:
+                        future.set_exception(e)
+                self.JobFinished.emit(future)
+        finally:
+            # connections are owned by this thread and have to be closed by it
+            ConnectionPool.CloseThread()
+            while not self.Jobs.empty():
+                _, _, future, _, _ = self.Jobs.get()
+                if future is not None:
+                    future.cancel()
+            with self.Lock:
+                self.Callbacks.clear()
+                self.Keys.clear()
+
+    def Dispatch(self, future: Future):
+        """
+        Hands a finished job to its callbacks, is run on the thread owning the worker
+
+        Parameters
+        ----------
+        future: Future
+            future of the finished job
+        """
+        with self.Lock:
+            slot, error, key = self.Callbacks.pop(future, (None, None, None))
+            superseded = (key is not None) and (self.Keys.get(key) is not future)
+            if key is not None and not superseded:
+                del self.Keys[key]
+
+        if future.cancelled() or superseded:
+            return None
+        exception = future.exception()
+        if exception is not None:
+            if error is not None:
+                error(exception)
+            else:
+                self.JobFailed.emit(future, exception)
+        elif slot is not None:
+            slot(future.result())
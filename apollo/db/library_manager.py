@@ -1,13 +1,21 @@
 import datetime
 import hashlib
+import itertools
 import os
-import random
-from typing import Callable, Union
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import BrokenExecutor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Iterable, Union
 
 from PySide6.QtSql import QSqlDatabase, QSqlQuery
 
 from apollo import exe_time, dedenter, PathUtils
 from apollo.plugins.audio_player import MediaFile
+from apollo.db.query_profiler import QueryProfiler
+from apollo.db.migrations import MIGRATIONS
+from apollo.db.scan_pipeline import ScanPipeline, Stage
 
 DBFIELDS = ("file_id", "path_id", "file_name", "file_path", "album",
             "albumartist", "artist", "author", "bpm", "compilation",
@@ -20,6 +28,56 @@ DBFIELDS = ("file_id", "path_id", "file_name", "file_path", "album",
             "frame_offset", "layer", "mode", "padding", "protected", "sample_rate",
             "track_gain", "track_peak", "rating", "playcount")
 
+# secondary indexes of the library table {index name: (table, (columns, ...))}
+LIBRARY_INDEXES = {
+    "library_artist_idx": ("library", ("artist",)),
+    "library_albumartist_idx": ("library", ("albumartist",)),
+    "library_album_idx": ("library", ("album",)),
+    "library_genre_idx": ("library", ("genre",)),
+    "library_date_idx": ("library", ("date",)),
+    "library_path_id_idx": ("library", ("path_id",)),
+    "library_rating_idx": ("library", ("rating",)),
+    "library_playcount_idx": ("library", ("playcount",)),
+    "library_album_disc_track_idx": ("library", ("album", "discnumber", "tracknumber"))
+}
+
+# fields of the library table covered by the full text search index
+LIBRARY_SEARCH_FIELDS = ("album", "albumartist", "artist", "title", "genre", "file_name")
+
+# named SQLite pragma profiles {profile name: {pragma: value}}, a monitored DB picks one in the
+# config and every pooled connection to it applies the profile when it opens
+PRAGMA_PROFILES = {
+    "interactive": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "temp_store": "MEMORY",
+        "cache_size": -65536,  # KiB, 64 MiB page cache
+        "mmap_size": 268435456,  # 256 MiB of memory mapped reads
+        "busy_timeout": 5000
+    },
+    "bulk-import": {
+        "journal_mode": "WAL",
+        "synchronous": "OFF",
+        "temp_store": "MEMORY",
+        "cache_size": -262144,
+        "mmap_size": 268435456,
+        "busy_timeout": 30000
+    },
+    "low-memory": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "temp_store": "FILE",
+        "cache_size": -2000,
+        "mmap_size": 0,
+        "busy_timeout": 5000
+    }
+}
+DEFAULT_PRAGMA_PROFILE = "interactive"
+# pragmas only set when a connection opens, changing temp_store drops the temp tables of the connection
+PRAGMA_OPEN_ONLY = ("journal_mode", "temp_store")
+# pragmas SQLite refuses to change inside an open transaction
+PRAGMA_NO_TRANSACTION = ("journal_mode", "synchronous")
+
 
 class DBStructureError(Exception):
     __module__ = "LibraryManager"
@@ -33,6 +91,323 @@ class QueryExecutionFailed(Exception):
     __module__ = "LibraryManager"
 
 
+class ConnectionPool:
+    """
+    Keeps a single long lived connection per database and thread.
+
+    QSqlDatabase connections can only be used from the thread that created them, so
+    the pool is keyed by (db_name, thread id). Connections are opened lazily on the
+    first query and reused by every later query of that thread.
+
+    Every connection also keeps a bounded LRU cache of prepared statements keyed by
+    the SQL text, so repeated queries skip SQLite's parse and plan step.
+
+    The pragma profile set for a DB is applied by each connection when it opens, a
+    profile changed later is picked up by the open connections on their next Acquire.
+
+    A connection is only ever closed by the thread that owns it. Closing a DB from
+    another thread marks its connections stale, the owner drops them on its next
+    Acquire or CloseThread.
+
+    >>> ConnectionPool.SetProfile("default.db", "low-memory")
+    >>> CON = ConnectionPool.Acquire("default.db")
+    >>> ConnectionPool.CloseThread()
+    """
+    STATEMENT_CACHE_SIZE = 64
+    _lock = threading.Lock()
+    _connections = {}
+    _statements = {}
+    _transactions = set()
+    _profiles = {}
+    _applied = {}
+    _stale = set()
+
+    @staticmethod
+    def Profile(profile: str = DEFAULT_PRAGMA_PROFILE, pragmas: Union[dict, None] = None):
+        """
+        Resolves a named pragma profile with its overrides
+
+        Parameters
+        ----------
+        profile: str
+            name of a profile in PRAGMA_PROFILES
+        pragmas: Union[dict, None], optional
+            {pragma: value} that override the values of the profile
+
+        Returns
+        -------
+        dict
+            {pragma: value} to apply
+
+        Raises
+        ------
+        ValueError
+            if the profile is not declared
+        """
+        if profile not in PRAGMA_PROFILES:
+            raise ValueError(f"Unknown pragma profile: {profile}")
+        return {**PRAGMA_PROFILES[profile], **(pragmas or {})}
+
+    @classmethod
+    def SetProfile(cls, db_name: str, profile: str = DEFAULT_PRAGMA_PROFILE, pragmas: Union[dict, None] = None):
+        """
+        Sets the pragma profile used by the connections to a DB
+
+        Parameters
+        ----------
+        db_name: str
+            path/name of the db
+        profile: str
+            name of a profile in PRAGMA_PROFILES
+        pragmas: Union[dict, None], optional
+            {pragma: value} that override the values of the profile
+        """
+        resolved = cls.Profile(profile, pragmas)
+        with cls._lock:
+            cls._profiles[db_name] = resolved
+
+    @classmethod
+    def ApplyPragmas(cls, db_driver: QSqlDatabase, pragmas: dict):
+        """
+        Sets the pragmas on a connection, the ones SQLite refuses inside a transaction
+        are skipped while the connection is in one
+
+        Parameters
+        ----------
+        db_driver: QSqlDatabase
+            pooled connection owned by the calling thread
+        pragmas: dict
+            {pragma: value} to set
+        """
+        in_transaction = db_driver.connectionName() in cls._transactions
+        query = QSqlQuery(db = db_driver)
+        for pragma, value in pragmas.items():
+            if in_transaction and pragma in PRAGMA_NO_TRANSACTION:
+                continue
+            query.exec(f"PRAGMA {pragma} = {value}")
+
+    @staticmethod
+    def ReadPragmas(db_driver: QSqlDatabase, pragmas: Union[list, tuple]):
+        """
+        Reads the current value of pragmas on a connection
+
+        Parameters
+        ----------
+        db_driver: QSqlDatabase
+            pooled connection owned by the calling thread
+        pragmas: Union[list, tuple]
+            names of the pragmas to read
+
+        Returns
+        -------
+        dict
+            {pragma: value}
+        """
+        values = {}
+        query = QSqlQuery(db = db_driver)
+        for pragma in pragmas:
+            if query.exec(f"PRAGMA {pragma}") and query.next():
+                values[pragma] = query.value(0)
+        return values
+
+    @staticmethod
+    def ConnectionName(db_name: str, thread_id: int):
+        """
+        Builds the unique Qt connection name for a DB and thread
+
+        Parameters
+        ----------
+        db_name: str
+            path/name of the db
+        thread_id: int
+            ident of the thread owning the connection
+
+        Returns
+        -------
+        str
+            connection name registered with QSqlDatabase
+        """
+        return f"apollo::{thread_id}::{db_name}"
+
+    @classmethod
+    def Acquire(cls, db_name: str):
+        """
+        Gets the open connection of the calling thread, opens one if needed
+
+        Parameters
+        ----------
+        db_name: str
+            path/name of the db to connect to
+
+        Returns
+        -------
+        QSqlDatabase
+            open connection owned by the calling thread
+
+        Raises
+        ------
+        ConnectionError
+            if the database fails to open
+        """
+        thread_id = threading.get_ident()
+        name = cls.ConnectionName(db_name, thread_id)
+        with cls._lock:
+            stale = name in cls._stale
+        if stale:
+            cls.Release(name)
+
+        with cls._lock:
+            profile = cls._profiles.get(db_name)
+            if profile is None:
+                profile = cls._profiles[db_name] = cls.Profile()
+
+            if name in cls._connections:
+                db_driver = QSqlDatabase.database(name, False)
+                if db_driver.isOpen() or db_driver.open():
+                    if cls._applied.get(name) is not profile:
+                        cls.ApplyPragmas(db_driver, {pragma: value for pragma, value in profile.items()
+                                                     if pragma not in PRAGMA_OPEN_ONLY})
+                        cls._applied[name] = profile
+                    return db_driver
+
+            db_driver = QSqlDatabase.addDatabase("QSQLITE", name)
+            db_driver.setDatabaseName(db_name)
+            if db_driver.open() and db_driver.isValid() and db_driver.isOpen():
+                cls._connections[name] = (db_name, thread_id)
+                cls.ApplyPragmas(db_driver, profile)
+                cls._applied[name] = profile
+                return db_driver
+            else:
+                del db_driver
+                QSqlDatabase.removeDatabase(name)
+                raise ConnectionError(db_name)
+
+    @classmethod
+    def Prepare(cls, db_driver: QSqlDatabase, query_str: str):
+        """
+        Gets the prepared statement for the SQL text from the connection cache,
+        prepares and caches a new one on a miss
+
+        Parameters
+        ----------
+        db_driver: QSqlDatabase
+            pooled connection owned by the calling thread
+        query_str: str
+            SQL text used as the cache key
+
+        Returns
+        -------
+        QSqlQuery
+            prepared forward only query ready for binding
+
+        Raises
+        ------
+        QueryBuildFailed
+            if SQLite fails to prepare the statement
+        """
+        cache = cls._statements.setdefault(db_driver.connectionName(), OrderedDict())
+        query = cache.get(query_str)
+        if query is not None:
+            cache.move_to_end(query_str)
+            return query
+
+        query = QSqlQuery(db = db_driver)
+        query.setForwardOnly(True)
+        if not query.prepare(query_str):
+            raise QueryBuildFailed(f"{str(db_driver)}\n{query_str}")
+
+        cache[query_str] = query
+        if len(cache) > cls.STATEMENT_CACHE_SIZE:
+            # the evicted statement is finalized with its last reference
+            cache.popitem(last = False)
+        return query
+
+    @classmethod
+    def Release(cls, name: str):
+        """
+        Closes and unregisters a single connection
+
+        Parameters
+        ----------
+        name: str
+            connection name to close
+        """
+        with cls._lock:
+            if cls._connections.pop(name, None) is None:
+                return None
+            # prepared statements have to be destroyed before the connection is removed
+            cls._statements.pop(name, None)
+            cls._transactions.discard(name)
+            cls._applied.pop(name, None)
+            cls._stale.discard(name)
+            db_driver = QSqlDatabase.database(name, False)
+            if db_driver.isOpen():
+                db_driver.close()
+            del db_driver
+            QSqlDatabase.removeDatabase(name)
+
+    @classmethod
+    def Close(cls, names: list):
+        """
+        Releases the connections owned by the calling thread and marks the ones of
+        other threads stale, as they can only be closed by their owner
+
+        Parameters
+        ----------
+        names: list
+            connection names to close
+        """
+        thread_id = threading.get_ident()
+        with cls._lock:
+            owned = [name for name in names if cls._connections.get(name, (None, None))[1] == thread_id]
+            cls._stale.update(name for name in names if name in cls._connections and name not in owned)
+        for name in owned:
+            cls.Release(name)
+
+    @classmethod
+    def CloseThread(cls, thread_id: Union[int, None] = None):
+        """
+        Closes all the connections owned by a thread, should be called by worker threads
+        before they exit
+
+        Parameters
+        ----------
+        thread_id: Union[int, None], optional
+            ident of the thread, by default the calling thread
+        """
+        if thread_id is None:
+            thread_id = threading.get_ident()
+        with cls._lock:
+            names = [name for name, (_, owner) in cls._connections.items() if owner == thread_id]
+        for name in names:
+            cls.Release(name)
+
+    @classmethod
+    def CloseDatabase(cls, db_name: str):
+        """
+        Closes all the connections to a DB, is used before a DB file is moved or deleted.
+        Connections of other threads are marked stale and closed by their owner.
+
+        Parameters
+        ----------
+        db_name: str
+            path/name of the db
+        """
+        with cls._lock:
+            names = [name for name, (owner_db, _) in cls._connections.items() if owner_db == db_name]
+        cls.Close(names)
+
+    @classmethod
+    def CloseAll(cls):
+        """
+        Closes every pooled connection, is called on application shutdown after the
+        worker threads have closed their own connections
+        """
+        with cls._lock:
+            names = list(cls._connections.keys())
+        cls.Close(names)
+
+
 class Connection:
     """
     class that manages all the connections to a DB and executes queries in a context manager
@@ -52,20 +427,17 @@ class Connection:
         self.autocommit = commit
 
     def __enter__(self):
-        self.db_driver = QSqlDatabase.addDatabase("QSQLITE", str(random.random()))
-        self.db_driver.setDatabaseName(self.DB)
-        if self.db_driver.open() and self.db_driver.isValid() and self.db_driver.isOpen():
-            return self.db_driver
-        else:
-            raise ConnectionError(self.DB)
+        self.db_driver = ConnectionPool.Acquire(self.DB)
+        return self.db_driver
 
     def __exit__(self, exc_type, exc_value, exc_traceback):
         if hasattr(self, "db_driver"):
-            self.db_driver.commit()
+            # queries inside a DataBaseManager.Transaction are committed by the transaction
+            if self.autocommit and self.db_driver.connectionName() not in ConnectionPool._transactions:
+                self.db_driver.commit()
             del self.db_driver
         if any([exc_type, exc_value, exc_traceback]):
             print(f"exc_type: {exc_type}\nexc_value: {exc_value}\nexc_traceback: {exc_traceback}")
-        QSqlDatabase.removeDatabase(str(random.random()))
 
     @staticmethod
     def connect(db_name: str):  # Tested
@@ -134,86 +506,42 @@ class DataBaseManager:
         else:  # pragma: no cover
             return True
 
-    def db_startup_checks(self):  # Tested
+    def db_startup_checks(self, force: bool = False):  # Tested
         """
-        Performs validation test for Table availability and structure.
-        Creates the table or the view if it doesnt exist.
+        Brings the schema of the DB up to date. The schema version is stored in
+        PRAGMA user_version so an up to date DB is validated with a single pragma read,
+        the pending migrations of MIGRATIONS are applied otherwise.
+
+        Parameters
+        ----------
+        force: bool, optional
+            applies every migration again to repair a damaged schema, by default False
 
         Returns
         -------
         Boolean
             Returns true if all checks are passed
-        """
-
-        # checks for existences of library table
-        [[TABLE, COLUMNS]] = self.exec_query("""
-            SELECT
-            (
-                SELECT
-                IIF(name = 'library', TRUE, FALSE)
-                FROM sqlite_master
-                WHERE type = 'table'
-            ) AS TABLE_CHECK,
-            (
-                SELECT
-                min(
-                    IIF( name IN(
-                        'file_id', 'path_id','file_name','file_path','album',
-                        'albumartist','artist','author','bpm','compilation',
-                        'composer','conductor','date','discnumber','discsubtitle',
-                        'encodedby','genre','language','length','filesize',
-                        'lyricist','media','mood','organization','originaldate',
-                        'performer','releasecountry','replaygain_gain','replaygain_peak',
-                        'title','tracknumber','version','website','album_gain',
-                        'bitrate','bitrate_mode','channels','encoder_info','encoder_settings',
-                        'frame_offset','layer','mode','padding','protected','sample_rate',
-                        'track_gain','track_peak', 'rating', 'playcount'), TRUE, FALSE
-                    )
-                )
-                FROM pragma_table_info('library')
-            ) AS COLUMN_CHECK;
-        """)
-        if not bool(TABLE) or not bool(COLUMNS):
-            self.Create_LibraryTable()
-
-        # checks for existences of nowplaying view
-        [[TABLE, COLUMNS]] = self.exec_query("""
-            SELECT
-            (
-                SELECT
-                IIF(name = 'nowplaying', TRUE, FALSE)
-                FROM sqlite_master
-                WHERE type = 'view'
-            ) AS TABLE_CHECK,
-            (
-                SELECT
-                min(
-                    IIF( name IN(
-                        'file_id', 'path_id','file_name','file_path','album',
-                        'albumartist','artist','author','bpm','compilation',
-                        'composer','conductor','date','discnumber','discsubtitle',
-                        'encodedby','genre','language','length','filesize',
-                        'lyricist','media','mood','organization','originaldate',
-                        'performer','releasecountry','replaygain_gain','replaygain_peak',
-                        'title','tracknumber','version','website','album_gain',
-                        'bitrate','bitrate_mode','channels','encoder_info','encoder_settings',
-                        'frame_offset','layer','mode','padding','protected','sample_rate',
-                        'track_gain','track_peak', 'rating', 'playcount'), TRUE, FALSE
-                    )
-                )
-                FROM pragma_table_info('nowplaying')
-            ) AS COLUMN_CHECK
-        """)
-        if not bool(TABLE) or not bool(COLUMNS):
-            self.Create_EmptyView("nowplaying")
 
+        Raises
+        ------
+        DBStructureError
+            if the DB has a newer schema
+        """
+        try:
+            MIGRATIONS.Upgrade(self, force)
+        except ValueError as e:
+            raise DBStructureError(str(e)) from e
         return True
 
-    def exec_query(self, query: str, column: Union[int, None] = None, commit: bool = True):  # Tested
+    def exec_query(self, query: str, column: Union[int, None] = None, commit: bool = True,
+                   params: Union[list, tuple, dict, None] = None):  # Tested
         """
-        Executes an QSqlQuery and returns the query to get results
+        Executes an QSqlQuery and returns the query to get results.
+        Statements are prepared once per connection and reused from the statement cache,
+        values passed in params are bound to the ? or :name placeholders of the query.
 
         >>> DataBaseManager.exec_query(query)
+        >>> DataBaseManager.exec_query("UPDATE library SET rating = ? WHERE file_id = ?", params = [5, ID])
 
         Parameters
         ----------
@@ -223,6 +551,8 @@ class DataBaseManager:
             count of columns to get data from
         commit: bool
             auto_commit flag
+        params: Union[list, tuple, dict, None], optional
+            values to bind to the placeholders, by default None
         Returns
         -------
         List
@@ -232,16 +562,15 @@ class DataBaseManager:
         with Connection(self.DB_NAME, commit) as CON:
             if isinstance(query, str):
                 query_str = query
-                query = QSqlQuery(db = CON)
-                if not query.prepare(query_str):
-                    connection_info = (str(CON))
-                    raise QueryBuildFailed(f"{connection_info}\n{query_str}")
+                query = ConnectionPool.Prepare(CON, query_str)
+                self.bind_values(query, params)
             else:
                 # if creating of the Query fails it raises an exception
                 connection_info = (str(CON))
                 raise QueryBuildFailed(f"{connection_info}")
 
             # executes the given query
+            started = time.perf_counter()
             query_executed = query.exec()
             if not query_executed:
                 connection_info = (str(CON))
@@ -253,7 +582,190 @@ class DataBaseManager:
                     """
                 raise QueryExecutionFailed(dedenter(msg, 12))
             else:
-                return self.fetch_all(query, column)
+                # every row is read so Qt has already reset the cached statement
+                data = self.fetch_all(query, column)
+                QueryProfiler.Record(query_str, (time.perf_counter() - started) * 1000,
+                                     len(data) or max(query.numRowsAffected(), 0),
+                                     lambda: self.ExplainPlan(query_str, params))
+                return data
+
+    def ExplainPlan(self, query: str, params: Union[list, tuple, dict, None] = None):
+        """
+        Gets the EXPLAIN QUERY PLAN of a statement on the calling thread's connection
+
+        >>> DataBaseManager.ExplainPlan("SELECT * FROM library WHERE artist = ?", ["Artist"])
+        ['SEARCH library USING INDEX library_artist_idx (artist=?)']
+
+        Parameters
+        ----------
+        query: str
+            statement to explain
+        params: Union[list, tuple, dict, None], optional
+            values to bind to the placeholders, by default None
+
+        Returns
+        -------
+        list
+            detail of every step of the plan, indented by its depth
+        """
+        with Connection(self.DB_NAME, False) as CON:
+            plan = QSqlQuery(db = CON)
+            if not plan.prepare(f"EXPLAIN QUERY PLAN {query}"):
+                return []
+            self.bind_values(plan, params)
+            if not plan.exec():
+                return []
+            depth = {0: -1}
+            details = []
+            while plan.next():
+                node, parent, detail = plan.value(0), plan.value(1), plan.value(3)
+                depth[node] = depth.get(parent, -1) + 1
+                details.append(f"{'  ' * depth[node]}{detail}")
+            return details
+
+    @contextmanager
+    def Transaction(self):
+        """
+        Runs every query of the block in a single transaction on the pooled connection
+        of the calling thread. The transaction is commited when the block exits and rolled
+        back if it raises, nested blocks join the outermost transaction.
+
+        >>> with DataBaseManager.Transaction():
+        ...     DataBaseManager.exec_query("DELETE FROM library WHERE file_id = ?", params = [ID])
+
+        Yields
+        ------
+        QSqlDatabase
+            connection that owns the transaction
+
+        Raises
+        ------
+        QueryExecutionFailed
+            if the transaction cant be started or commited
+        """
+        with Connection(self.DB_NAME, False) as CON:
+            name = CON.connectionName()
+            if name in ConnectionPool._transactions:
+                yield CON
+                return None
+
+            if not CON.transaction():
+                raise QueryExecutionFailed(f"ERROR: {CON.lastError().text()}")
+            ConnectionPool._transactions.add(name)
+            try:
+                yield CON
+            except BaseException:
+                ConnectionPool._transactions.discard(name)
+                CON.rollback()
+                raise
+            ConnectionPool._transactions.discard(name)
+            if not CON.commit():
+                msg = CON.lastError().text()
+                CON.rollback()
+                raise QueryExecutionFailed(f"ERROR: {msg}")
+
+    def SetProfile(self, profile: str = DEFAULT_PRAGMA_PROFILE, pragmas: Union[dict, None] = None):
+        """
+        Sets the pragma profile of the connected DB, every connection to it picks up the
+        profile on its next query
+
+        >>> DataBaseManager.SetProfile("low-memory", {"cache_size": -8192})
+
+        Parameters
+        ----------
+        profile: str
+            name of a profile in PRAGMA_PROFILES
+        pragmas: Union[dict, None], optional
+            {pragma: value} that override the values of the profile
+        """
+        ConnectionPool.SetProfile(self.DB_NAME, profile, pragmas)
+
+    def Pragmas(self, pragmas: Union[list, tuple] = tuple(PRAGMA_PROFILES[DEFAULT_PRAGMA_PROFILE].keys())):
+        """
+        Reads the current pragma values of the calling thread's connection
+
+        Parameters
+        ----------
+        pragmas: Union[list, tuple], optional
+            names of the pragmas to read, by default the pragmas of the profiles
+
+        Returns
+        -------
+        dict
+            {pragma: value}
+        """
+        return ConnectionPool.ReadPragmas(ConnectionPool.Acquire(self.DB_NAME), pragmas)
+
+    @contextmanager
+    def PragmaProfile(self, profile: str, pragmas: Union[dict, None] = None):
+        """
+        Switches the calling thread's connection to another pragma profile for the block
+        and restores the previous values when it exits, even if the block raises. Pragmas
+        that are only set when a connection opens are left as they are.
+
+        >>> with DataBaseManager.PragmaProfile("bulk-import"):
+        ...     DataBaseManager.BatchInsert_Metadata(metadata)
+
+        Parameters
+        ----------
+        profile: str
+            name of a profile in PRAGMA_PROFILES
+        pragmas: Union[dict, None], optional
+            {pragma: value} that override the values of the profile
+
+        Yields
+        ------
+        QSqlDatabase
+            connection running with the profile
+        """
+        switched = {pragma: value for pragma, value in ConnectionPool.Profile(profile, pragmas).items()
+                    if pragma not in PRAGMA_OPEN_ONLY}
+        CON = ConnectionPool.Acquire(self.DB_NAME)
+        previous = ConnectionPool.ReadPragmas(CON, tuple(switched.keys()))
+        ConnectionPool.ApplyPragmas(CON, switched)
+        try:
+            yield CON
+        finally:
+            ConnectionPool.ApplyPragmas(CON, previous)
+
+    @staticmethod
+    def bind_values(query: QSqlQuery, params: Union[list, tuple, dict, None] = None):
+        """
+        Binds values to the placeholders of a prepared query
+
+        Parameters
+        ----------
+        query: QSqlQuery
+            prepared query
+        params: Union[list, tuple, dict, None], optional
+            positional values for ? placeholders or a dict for :name placeholders
+        """
+        if params is None:
+            return None
+        if isinstance(params, dict):
+            for key, value in params.items():
+                query.bindValue(key if key.startswith(":") else f":{key}", value)
+        else:
+            for index, value in enumerate(params):
+                query.bindValue(index, value)
+
+    @staticmethod
+    def Quote(value):
+        """
+        Quotes a value as an SQL string literal, is only used where bound values are not
+        allowed by SQLite (view definitions)
+
+        Parameters
+        ----------
+        value: any
+            value to quote
+
+        Returns
+        -------
+        str
+            escaped literal
+        """
+        return "'{}'".format(str(value).replace("'", "''"))
 
     def fetch_all(self, query: QSqlQuery, column: Union[int, None] = None):  # Tested
         """
@@ -286,6 +798,87 @@ class DataBaseManager:
 
         return data
 
+    def stream_query(self, query: str, params: Union[list, tuple, dict, None] = None,
+                     batch_size: int = 1024, fields: Union[list, tuple, None] = None):
+        """
+        Executes a query and yields its result set in batches of rows, rows are read
+        with a forward only cursor so memory stays flat irrespective of the table size
+
+        >>> for Batch in DataBaseManager.stream_query("SELECT * FROM library", batch_size = 500):
+        ...     print(len(Batch))
+
+        Parameters
+        ----------
+        query: str
+            Query to execute
+        params: Union[list, tuple, dict, None], optional
+            values to bind to the placeholders, by default None
+        batch_size: int, optional
+            count of rows yielded at once, by default 1024
+        fields: Union[list, tuple, None], optional
+            names of the result columns to read, by default all the columns
+
+        Yields
+        ------
+        List
+            list of matrix of Row X Column with at most batch_size rows
+
+        Raises
+        ------
+        QueryBuildFailed
+            if the query cant be prepared or a field is not in the result set
+        QueryExecutionFailed
+            if the query fails to execute
+        """
+        with Connection(self.DB_NAME) as CON:
+            query_str = query
+            # streamed queries are not cached, a cached statement could be reset by a
+            # nested exec_query while this generator is suspended
+            query = QSqlQuery(db = CON)
+            query.setForwardOnly(True)
+            if not query.prepare(query_str):
+                raise QueryBuildFailed(f"{str(CON)}\n{query_str}")
+            self.bind_values(query, params)
+
+            started = time.perf_counter()
+            if not query.exec():
+                msg = f"""
+                    ERROR: {(query.lastError().text())}
+                    Query: {query.lastQuery()}
+                    """
+                raise QueryExecutionFailed(dedenter(msg, 20))
+
+            record = query.record()
+            if fields is None:
+                columns = list(range(record.count()))
+            else:
+                columns = [record.indexOf(field) for field in fields]
+                if -1 in columns:
+                    raise QueryBuildFailed(f"{fields}\n{query_str}")
+
+            # only the time spent reading rows is profiled, not the time the consumer holds a batch
+            elapsed = time.perf_counter() - started
+            rows = 0
+            try:
+                batch = []
+                resumed = time.perf_counter()
+                while query.next():
+                    batch.append([query.value(C) for C in columns])
+                    if len(batch) >= batch_size:
+                        elapsed += time.perf_counter() - resumed
+                        rows += len(batch)
+                        yield batch
+                        resumed = time.perf_counter()
+                        batch = []
+                elapsed += time.perf_counter() - resumed
+                rows += len(batch)
+                if batch:
+                    yield batch
+            finally:
+                QueryProfiler.Record(query_str, elapsed * 1000, rows, lambda: self.ExplainPlan(query_str, params))
+                # finalizes the statement when the consumer stops early
+                del query
+
     def Index_selector(self, view_name, Column):  # Tested
         """
         Gets Column Data from a Table and View
@@ -335,12 +928,19 @@ class DataBaseManager:
     # Create, Drop, Insert Functions
     ####################################################################################################################
 
-    def Create_LibraryTable(self):  # Tested
+    def Create_LibraryTable(self, tablename = "library"):  # Tested
         """
-        Creates the main Library table with yhe valid column fields
+        Creates the main Library table with yhe valid column fields.
+        length is stored in milliseconds, filesize in bytes, bitrate in bps and
+        sample_rate in Hz, formatting is done only when the values are displayed.
+
+        Parameters
+        ----------
+        tablename: String
+            Name of the table to create, by default library
         """
         return self.exec_query(f"""
-        CREATE TABLE IF NOT EXISTS library(
+        CREATE TABLE IF NOT EXISTS {tablename}(
         file_id TEXT PRIMARY KEY ON CONFLICT IGNORE,
         path_id TEXT,
         file_name TEXT,
@@ -359,8 +959,8 @@ class DataBaseManager:
         encodedby TEXT,
         genre TEXT,
         language TEXT,
-        length TEXT,
-        filesize TEXT,
+        length INTEGER,
+        filesize INTEGER,
         lyricist TEXT,
         media TEXT,
         mood TEXT,
@@ -375,7 +975,7 @@ class DataBaseManager:
         version TEXT,
         website TEXT,
         album_gain TEXT,
-        bitrate TEXT,
+        bitrate INTEGER,
         bitrate_mode TEXT,
         channels INTEGER,
         encoder_info TEXT,
@@ -385,7 +985,7 @@ class DataBaseManager:
         mode TEXT,
         padding TEXT,
         protected TEXT,
-        sample_rate TEXT,
+        sample_rate INTEGER,
         track_gain TEXT,
         track_peak TEXT,
         rating INTEGER,
@@ -430,7 +1030,7 @@ class DataBaseManager:
         self.DropView(view_name)
 
         # creates a a query string of items needed to be selected
-        FilterItems = ", ".join([f"'{value}'" for value in Selector])
+        FilterItems = ", ".join([self.Quote(value) for value in Selector])
 
         # sets the column used to look data from
         if kwargs.get("FilterField") == None:
@@ -440,7 +1040,7 @@ class DataBaseManager:
 
         # a list of all file ID used for indexing
         if kwargs.get("ID") != None and kwargs.get("Shuffled") == None:
-            ID = ", ".join([f"'{v}'" for v in kwargs.get("ID")])
+            ID = ", ".join([self.Quote(v) for v in kwargs.get("ID")])
             self.exec_query(f"""
             CREATE VIEW IF NOT EXISTS {view_name} AS
             SELECT *
@@ -472,6 +1072,88 @@ class DataBaseManager:
             IN ({FilterItems})
             """)
 
+    def Create_Indexes(self, indexes: Union[dict, None] = None):
+        """
+        Creates the declared indexes that are missing or whose columns dont match
+        the declaration
+
+        Parameters
+        ----------
+        indexes: Union[dict, None], optional
+            {index name: (table, (columns, ...))}, by default LIBRARY_INDEXES
+
+        Returns
+        -------
+        List
+            names of the indexes that were created
+        """
+        if indexes is None:
+            indexes = LIBRARY_INDEXES
+
+        existing = dict(self.exec_query("""
+        SELECT name, (
+            SELECT group_concat(name)
+            FROM (SELECT name FROM pragma_index_info(sqlite_master.name) ORDER BY seqno)
+        )
+        FROM sqlite_master
+        WHERE type = 'index' AND sql NOTNULL
+        """))
+
+        created = []
+        for name, (table, columns) in indexes.items():
+            if existing.get(name) == ",".join(columns):
+                continue
+            if name in existing:
+                self.DropIndex(name)
+            self.AddIndex(name, table, columns)
+            created.append(name)
+        return created
+
+    def AddIndex(self, name: str, table: str, columns: Union[list, tuple], unique: bool = False):
+        """
+        Creates an index on the given columns of a table
+
+        >>> library_manager.AddIndex("library_title_idx", "library", ["title"])
+
+        Parameters
+        ----------
+        name: str
+            name of the index
+        table: str
+            table to index
+        columns: Union[list, tuple]
+            columns in index order
+        unique: bool, optional
+            creates an unique index, by default False
+        """
+        unique = "UNIQUE" if unique else ""
+        self.exec_query(f"CREATE {unique} INDEX IF NOT EXISTS {name} ON {table}({', '.join(columns)})")
+
+    def DropIndex(self, name: str):
+        """
+        Drops the index from the database
+
+        Parameters
+        ----------
+        name: str
+            name of the index to drop
+        """
+        self.exec_query(f"DROP INDEX IF EXISTS {name}")
+
+    def Analyze(self, tablename: Union[str, None] = None):
+        """
+        Runs ANALYZE so the query planner has the statistics of the indexes
+
+        Parameters
+        ----------
+        tablename: Union[str, None], optional
+            table to analyze, by default the complete database
+        """
+        if tablename is None:
+            self.exec_query("ANALYZE")
+        else:
+            self.exec_query(f"ANALYZE {tablename}")
+
     def DropTable(self, tablename):
         """
         Drops the table from the database
@@ -496,61 +1178,918 @@ class DataBaseManager:
         """
         self.exec_query(f"DROP VIEW IF EXISTS {viewname}")
 
-    def BatchInsert_Metadata(self, metadata):
+    # rows bound per execBatch call, Qt copies the bound column lists for every row of a batch
+    # so the cost of a single batch grows with the square of its size
+    BATCH_CHUNK = 32
+
+    def BatchInsert_Metadata(self, metadata, tablename = "library", conflict = "IGNORE"):
         """
-        Batch Inserts data into library table
+        Batch Inserts data into library table, the rows are bound in chunks of BATCH_CHUNK
+        to a single prepared statement inside one transaction. The pragmas of the connection
+        are left as they are, bulk loads like Ingest switch to the bulk-import profile themselves.
 
         Parameters
         ----------
         metadata: Dict
             Distonary of all the combined metadata
+        tablename: String
+            Name of the table to insert into, by default library
+        conflict: String
+            conflict resolution of the insert (IGNORE or REPLACE), by default IGNORE
         """
-        with Connection(self.DB_NAME) as CON:
-            # sets up the transcation
-            CON.transaction()
-            QSqlQuery("PRAGMA journal_mode = MEMORY", db = CON).exec()
-
+        with self.Transaction() as CON:
             columns = ", ".join(metadata.keys())
             placeholders = ", ".join(["?" for i in metadata.keys()])
-            query = QSqlQuery(f"INSERT OR IGNORE INTO library ({columns}) VALUES ({placeholders})", db = CON)
-            for keys in metadata.keys():
-                query.addBindValue(metadata.get(keys))
-
-            if not query.execBatch():  # pragma: no cover
-                msg = f"""
-                    ERROR: {(query.lastError().text())}
-                    Query: {query.lastQuery()}
-                    """
-                del CON
-                raise QueryExecutionFailed(dedenter(msg, 12))
-
-            QSqlQuery("PRAGMA journal_mode = WAL", db = CON).exec()
-            CON.commit()
-            del CON
+            query = QSqlQuery(db = CON)
+            if not query.prepare(f"INSERT OR {conflict} INTO {tablename} ({columns}) VALUES ({placeholders})"):
+                raise QueryBuildFailed(f"{str(CON)}\n{query.lastError().text()}")
+
+            values = [list(metadata.get(keys)) for keys in metadata.keys()]
+            rows = len(values[0]) if values else 0
+            started = time.perf_counter()
+            for start in range(0, rows, self.BATCH_CHUNK):
+                for column in values:
+                    query.addBindValue(column[start: start + self.BATCH_CHUNK])
+
+                if not query.execBatch():  # pragma: no cover
+                    msg = f"""
+                        ERROR: {(query.lastError().text())}
+                        Query: {query.lastQuery()}
+                        """
+                    raise QueryExecutionFailed(dedenter(msg, 24))
+            QueryProfiler.Record(query.lastQuery(), (time.perf_counter() - started) * 1000, rows)
 
     ###################################################################################################################
-    # Table Stats Query
+    # Bulk Selection
     ###################################################################################################################
 
-    def TableSize(self, tablename="library"):
+    @contextmanager
+    def Selection(self, keys: Union[list, tuple], name: str = "selection"):
         """
-        Calculates the total size in Gigabytes of all the files monitered.
-        Returns the Gigabyte as a Float.
+        Loads the keys into a temp table of the calling thread's connection in a single batch,
+        so queries can join against them instead of a literal IN list that is limited by
+        SQLite's variable count and statement length. The block runs in a transaction and
+        the temp table is emptied when it exits.
+
+        >>> with DataBaseManager.Selection(file_ids) as Selection:
+        ...     DataBaseManager.exec_query(f"DELETE FROM library WHERE file_id IN (SELECT item FROM {Selection})")
+
+        Parameters
+        ----------
+        keys: Union[list, tuple]
+            keys to select, the order and duplicates are kept in the seq column
+        name: str, optional
+            name of the temp table, nested selections need different names, by default selection
+
+        Yields
+        ------
+        str
+            qualified name of the temp table with the columns (seq, item)
+        """
+        table = f"temp.{name}"
+        with self.Transaction():
+            self.exec_query(f"CREATE TEMP TABLE IF NOT EXISTS {name}(seq INTEGER PRIMARY KEY, item)")
+            self.exec_query(f"DELETE FROM {table}")
+            if len(keys) != 0:
+                self.BatchInsert_Metadata({"item": list(keys)}, table)
+            try:
+                yield table
+            finally:
+                self.exec_query(f"DELETE FROM {table}")
+
+    def BulkDelete(self, tablename: str, field: str, keys: Union[list, tuple]):
+        """
+        Deletes the rows of a table whose field matches one of the keys
+
+        Parameters
+        ----------
+        tablename: str
+            table to delete from
+        field: str
+            field matched against the keys
+        keys: Union[list, tuple]
+            keys of the rows to delete
+
+        Returns
+        -------
+        List
+            keys of the deleted rows
+        """
+        with self.Selection(keys) as Selection:
+            deleted = self.exec_query(f"SELECT {field} FROM {tablename} WHERE {field} IN (SELECT item FROM {Selection})", 1)
+            self.exec_query(f"DELETE FROM {tablename} WHERE {field} IN (SELECT item FROM {Selection})")
+        return deleted
+
+    def BulkUpdate(self, tablename: str, field: str, keys: Union[list, tuple], values: dict):
+        """
+        Updates the rows of a table whose field matches one of the keys
+
+        >>> DataBaseManager.BulkUpdate("library", "file_id", file_ids, {"rating": 5})
+
+        Parameters
+        ----------
+        tablename: str
+            table to update
+        field: str
+            field matched against the keys
+        keys: Union[list, tuple]
+            keys of the rows to update
+        values: dict
+            {column: value} to set
+
+        Returns
+        -------
+        List
+            keys of the updated rows
+        """
+        columns = ", ".join([f"{column} = ?" for column in values.keys()])
+        with self.Selection(keys) as Selection:
+            updated = self.exec_query(f"SELECT {field} FROM {tablename} WHERE {field} IN (SELECT item FROM {Selection})", 1)
+            self.exec_query(f"UPDATE {tablename} SET {columns} WHERE {field} IN (SELECT item FROM {Selection})",
+                            params = list(values.values()))
+        return updated
+
+    def BulkSelect(self, tablename: str, field: str, keys: Union[list, tuple], columns: str = "*"):
+        """
+        Selects the rows of a table whose field matches one of the keys
+
+        Parameters
+        ----------
+        tablename: str
+            table or view to select from
+        field: str
+            field matched against the keys
+        keys: Union[list, tuple]
+            keys of the rows to select
+        columns: str, optional
+            columns to select, by default all
+
+        Returns
+        -------
+        List
+            list of matrix of Row X Column in the order of the keys, a key selected more
+            than once returns its rows again
+        """
+        if columns == "*":
+            columns = f"{tablename}.*"
+        with self.Selection(keys) as Selection:
+            return self.exec_query(f"""
+            SELECT {columns}
+            FROM {Selection} AS selection
+            JOIN {tablename} ON {tablename}.{field} = selection.item
+            ORDER BY selection.seq
+            """)
+
+    ###################################################################################################################
+    # Now Playing Queue
+    ###################################################################################################################
+
+    # gap left between the positions of neighbouring queue rows
+    QUEUE_STEP = 1024
+
+    def Create_NowPlaying(self):
+        """
+        Creates the nowplaying_queue table that stores the queue as (position, file_id) rows
+        and the nowplaying view that joins it to the library in queue order. Tracks deleted
+        from the library are removed from the queue by a trigger, the rows of a legacy
+        nowplaying view are copied into an empty queue.
+        """
+        [sql] = self.exec_query("""
+        SELECT IFNULL((SELECT sql FROM sqlite_master WHERE type = 'view' AND name = 'nowplaying'), '')
+        """, 1)
+        with self.Transaction():
+            self.exec_query("""
+            CREATE TABLE IF NOT EXISTS nowplaying_queue(
+                position INTEGER PRIMARY KEY,
+                file_id TEXT NOT NULL
+            )""")
+            self.exec_query("CREATE INDEX IF NOT EXISTS nowplaying_queue_file_id_idx ON nowplaying_queue (file_id)")
+            self.exec_query("""
+            CREATE TRIGGER IF NOT EXISTS nowplaying_queue_delete AFTER DELETE ON library
+            BEGIN
+                DELETE FROM nowplaying_queue WHERE file_id = OLD.file_id;
+            END""")
+            if "nowplaying_queue" in sql:
+                return None
+
+            if sql != "" and self.exec_query("SELECT EXISTS(SELECT 1 FROM nowplaying_queue)", 1) == [0]:
+                self.exec_query(f"""
+                INSERT INTO nowplaying_queue (position, file_id)
+                SELECT row_number() OVER () * {self.QUEUE_STEP}, file_id
+                FROM nowplaying
+                WHERE file_id IN (SELECT file_id FROM library)
+                """)
+            self.DropView("nowplaying")
+            self.exec_query("""
+            CREATE VIEW nowplaying AS
+            SELECT library.*
+            FROM nowplaying_queue
+            JOIN library ON library.file_id = nowplaying_queue.file_id
+            ORDER BY nowplaying_queue.position
+            """)
+
+    def NowPlaying_Positions(self, Indexes: list):
+        """
+        Gets the positions of the queue rows at the given indexes
+
+        Parameters
+        ----------
+        Indexes: list
+            0 based indexes of the rows in queue order
+
+        Returns
+        -------
+        List
+            [index, position, file_id] of every index that is in the queue, in the order of Indexes
+        """
+        if len(Indexes) == 0:
+            return []
+        with self.Selection(Indexes) as Selection:
+            rows = self.exec_query(f"""
+            SELECT idx, position, file_id
+            FROM (
+                SELECT row_number() OVER (ORDER BY position) - 1 AS idx, position, file_id
+                FROM nowplaying_queue
+            )
+            WHERE idx IN (SELECT item FROM {Selection})
+            """)
+        lookup = {Row[0]: Row for Row in rows}
+        return [lookup[index] for index in Indexes if index in lookup]
+
+    def NowPlaying_Neighbours(self, index: Union[int, None] = None):
+        """
+        Gets the positions between which rows inserted at an index are placed
+
+        Parameters
+        ----------
+        index: Union[int, None], optional
+            0 based index of the first inserted row, by default the end of the queue
+
+        Returns
+        -------
+        Tuple
+            (previous position or 0, next position or None when appending)
+        """
+        if index is not None and index >= 0:
+            rows = self.exec_query("SELECT position FROM nowplaying_queue ORDER BY position LIMIT 2 OFFSET ?", 1,
+                                   params = [max(index - 1, 0)])
+            if index == 0:
+                return (0, rows[0] if rows else None)
+            if len(rows) == 2:
+                return (rows[0], rows[1])
+        [last] = self.exec_query("SELECT IFNULL(max(position), 0) FROM nowplaying_queue", 1)
+        return (last, None)
+
+    def NowPlaying_InsertBetween(self, file_ids: list, previous: int, following: Union[int, None]):
+        """
+        Inserts the tracks between two queue positions. The tracks are spread over the gap
+        between the positions, when the gap is too small only the rows from the following
+        position onwards are shifted to open it up.
+
+        Parameters
+        ----------
+        file_ids: list
+            file_id of the tracks in queue order
+        previous: int
+            position of the row before the tracks, 0 at the start of the queue
+        following: Union[int, None]
+            position of the row after the tracks, None when appending
+
+        Returns
+        -------
+        List
+            positions of the inserted tracks
+        """
+        count = len(file_ids)
+        if count == 0:
+            return []
+
+        with self.Transaction():
+            if following is None:
+                step = self.QUEUE_STEP
+            else:
+                if following - previous <= count:
+                    # positions are negated first so the shift never collides with a row that
+                    # still has to be moved
+                    shift = (count + 1) * self.QUEUE_STEP
+                    self.exec_query("UPDATE nowplaying_queue SET position = -position WHERE position >= ?",
+                                    params = [following])
+                    self.exec_query("UPDATE nowplaying_queue SET position = ? - position WHERE position < 0",
+                                    params = [shift])
+                    following += shift
+                step = (following - previous) // (count + 1)
+
+            positions = [previous + (step * offset) for offset in range(1, count + 1)]
+            self.BatchInsert_Metadata({"position": positions, "file_id": list(file_ids)}, "nowplaying_queue")
+        return positions
+
+    def NowPlaying_Insert(self, file_ids: list, index: Union[int, None] = None):
+        """
+        Inserts tracks into the now playing queue, only the inserted rows are written
+        unless the gap at the index has run out
+
+        >>> DataBaseManager.NowPlaying_Insert(["file_id"], index = 5)
+
+        Parameters
+        ----------
+        file_ids: list
+            file_id of the tracks in queue order
+        index: Union[int, None], optional
+            0 based index the first track is placed at, by default appended to the queue
+
+        Returns
+        -------
+        List
+            positions of the inserted tracks
+        """
+        with self.Transaction():
+            return self.NowPlaying_InsertBetween(file_ids, *self.NowPlaying_Neighbours(index))
+
+    def NowPlaying_Remove(self, Indexes: list):
+        """
+        Removes the rows at the given indexes from the now playing queue
+
+        Parameters
+        ----------
+        Indexes: list
+            0 based indexes of the rows in queue order
+        """
+        with self.Transaction():
+            positions = [position for _, position, _ in self.NowPlaying_Positions(Indexes)]
+            if positions:
+                self.BulkDelete("nowplaying_queue", "position", positions)
+
+    def NowPlaying_Move(self, Indexes: list, To: int):
+        """
+        Moves the rows at the given indexes in front of the row at index To,
+        only the moved rows are rewritten
+
+        Parameters
+        ----------
+        Indexes: list
+            0 based indexes of the rows to move
+        To: int
+            index of the row the moved rows are placed before, the length of the queue moves
+            them to the end
+
+        Returns
+        -------
+        int
+            index of the first moved row after the move
+        """
+        with self.Transaction():
+            rows = self.NowPlaying_Positions(sorted(set(Indexes)))
+            self.NowPlaying_Remove([index for index, _, _ in rows])
+            target = To - len([index for index, _, _ in rows if index < To])
+            self.NowPlaying_Insert([file_id for _, _, file_id in rows], target)
+        return target
+
+    def NowPlaying_Fill(self, file_ids: list):
+        """
+        Replaces the whole now playing queue
+
+        Parameters
+        ----------
+        file_ids: list
+            file_id of the tracks in queue order
+        """
+        with self.Transaction():
+            self.exec_query("DELETE FROM nowplaying_queue")
+            self.NowPlaying_InsertBetween(file_ids, 0, None)
+
+    ###################################################################################################################
+    # File Fingerprints
+    ###################################################################################################################
+
+    FINGERPRINT_FIELDS = ("path", "size", "mtime_ns", "inode", "file_id")
+
+    def Create_Fingerprints(self):
+        """
+        Creates the file_fingerprints table that keeps the (size, mtime_ns, inode) of every
+        scanned path and the file_id it was stored as, so a rescan can skip unchanged files
+        after a single stat. Fingerprints of tracks deleted from the library are removed by
+        a trigger so the files are picked up again by the next scan.
+        """
+        with self.Transaction():
+            self.exec_query("""
+            CREATE TABLE IF NOT EXISTS file_fingerprints(
+                path TEXT PRIMARY KEY,
+                size INTEGER,
+                mtime_ns INTEGER,
+                inode INTEGER,
+                file_id TEXT
+            ) WITHOUT ROWID""")
+            self.exec_query("CREATE INDEX IF NOT EXISTS file_fingerprints_file_id_idx ON file_fingerprints (file_id)")
+            self.exec_query("""
+            CREATE TRIGGER IF NOT EXISTS file_fingerprints_delete AFTER DELETE ON library
+            BEGIN
+                DELETE FROM file_fingerprints WHERE file_id = OLD.file_id;
+            END""")
+
+    def Load_Fingerprints(self, Dir: Union[str, None] = None):
+        """
+        Loads the fingerprints into memory for the scan lookups
+
+        Parameters
+        ----------
+        Dir: Union[str, None], optional
+            only loads the fingerprints of the files below the directory, by default all of them
+
+        Returns
+        -------
+        Dict
+            {path: (size, mtime_ns, inode, file_id)}
+        """
+        query = "SELECT path, size, mtime_ns, inode, file_id FROM file_fingerprints"
+        params = None
+        if Dir is not None:
+            query += " WHERE path >= ? AND path < ?"
+            params = list(self.PathRange(Dir))
+        Fingerprints = {}
+        for Batch in self.stream_query(query, batch_size = 4096, params = params):
+            for path, size, mtime_ns, inode, file_id in Batch:
+                Fingerprints[path] = (size, mtime_ns, inode, file_id)
+        return Fingerprints
+
+    @staticmethod
+    def PathRange(Dir: str):
+        """
+        Bounds of the paths below a directory, so they can be selected with a range scan
+        over the path index instead of a LIKE pattern
+
+        Parameters
+        ----------
+        Dir: str
+            path of the directory
+
+        Returns
+        -------
+        tuple
+            (lower bound, upper bound) with the upper bound excluded
+        """
+        lower = os.path.join(os.path.normpath(Dir), "")
+        return lower, lower[:-1] + chr(ord(lower[-1]) + 1)
+
+    def Save_Fingerprints(self, Fingerprints: list):
+        """
+        Inserts or replaces fingerprints
+
+        Parameters
+        ----------
+        Fingerprints: list
+            rows of (path, size, mtime_ns, inode, file_id)
+        """
+        if Fingerprints:
+            columns = {field: [Row[index] for Row in Fingerprints] for index, field in enumerate(self.FINGERPRINT_FIELDS)}
+            self.BatchInsert_Metadata(columns, "file_fingerprints", "REPLACE")
+
+    SCAN_ERROR_FIELDS = ("path", "size", "mtime_ns", "error", "message")
+
+    def Create_ScanErrors(self):
+        """
+        Creates the scan_errors table that keeps the files which failed to be read with their
+        (size, mtime_ns) and the error, scans skip them until the file changes
+        """
+        self.exec_query("""
+        CREATE TABLE IF NOT EXISTS scan_errors(
+            path TEXT PRIMARY KEY,
+            size INTEGER,
+            mtime_ns INTEGER,
+            error TEXT,
+            message TEXT,
+            failed TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        ) WITHOUT ROWID""")
+
+    def Load_ScanErrors(self, Dir: Union[str, None] = None):
+        """
+        Loads the quarantined files into memory for the scan lookups
+
+        Parameters
+        ----------
+        Dir: Union[str, None], optional
+            only loads the files below the directory, by default all of them
+
+        Returns
+        -------
+        Dict
+            {path: (size, mtime_ns)}
+        """
+        query = "SELECT path, size, mtime_ns FROM scan_errors"
+        params = None
+        if Dir is not None:
+            query += " WHERE path >= ? AND path < ?"
+            params = list(self.PathRange(Dir))
+        return {path: (size, mtime_ns) for path, size, mtime_ns in self.exec_query(query, params = params)}
+
+    def Save_ScanErrors(self, Errors: list):
+        """
+        Inserts or replaces quarantined files
+
+        Parameters
+        ----------
+        Errors: list
+            rows of (path, size, mtime_ns, error, message)
+        """
+        if Errors:
+            columns = {field: [Row[index] for Row in Errors] for index, field in enumerate(self.SCAN_ERROR_FIELDS)}
+            self.BatchInsert_Metadata(columns, "scan_errors", "REPLACE")
+
+    def ScanErrors(self, Dir: Union[str, None] = None):
+        """
+        Lists the files that failed to be read by the scans
+
+        Parameters
+        ----------
+        Dir: Union[str, None], optional
+            only lists the files below the directory, by default all of them
+
+        Returns
+        -------
+        List
+            rows of (path, size, mtime_ns, error, message, failed) sorted by path
+        """
+        query = "SELECT path, size, mtime_ns, error, message, failed FROM scan_errors"
+        params = None
+        if Dir is not None:
+            query += " WHERE path >= ? AND path < ?"
+            params = list(self.PathRange(Dir))
+        return self.exec_query(query + " ORDER BY path", params = params)
+
+    def Create_ScanJobs(self):
+        """
+        Creates the scan_jobs table that keeps the position of every scan, the directory being
+        scanned and the last file commited in it, so an interrupted scan resumes where it stopped.
+        Directories scanned together keep their last files in cursors.
+        """
+        self.exec_query("""
+        CREATE TABLE IF NOT EXISTS scan_jobs(
+            job_id INTEGER PRIMARY KEY,
+            state TEXT NOT NULL DEFAULT 'running',
+            dirs TEXT NOT NULL,
+            include TEXT NOT NULL,
+            dir_index INTEGER NOT NULL DEFAULT 0,
+            cursor TEXT,
+            cursors TEXT,
+            chunks INTEGER NOT NULL DEFAULT 0,
+            files INTEGER NOT NULL DEFAULT 0,
+            created TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            updated TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )""")
+
+    ###################################################################################################################
+    # Schema Migration
+    ###################################################################################################################
+
+    NUMERIC_FIELDS = ("length", "filesize", "bitrate", "sample_rate")
+
+    def LibrarySchema_Outdated(self):
+        """
+        Checks if the library table still uses the formatted text columns
+
+        Returns
+        -------
+        Boolean
+            True if any of the numeric fields is not declared as an INTEGER
+        """
+        fields = ", ".join([self.Quote(field) for field in self.NUMERIC_FIELDS])
+        types = self.exec_query(f"""
+        SELECT upper(type)
+        FROM pragma_table_info('library')
+        WHERE name IN ({fields})
+        """, 1)
+        return any([T != "INTEGER" for T in types])
+
+    def Prepare_NumericSchema(self):
+        """
+        Creates the shadow table of Migrate_NumericSchema and the triggers that mark the
+        library rows updated or deleted while the copy runs, these rows are copied again
+        by the swap. Is cheap and run at startup, the copy itself runs in the background.
+        """
+        self.Create_LibraryTable("library_migrate")
+        self.exec_query("CREATE TABLE IF NOT EXISTS library_migrate_dirty(row INTEGER PRIMARY KEY)")
+        for event in ("UPDATE", "DELETE"):
+            self.exec_query(f"""
+            CREATE TRIGGER IF NOT EXISTS library_migrate_{event.lower()} AFTER {event} ON library
+            BEGIN
+                INSERT OR IGNORE INTO library_migrate_dirty(row) VALUES (OLD.rowid);
+            END
+            """)
+
+    def Copy_LegacyRows(self, rows: list):
+        """
+        Converts rows of the text library table and inserts them into the shadow table
+
+        Parameters
+        ----------
+        rows: list
+            rows with the rowid followed by the db_fields
+        """
+        metadata = {"rowid": [Row[0] for Row in rows]}
+        for index, field in enumerate(self.db_fields, 1):
+            parser = self.LegacyParsers.get(field)
+            if parser is None:
+                metadata[field] = [Row[index] for Row in rows]
+            else:
+                metadata[field] = [parser(Row[index]) for Row in rows]
+        self.BatchInsert_Metadata(metadata, "library_migrate")
+
+    def Migrate_NumericSchema(self, chunk_size: int = 2000, Slot: Callable = lambda x: '',
+                              chunks: Union[int, None] = None):
+        """
+        Converts a library table with formatted text columns to the numeric schema.
+        Rows are copied chunk by chunk into a shadow table each in its own transaction,
+        the library table stays usable until the final swap and an interrupted
+        migration resumes from the last copied rowid. Rows written during the copy are
+        caught up by the swap, which also recreates the indexes and triggers of the library.
+
+        Parameters
+        ----------
+        chunk_size: int, optional
+            count of rows converted per transaction, by default 2000
+        Slot: Callable, optional
+            Additional Callback with (arg: str) prameter, by default lambda:''
+        chunks: Union[int, None], optional
+            max count of chunks copied by the call, by default every chunk
+
+        Returns
+        -------
+        Boolean
+            True once the tables are swapped, False if chunks are left to copy
+        """
+        self.Prepare_NumericSchema()
+        [total] = self.exec_query("SELECT count(*) FROM library", 1)
+
+        copied = 0
+        while chunks is None or copied < chunks:
+            [cursor] = self.exec_query("SELECT IFNULL(max(rowid), 0) FROM library_migrate", 1)
+            rows = self.exec_query(f"""
+            SELECT rowid, {", ".join(self.db_fields)}
+            FROM library
+            WHERE rowid > ?
+            ORDER BY rowid
+            LIMIT ?
+            """, params = [cursor, chunk_size])
+            if rows == []:
+                break
+            with self.Transaction():
+                self.Copy_LegacyRows(rows)
+            copied += 1
+            Slot(f"Migrating Library {len(rows) + cursor}/{total}")
+        else:
+            return False
+
+        # views are dropped for the swap so SQLite doesnt validate them against a missing table,
+        # the indexes and triggers are dropped with the library table and created again
+        views = self.exec_query("SELECT name, sql FROM sqlite_master WHERE type = 'view'")
+        objects = self.exec_query("""
+        SELECT sql FROM sqlite_master
+        WHERE tbl_name = 'library' AND type IN ('index', 'trigger') AND sql NOT NULL AND name NOT LIKE 'library_migrate%'
+        """, 1)
+        with self.Transaction() as CON:
+            [cursor] = self.exec_query("SELECT IFNULL(max(rowid), 0) FROM library_migrate", 1)
+            self.exec_query("DELETE FROM library_migrate WHERE rowid IN (SELECT row FROM library_migrate_dirty)")
+            rows = self.exec_query(f"""
+            SELECT rowid, {", ".join(self.db_fields)}
+            FROM library
+            WHERE rowid > ? OR rowid IN (SELECT row FROM library_migrate_dirty)
+            """, params = [cursor])
+            if rows != []:
+                self.Copy_LegacyRows(rows)
+
+            statements = [f"DROP VIEW IF EXISTS {name}" for name, _ in views]
+            statements.extend(["DROP TABLE library", "DROP TABLE library_migrate_dirty",
+                               "ALTER TABLE library_migrate RENAME TO library"])
+            statements.extend([sql for _, sql in views])
+            statements.extend(objects)
+            for statement in statements:
+                query = QSqlQuery(db = CON)
+                if not query.exec(statement):
+                    msg = f"""
+                        ERROR: {(query.lastError().text())}
+                        Query: {statement}
+                        """
+                    raise QueryExecutionFailed(dedenter(msg, 24))
+            if self.exec_query("SELECT EXISTS(SELECT 1 FROM sqlite_master WHERE name = 'library_stats')", 1) == [1]:
+                LibraryStats(self).Rebuild()
+        Slot("Migrating Library Completed")
+        return True
+
+    @staticmethod
+    def ParseLegacy_Length(value):
+        """
+        Parses a timedelta string (H:MM:SS.ffffff or N days, H:MM:SS) into milliseconds,
+        plain digits were written in milliseconds by the new code and are kept as they are
+        """
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return int(value)
+        if str(value).strip().isdigit():
+            return int(str(value).strip())
+        try:
+            days = 0
+            value = str(value).strip()
+            if "day" in value:
+                days, value = value.split(",")
+                days = int(days.split()[0])
+            hours, minutes, seconds = value.strip().split(":")
+            seconds = (days * 86400) + (int(hours) * 3600) + (int(minutes) * 60) + float(seconds)
+            return int(round(seconds * 1000))
+        except ValueError:
+            return None
+
+    @staticmethod
+    def ParseLegacy_Number(value, scale: float = 1):
+        """
+        Parses the number prefix of a formatted string ("12.3 Mb", "320 Kbps", "44100Hz") and scales it,
+        plain digits were written in the base unit by the new code and are not scaled
+        """
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return int(value)
+        if str(value).strip().isdigit():
+            return int(str(value).strip())
+        number = ""
+        for char in str(value).strip():
+            if not (char.isdigit() or char == "."):
+                break
+            number += char
+        try:
+            return int(round(float(number) * scale))
+        except ValueError:
+            return None
+
+    @property
+    def LegacyParsers(self):
+        """
+        Parsers that convert the legacy formatted columns into numeric values
+        """
+        return {
+            "length": self.ParseLegacy_Length,
+            "filesize": lambda value: self.ParseLegacy_Number(value, 1048576),
+            "bitrate": lambda value: self.ParseLegacy_Number(value, 1000),
+            "sample_rate": self.ParseLegacy_Number
+        }
+
+    ###################################################################################################################
+    # Full Text Search
+    ###################################################################################################################
+
+    def Create_SearchIndex(self):
+        """
+        Creates the library_fts full text index over the LIBRARY_SEARCH_FIELDS of the library table.
+        The index is an external content FTS5 table that stores only the tokens and is kept in sync
+        by triggers, it is rebuilt from the library table whenever the table or a trigger was missing.
+
+        Returns
+        -------
+        Boolean
+            True if the index was (re)built
+        """
+        names = ("library_fts", "library_fts_insert", "library_fts_update", "library_fts_delete")
+        [count] = self.exec_query(f"""
+        SELECT count(*)
+        FROM sqlite_master
+        WHERE name IN ({", ".join([self.Quote(name) for name in names])})
+        """, 1)
+        if count == len(names):
+            return False
+
+        fields = ", ".join(LIBRARY_SEARCH_FIELDS)
+        new = ", ".join([f"NEW.{field}" for field in LIBRARY_SEARCH_FIELDS])
+        old = ", ".join([f"OLD.{field}" for field in LIBRARY_SEARCH_FIELDS])
+        statements = [
+            # the library table was replaced, the old index and triggers are recreated from scratch
+            *[f"DROP TRIGGER IF EXISTS {name}" for name in names[1:]],
+            "DROP TABLE IF EXISTS library_fts",
+            f"""
+            CREATE VIRTUAL TABLE library_fts USING fts5(
+                {fields},
+                content = 'library',
+                content_rowid = 'rowid',
+                tokenize = 'unicode61 remove_diacritics 2',
+                prefix = '2 3'
+            )""",
+            f"""
+            CREATE TRIGGER library_fts_insert AFTER INSERT ON library
+            BEGIN
+                INSERT INTO library_fts (rowid, {fields}) VALUES (NEW.rowid, {new});
+            END""",
+            f"""
+            CREATE TRIGGER library_fts_delete AFTER DELETE ON library
+            BEGIN
+                INSERT INTO library_fts (library_fts, rowid, {fields}) VALUES ('delete', OLD.rowid, {old});
+            END""",
+            f"""
+            CREATE TRIGGER library_fts_update AFTER UPDATE OF {fields} ON library
+            BEGIN
+                INSERT INTO library_fts (library_fts, rowid, {fields}) VALUES ('delete', OLD.rowid, {old});
+                INSERT INTO library_fts (rowid, {fields}) VALUES (NEW.rowid, {new});
+            END""",
+            "INSERT INTO library_fts (library_fts) VALUES ('rebuild')"
+        ]
+        with self.Transaction():
+            for statement in statements:
+                self.exec_query(statement)
+        return True
+
+    @staticmethod
+    def SearchExpression(text: str):
+        """
+        Converts the text typed by the user into an FTS5 query, every word is quoted so
+        FTS5 operators and punctuation are matched literally, and is matched as a prefix
+
+        >>> DataBaseManager.SearchExpression("rock n roll")
+        '"rock"* "n"* "roll"*'
+
+        Parameters
+        ----------
+        text: str
+            text to search for
+
+        Returns
+        -------
+        str
+            MATCH expression, empty if the text has no words
+        """
+        words = ['"{}"*'.format(word.replace('"', '""')) for word in str(text).split()]
+        return " ".join(words)
+
+    def SearchLibrary(self, text: str, limit: Union[int, None] = None):
+        """
+        Searches the album, albumartist, artist, title, genre and file_name of the library,
+        matching is case and diacritic insensitive and every word matches as a prefix
+
+        >>> DataBaseManager.SearchLibrary("beat abbey")
+
+        Parameters
+        ----------
+        text: str
+            text to search for
+        limit: Union[int, None], optional
+            max count of results, by default all the matches
+
+        Returns
+        -------
+        List
+            file_id of the matched tracks ranked by relevance
+        """
+        expression = self.SearchExpression(text)
+        if expression == "":
+            return []
+
+        return self.exec_query(f"""
+        SELECT library.file_id
+        FROM library_fts
+        JOIN library ON library.rowid = library_fts.rowid
+        WHERE library_fts MATCH ?
+        ORDER BY library_fts.rank
+        LIMIT ?
+        """, 1, params = [expression, -1 if limit is None else limit])
+
+    ###################################################################################################################
+    # Table Stats Query
+    ###################################################################################################################
+
+    def Create_LibraryStats(self):
+        """
+        Creates the trigger maintained library statistics, rebuilds them if they are missing
+
+        Returns
+        -------
+        Boolean
+            True if the stats were rebuilt
+        """
+        return LibraryStats(self).Check()
+
+    def TableStats(self):
+        """
+        Reads the trigger maintained stats of the library table in a single row lookup,
+        see LibraryStats.Fetch for the returned keys
+
+        Returns
+        -------
+        Dict
+            stats of the library table
+        """
+        return LibraryStats(self).Fetch()
+
+    def TableSize(self, tablename="library"):
+        """
+        Calculates the total size in Gigabytes of all the files monitered.
+        Returns the Gigabyte as a Float.
 
         Parameters
         ----------
         tablename: String
             Name of the table or view to be queried
         """
-        query = (self.exec_query(f"""
+        [query] = (self.exec_query(f"""
         SELECT IIF(OUTPUT, OUTPUT, 0) AS FINAL
         FROM (
-            SELECT round(sum(filesize)/1024, 2) AS OUTPUT
+            SELECT round(sum(filesize)/1073741824.0, 2) AS OUTPUT
             FROM {tablename}
             )
-        """)
-                 )
-        return query.pop().pop()
+        """, 1)
+                   )
+        return query
 
     def TablePlaycount(self, tablename="library"):
         """
@@ -561,15 +2100,15 @@ class DataBaseManager:
         tablename: String
             Name of the table or view to be queried
         """
-        query = (self.exec_query(f"""
+        [query] = (self.exec_query(f"""
         SELECT IIF(OUTPUT, OUTPUT, 0) AS FINAL
         FROM (
             SELECT sum(playcount) AS OUTPUT
             FROM {tablename}
             )
-        """)
-                 )
-        return query.pop().pop()
+        """, 1)
+                   )
+        return query
 
     def TablePlaytime(self, tablename="library"):
         """
@@ -581,16 +2120,15 @@ class DataBaseManager:
         tablename: String
             Name of the table or view to be queried
         """
-        query = (self.exec_query(f"""
+        [query] = (self.exec_query(f"""
         SELECT IIF(TIME_SEC, TIME_SEC, 0) AS FINAL
         FROM (
-            SELECT (sum(substr(length,1,1))*360 + sum(substr(length,3,2))*60 + sum(substr(length,6,2)))
-            AS TIME_SEC
+            SELECT sum(length)/1000 AS TIME_SEC
             FROM {tablename}
             )
-        """)
-                 )
-        return datetime.timedelta(seconds=query.pop().pop())
+        """, 1)
+                   )
+        return datetime.timedelta(seconds=query)
 
     def TableAlbumcount(self, tablename="library"):
         """
@@ -602,15 +2140,15 @@ class DataBaseManager:
         tablename: String
             Name of the table or view to be queried
         """
-        query = (self.exec_query(f"""
+        [query] = (self.exec_query(f"""
         SELECT IIF(OUTPUT, OUTPUT, 0) AS FINAL
         FROM (
             SELECT count(DISTINCT album) AS OUTPUT
             FROM {tablename}
             )
-        """)
-                 )
-        return query.pop().pop()
+        """, 1)
+                   )
+        return query
 
     def TableArtistcount(self, tablename="library"):
         """
@@ -622,15 +2160,15 @@ class DataBaseManager:
         tablename: String
             Name of the table or view to be queried
         """
-        query = (self.exec_query(f"""
+        [query] = (self.exec_query(f"""
         SELECT IIF(OUTPUT, OUTPUT, 0) AS FINAL
         FROM (
             SELECT count(DISTINCT artist) AS OUTPUT
             FROM {tablename}
             )
-        """)
-                 )
-        return query.pop().pop()
+        """, 1)
+                   )
+        return query
 
     def TableTrackcount(self, tablename="library"):
         """
@@ -642,15 +2180,15 @@ class DataBaseManager:
         tablename: String
             Name of the table or view to be queried
         """
-        query = (self.exec_query(f"""
+        [query] = (self.exec_query(f"""
         SELECT IIF(OUTPUT, OUTPUT, 0) AS FINAL
         FROM (
             SELECT count(DISTINCT file_id) AS OUTPUT
             FROM {tablename}
             )
-        """)
-                 )
-        return query.pop().pop()
+        """, 1)
+                   )
+        return query
 
     def TopAlbum(self, Tablename="library"):
         """
@@ -668,10 +2206,10 @@ class DataBaseManager:
         GROUP BY album
         ORDER BY COUNT(playcount) DESC
         LIMIT 1;
-        """)
+        """, 1)
                  )
         if query != []:
-            return query.pop().pop()
+            return query[0]
         else:
             return ""
 
@@ -691,10 +2229,10 @@ class DataBaseManager:
         GROUP BY genre
         ORDER BY COUNT(playcount) DESC
         LIMIT 1;
-        """)
+        """, 1)
                  )
         if query != []:
-            return query.pop().pop()
+            return query[0]
         else:
             return ""
 
@@ -714,10 +2252,10 @@ class DataBaseManager:
         GROUP BY artist
         ORDER BY COUNT(playcount) DESC
         LIMIT 1;
-        """)
+        """, 1)
                  )
         if query != []:
-            return query.pop().pop()
+            return query[0]
         else:
             return ""
 
@@ -738,14 +2276,316 @@ class DataBaseManager:
             FROM {Tablename}
         )
         LIMIT 1
-        """)
+        """, 1)
                  )
         if query != []:
-            return query.pop().pop()
+            return query[0]
         else:
             return ""
 
 
+class LibraryStats:
+    """
+    Library statistics that are calculated once and then kept up to date by triggers.
+
+    The totals are kept in the single row of the library_stats table and the track count
+    of every artist, album and genre in the library_stats_groups table. Triggers on the
+    library table apply every insert, update and delete as a delta, so reading the stats
+    is a single row lookup instead of an aggregate over the whole library.
+
+    >>> LibraryStats(LibraryManager("default.db")).Fetch()["tracks"]
+    """
+    # grouped field: column of library_stats holding its distinct count
+    GROUPS = {"artist": "artists", "album": "albums", "genre": "genres"}
+    # library field: column of library_stats holding its sum
+    TOTALS = {"length": "playtime", "filesize": "filesize", "playcount": "playcount"}
+    TRIGGERS = ("library_stats_insert", "library_stats_update", "library_stats_delete")
+
+    def __init__(self, Manager: DataBaseManager):
+        """
+        Class Constructor
+
+        Parameters
+        ----------
+        Manager: DataBaseManager
+            manager connected to the DB that holds the library
+        """
+        self.Manager = Manager
+
+    def Check(self):
+        """
+        Creates the stats tables and triggers if any of them is missing and rebuilds the stats,
+        stats without their triggers (the library table was replaced) cant be trusted anymore
+
+        Returns
+        -------
+        Boolean
+            True if the stats were rebuilt
+        """
+        names = ("library_stats", "library_stats_groups", *self.TRIGGERS)
+        [count] = self.Manager.exec_query(f"""
+        SELECT count(*)
+        FROM sqlite_master
+        WHERE name IN ({", ".join([self.Manager.Quote(name) for name in names])})
+        """, 1)
+        if count == len(names):
+            return False
+        self.Create()
+        self.Rebuild()
+        return True
+
+    def Create(self):
+        """
+        Creates the stats tables and the triggers on the library table
+        """
+        counters = ", ".join([f"{column} INTEGER NOT NULL DEFAULT 0"
+                              for column in ["tracks", *self.TOTALS.values(), *self.GROUPS.values()]])
+        fields = ", ".join([*self.GROUPS, *self.TOTALS])
+        statements = [
+            f"""
+            CREATE TABLE IF NOT EXISTS library_stats(
+                id INTEGER PRIMARY KEY CHECK (id = 0),
+                {counters}
+            )""",
+            """
+            CREATE TABLE IF NOT EXISTS library_stats_groups(
+                field TEXT NOT NULL,
+                value TEXT NOT NULL,
+                tracks INTEGER NOT NULL,
+                PRIMARY KEY (field, value)
+            ) WITHOUT ROWID""",
+            """
+            CREATE INDEX IF NOT EXISTS library_stats_groups_tracks_idx
+            ON library_stats_groups (field, tracks)""",
+            "INSERT OR IGNORE INTO library_stats (id) VALUES (0)",
+            f"""
+            CREATE TRIGGER IF NOT EXISTS library_stats_insert AFTER INSERT ON library
+            BEGIN
+                {self.TotalsDelta(["NEW"], [], 1)}
+                {self.GroupsAdd("NEW")}
+            END""",
+            f"""
+            CREATE TRIGGER IF NOT EXISTS library_stats_delete AFTER DELETE ON library
+            BEGIN
+                {self.TotalsDelta([], ["OLD"], -1)}
+                {self.GroupsRemove("OLD")}
+            END""",
+            f"""
+            CREATE TRIGGER IF NOT EXISTS library_stats_update AFTER UPDATE OF {fields} ON library
+            BEGIN
+                {self.TotalsDelta(["NEW"], ["OLD"], 0)}
+                {self.GroupsRemove("OLD", True)}
+                {self.GroupsAdd("NEW", True)}
+            END"""
+        ]
+        with self.Manager.Transaction():
+            for statement in statements:
+                self.Manager.exec_query(statement)
+
+    def TotalsDelta(self, added: list, removed: list, tracks: int):
+        """
+        Builds the trigger statement that applies a row change to the totals
+
+        Parameters
+        ----------
+        added: list
+            row aliases (NEW) whose values are added
+        removed: list
+            row aliases (OLD) whose values are subtracted
+        tracks: int
+            change of the track count
+
+        Returns
+        -------
+        str
+            UPDATE statement for the trigger body
+        """
+        sets = [f"tracks = tracks + ({tracks})"]
+        for field, column in self.TOTALS.items():
+            delta = "".join([f" + IFNULL({row}.{field}, 0)" for row in added])
+            delta += "".join([f" - IFNULL({row}.{field}, 0)" for row in removed])
+            sets.append(f"{column} = {column}{delta}")
+        return f"UPDATE library_stats SET {', '.join(sets)} WHERE id = 0;"
+
+    def GroupsAdd(self, row: str, changed: bool = False):
+        """
+        Builds the trigger statements that count a row into its groups,
+        a group seen for the first time increments the distinct count
+
+        Parameters
+        ----------
+        row: str
+            row alias (NEW)
+        changed: bool, optional
+            only counts the fields whose value changed, by default False
+
+        Returns
+        -------
+        str
+            statements for the trigger body
+        """
+        statements = []
+        for field, counter in self.GROUPS.items():
+            value = f"IFNULL({row}.{field}, '')"
+            guard = f"OLD.{field} IS NOT NEW.{field}" if changed else "TRUE"
+            statements.append(f"""
+                INSERT INTO library_stats_groups (field, value, tracks)
+                SELECT '{field}', {value}, 1 WHERE {guard}
+                ON CONFLICT (field, value) DO UPDATE SET tracks = tracks + 1;
+                UPDATE library_stats SET {counter} = {counter} + 1
+                WHERE {guard} AND (
+                    SELECT tracks FROM library_stats_groups WHERE field = '{field}' AND value = {value}
+                ) = 1;""")
+        return "".join(statements)
+
+    def GroupsRemove(self, row: str, changed: bool = False):
+        """
+        Builds the trigger statements that count a row out of its groups,
+        an emptied group is deleted and decrements the distinct count
+
+        Parameters
+        ----------
+        row: str
+            row alias (OLD)
+        changed: bool, optional
+            only counts the fields whose value changed, by default False
+
+        Returns
+        -------
+        str
+            statements for the trigger body
+        """
+        statements = []
+        for field, counter in self.GROUPS.items():
+            value = f"IFNULL({row}.{field}, '')"
+            guard = f"OLD.{field} IS NOT NEW.{field}" if changed else "TRUE"
+            statements.append(f"""
+                UPDATE library_stats_groups SET tracks = tracks - 1
+                WHERE {guard} AND field = '{field}' AND value = {value};
+                UPDATE library_stats SET {counter} = {counter} - 1
+                WHERE {guard} AND (
+                    SELECT tracks FROM library_stats_groups WHERE field = '{field}' AND value = {value}
+                ) = 0;
+                DELETE FROM library_stats_groups
+                WHERE field = '{field}' AND value = {value} AND tracks <= 0;""")
+        return "".join(statements)
+
+    @staticmethod
+    def Number(value):
+        """
+        Converts a column value to a number the way SQLite's sum() does, non numeric values are 0
+        """
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return value
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            try:
+                return float(value)
+            except (TypeError, ValueError):
+                return 0
+
+    def Rebuild(self):
+        """
+        Recalculates all the stats from the library table in a single streamed pass
+        """
+        fields = [*self.GROUPS, *self.TOTALS]
+        totals = dict.fromkeys(["tracks", *self.TOTALS.values()], 0)
+        groups = {field: Counter() for field in self.GROUPS}
+
+        with self.Manager.Transaction():
+            for Batch in self.Manager.stream_query(f"SELECT {', '.join(fields)} FROM library"):
+                totals["tracks"] += len(Batch)
+                for Row in Batch:
+                    values = dict(zip(fields, Row))
+                    for field, counter in groups.items():
+                        counter["" if values[field] is None else str(values[field])] += 1
+                    for field, column in self.TOTALS.items():
+                        totals[column] += self.Number(values[field])
+
+            for field, counter in self.GROUPS.items():
+                totals[counter] = len(groups[field])
+            columns = ", ".join(totals.keys())
+            placeholders = ", ".join(["?" for _ in totals])
+            self.Manager.exec_query("DELETE FROM library_stats_groups")
+            self.Manager.exec_query(f"INSERT OR REPLACE INTO library_stats (id, {columns}) VALUES (0, {placeholders})",
+                                    params = list(totals.values()))
+
+            metadata = {"field": [], "value": [], "tracks": []}
+            for field, counter in groups.items():
+                for value, tracks in counter.items():
+                    metadata["field"].append(field)
+                    metadata["value"].append(value)
+                    metadata["tracks"].append(tracks)
+            if metadata["field"]:
+                self.Manager.BatchInsert_Metadata(metadata, "library_stats_groups")
+
+    def Fetch(self):
+        """
+        Reads all the stats of the library
+
+        Returns
+        -------
+        Dict
+            tracks, artists, albums, genres, playcount: int, playtime: datetime.timedelta,
+            size: float in Gigabytes, top_artist, top_album, top_genre, top_track: str
+        """
+        self.Check()
+
+        def Top(field):
+            return f"""
+            IFNULL((
+                SELECT value FROM library_stats_groups
+                WHERE field = '{field}' AND value NOT IN ('', ' ')
+                ORDER BY tracks DESC
+                LIMIT 1
+            ), '')"""
+
+        [Row] = self.Manager.exec_query(f"""
+        SELECT
+            tracks, artists, albums, genres, playcount, playtime, filesize,
+            {Top("artist")}, {Top("album")}, {Top("genre")},
+            IFNULL((
+                SELECT title FROM library
+                WHERE playcount NOTNULL
+                ORDER BY playcount DESC
+                LIMIT 1
+            ), '')
+        FROM library_stats
+        WHERE id = 0
+        """)
+        tracks, artists, albums, genres, playcount, playtime, filesize, artist, album, genre, track = Row
+        return {
+            "tracks": tracks, "artists": artists, "albums": albums, "genres": genres, "playcount": playcount,
+            "playtime": datetime.timedelta(seconds = int(playtime) // 1000),
+            "size": round(filesize / 1073741824, 2),
+            "top_artist": artist, "top_album": album, "top_genre": genre, "top_track": track
+        }
+
+
+def ParseFile_Worker(Manager, file: str):
+    """
+    Parses a file in a worker process of a parallel scan, the error of a broken file
+    is returned in place of its metadata so it doesnt fail the rest of the chunk
+
+    Parameters
+    ----------
+    Manager : FileManager
+        manager whose ParseFile is used
+    file : str
+        path of the file
+
+    Returns
+    -------
+    Union[list, Exception]
+        metadata of the file in DBFIELDS order or the error raised by ParseFile
+    """
+    try:
+        return Manager.ParseFile(file)
+    except Exception as error:
+        return error
+
+
 class FileManager(DataBaseManager):  # pragma: no cover
     """
     File manager classes manages:
@@ -758,6 +2598,24 @@ class FileManager(DataBaseManager):  # pragma: no cover
     -> m4a
     """
 
+    # scanned rows are committed in chunks bounded by both their count and their estimated size
+    INGEST_CHUNK_ROWS = 500
+    INGEST_CHUNK_BYTES = 8 * 1024 * 1024
+    # worker processes parsing the metadata of scanned files, 0 or 1 parses them serially
+    SCAN_WORKERS = 0
+    # threads of the scan pipeline stages and the capacity of their queues
+    SCAN_STAGES = {"filter": 1, "fingerprint": 1, "hash": 2, "parse": 2}
+    SCAN_QUEUE_SIZE = 256
+    # files per worker process the parse stage of a parallel scan maps over the pool at once
+    SCAN_PARSE_BATCH = 16
+    # max threads of a disk reading stage per device when directories on several devices are scanned together
+    SCAN_DEVICE_THREADS = 2
+    # key of the content ids, separates them from plain blake2b digests of the same bytes
+    FILE_ID_KEY = b"apollo.file_id.v1"
+    # threads checking the files of a prune, a NAS answers the stats of many files at once
+    PRUNE_WORKERS = 8
+    PRUNE_BATCH = 2000
+
     def __init__(self):
         """
         Class Constructor
@@ -783,65 +2641,746 @@ class FileManager(DataBaseManager):  # pragma: no cover
             T_metadata[key] = [value[index] for value in Metadata]
         return T_metadata
 
+    @staticmethod
+    def RowSize(Row: list):
+        """
+        Estimates the memory held by a row of metadata, strings are counted by their length
+        and every other value as 8 bytes
+
+        Parameters
+        ----------
+        Row: list
+            values of a row
+
+        Returns
+        -------
+        int
+            estimated size in bytes
+        """
+        return sum([len(value) if isinstance(value, (str, bytes)) else 8 for value in Row])
+
+    def Ingest(self, Rows: Iterable[list], chunk_rows: Union[int, None] = None,
+               chunk_bytes: Union[int, None] = None, tablename: str = "library",
+               Slot: Callable = lambda x: '', Committed: Union[Callable, None] = None,
+               Before: Union[Callable, None] = None):
+        """
+        Inserts rows of metadata in DBFIELDS order as they are produced. Rows are committed
+        in chunks, each in its own transaction, whenever the chunk reaches chunk_rows rows or
+        chunk_bytes estimated bytes, so memory stays flat irrespective of the count of rows
+        and the inserted tracks show up in the library while the rest is still read.
+
+        >>> FileManager.Ingest(FileManager.ScanFiles("D:\\music", ["MP3"]))
+
+        Parameters
+        ----------
+        Rows: Iterable[list]
+            rows of metadata in DBFIELDS order
+        chunk_rows: Union[int, None], optional
+            max count of rows per chunk, by default INGEST_CHUNK_ROWS
+        chunk_bytes: Union[int, None], optional
+            max estimated size of a chunk, by default INGEST_CHUNK_BYTES
+        tablename: str, optional
+            Name of the table to insert into, by default library
+        Slot: Callable, optional
+            Additional Callback with (arg: str) prameter, by default lambda:''
+        Committed: Union[Callable, None], optional
+            called with the rows of every chunk inside the transaction of the chunk
+        Before: Union[Callable, None], optional
+            called with the rows of every chunk inside the transaction of the chunk before they are inserted
+
+        Returns
+        -------
+        int
+            count of rows passed to the DB
+        """
+        chunk_rows = chunk_rows or self.INGEST_CHUNK_ROWS
+        chunk_bytes = chunk_bytes or self.INGEST_CHUNK_BYTES
+        Chunk = []
+        ChunkBytes = 0
+        Total = 0
+
+        def Flush():
+            with self.Transaction():
+                if Before is not None:
+                    Before(Chunk)
+                self.BatchInsert_Metadata(self.TransposeMeatadata(Chunk), tablename)
+                if Committed is not None:
+                    Committed(Chunk)
+            Slot(f"Added {Total + len(Chunk)} Files")
+
+        with self.PragmaProfile("bulk-import"):
+            for Row in Rows:
+                Chunk.append(Row)
+                ChunkBytes += self.RowSize(Row)
+                if len(Chunk) >= chunk_rows or ChunkBytes >= chunk_bytes:
+                    Flush()
+                    Total += len(Chunk)
+                    Chunk = []
+                    ChunkBytes = 0
+            if Chunk:
+                Flush()
+                Total += len(Chunk)
+        return Total
+
+    @staticmethod
+    def WalkEntries(Dir: str, recursive: bool = True, After: Union[str, None] = None):
+        """
+        Walks a directory tree with os.scandir and yields the entries of its files, the
+        entries cache their stat so every file costs a single stat once it is read.
+
+        The walk is in a stable order, the files of a directory sorted by name and then its
+        sub directories sorted by name, so a walk can be resumed after the last file that
+        was done.
+
+        Parameters
+        ----------
+        Dir : str
+            dir to walk
+        recursive : bool, optional
+            walks the sub directories, by default True
+        After : Union[str, None], optional
+            path of a file below the dir, the walk starts at the file that follows it
+
+        Yields
+        ------
+        os.DirEntry
+            entry of a file
+        """
+        Dir = os.path.normpath(Dir)
+        Resume = os.path.relpath(os.path.normpath(After), Dir).split(os.sep) if After else None
+        # (directory, components of the resume path below it or None)
+        Dirs = [(Dir, Resume)]
+        while Dirs:
+            path, Resume = Dirs.pop()
+            try:
+                with os.scandir(path) as Entries:
+                    Files, Subdirs = [], []
+                    for Entry in Entries:
+                        try:
+                            (Subdirs if Entry.is_dir() else Files).append(Entry)
+                        except OSError:
+                            continue
+            except OSError:
+                continue
+
+            Files.sort(key = lambda Entry: Entry.name)
+            Subdirs.sort(key = lambda Entry: Entry.name, reverse = True)
+            if Resume is None:
+                yield from Files
+            elif len(Resume) == 1:
+                yield from [Entry for Entry in Files if Entry.name > Resume[0]]
+            if not recursive:
+                continue
+            for Entry in Subdirs:
+                if Resume is None or len(Resume) == 1 or Entry.name > Resume[0]:
+                    Dirs.append((Entry.path, None))
+                elif Entry.name == Resume[0]:
+                    Dirs.append((Entry.path, Resume[1:]))
+
+    @staticmethod
+    def DeviceGroups(Dirs: list):
+        """
+        Groups directories by the device they are stored on
+
+        Parameters
+        ----------
+        Dirs : list
+            paths of the directories
+
+        Returns
+        -------
+        list
+            lists of the directories of every device in the order they were given, directories
+            that cant be stat'ed are grouped together
+        """
+        Groups = {}
+        for Dir in Dirs:
+            try:
+                device = os.stat(Dir).st_dev
+            except OSError:
+                device = None
+            Groups.setdefault(device, []).append(Dir)
+        return list(Groups.values())
+
+    def ParseFile(self, file: str):
+        """
+        Reads the metadata of a media file, is also run in the worker processes of a
+        parallel scan so it only returns plain values
+
+        Parameters
+        ----------
+        file : str
+            path of the file
+
+        Returns
+        -------
+        list
+            metadata of the file in DBFIELDS order
+        """
+        Metadata = MediaFile(file).getMetadata()
+        return [Metadata.get(field) for field in DBFIELDS]
+
+    def ScanFiles(self, Dir: Union[str, list], include: list = [], Slot: Callable = lambda x: '',
+                  Pending: Union[deque, None] = None, workers: Union[int, None] = None,
+                  recursive: bool = True, stages: Union[dict, None] = None, job = None, progress = None,
+                  device_threads: Union[int, None] = None):
+        """
+        Walks a directory and yields the metadata of its new and changed files in the order of
+        the walk. The files go through a ScanPipeline of the stages
+
+            walk -> filter -> fingerprint -> hash -> parse
+
+        each with its own bounded queue and threads, so reading the disk, hashing and parsing
+        overlap. The stats of the stages are reported to the Slot once the walk is done.
+
+        Directories on different devices are walked side by side, every device gets its own
+        walk, filter, fingerprint and hash stages with at most device_threads threads each, so
+        a spinning disk isnt seeking between many readers. Their files are merged into a shared
+        parse stage, the files of a directory keep the order of its walk.
+
+        Files whose fingerprint (size, mtime_ns, inode) is unchanged are dropped after their
+        stat, files without a fingerprint whose file_id is in the library already are only
+        fingerprinted. Files that cant be read are kept in the scan_errors table and skipped
+        until their size or mtime changes, so a broken file doesnt end the scan. A changed file
+        replaces its old row with ReplaceRow when its chunk is committed, see ScanDirectory, and
+        keeps the rating, playcount and queue entries. Every change to the DB is made
+        by the consumer in the order of the walk, so the rows match the ones of a serial scan
+        irrespective of the threads and worker processes.
+
+        Parameters
+        ----------
+        Dir : Union[str, list]
+            dir to scan or dirs to scan together
+        include : list, optional
+            File Extensions to look for, by default []
+        Slot : Callable, optional
+            Additional Callback with (arg: str) prameter, by default lambda:''
+        Pending : Union[deque, None], optional
+            gets the fingerprint of every yielded row followed by the file_id of the row it
+            replaces or None, in order, they have to be saved once the rows are commited.
+            Without it a changed file replaces its old row right away
+        workers : Union[int, None], optional
+            count of worker processes parsing the files, by default SCAN_WORKERS
+        recursive : bool, optional
+            scans the sub directories, by default True
+        stages : Union[dict, None], optional
+            {stage: threads} overriding SCAN_STAGES
+        job : Union[ScanJob, None], optional
+            job the scan belongs to, the walk resumes after its cursor and stops between two
+            files once it is paused, cancelled or stopped
+        progress : Union[ScanProgress, None], optional
+            gets the counts of seen, parsed, skipped and failed files and of the parsed bytes
+        device_threads : Union[int, None], optional
+            max threads of a stage reading a device when the dirs are on several devices, 0
+            scans them one after another, by default SCAN_DEVICE_THREADS
+
+        Yields
+        ------
+        list
+            metadata of a file in DBFIELDS order
+        """
+        path_id, file_id = DBFIELDS.index("path_id"), DBFIELDS.index("file_id")
+        workers = self.SCAN_WORKERS if workers is None else workers
+        Threads = {**self.SCAN_STAGES, **(stages or {})}
+        device_threads = self.SCAN_DEVICE_THREADS if device_threads is None else device_threads
+        Roots = [Dir] if isinstance(Dir, str) else list(Dir)
+        Devices = self.DeviceGroups(Roots) if device_threads else [Roots]
+
+        Fingerprints, Quarantine = {}, {}
+        for Root in Roots:
+            Fingerprints.update(self.Load_Fingerprints(Root))
+            Quarantine.update(self.Load_ScanErrors(Root))
+        FileIDs = set(self.exec_query("SELECT file_id FROM library", 1))
+        # the stage threads only read the file_ids the scan started with
+        Library = frozenset(FileIDs)
+        Known = []
+        Errors = []
+        Unreadable = 0
+        Quarantined = []
+        Count = progress.Add if progress is not None else lambda **counts: None
+
+        Pool = ProcessPoolExecutor(max_workers = workers) if workers > 1 else None
+
+        def Filter(Entry: os.DirEntry):
+            if (os.path.splitext(Entry.name)[1]).upper().replace(".", "") not in include:
+                return None
+            Count(seen = 1)
+            return Entry
+
+        def Fingerprint(Entry: os.DirEntry):
+            try:
+                stat = Entry.stat()
+            except OSError:
+                Count(failed = 1)
+                return None
+            file = os.path.normpath(Entry.path)
+            Current = (stat.st_size, stat.st_mtime_ns, stat.st_ino)
+            Previous = Fingerprints.get(file)
+            if Previous is not None and Previous[:3] == Current:
+                Count(skipped = 1)
+                return None
+            if Quarantine.get(file) == Current[:2]:
+                Quarantined.append(file)
+                Count(failed = 1)
+                return None
+            return [file, Current, Previous]
+
+        def Hash(Job: list):
+            try:
+                Job.append(self.FileHasher(Job[0]))
+            except OSError as error:
+                Job.extend([None, error])
+            return Job
+
+        def Parsed(Job: list, Row):
+            Job.append(Row)
+            if not isinstance(Row, Exception):
+                Count(parsed = 1, bytes = Job[1][0])
+            return Job
+
+        def Parse(Job: list):
+            if len(Job) == 5:
+                return Job
+            file, Current, Previous, Filehash = Job
+            if Previous is None and Filehash in Library:
+                Job.append(None)
+                return Job
+            return Parsed(Job, Read(self.ParseFile, file))
+
+        def ParseBatch(Jobs: list):
+            # the files of a batch are split into a chunk per worker process, so the manager
+            # is pickled once per chunk, the rest of the jobs are done by Parse
+            Files = [Job for Job in Jobs if len(Job) == 4 and not (Job[2] is None and Job[3] in Library)]
+            if Files:
+                Rows = Pool.map(ParseFile_Worker, itertools.repeat(self, len(Files)), [Job[0] for Job in Files],
+                                chunksize = -(-len(Files) // workers))
+                for Job, Row in zip(Files, Rows):
+                    Parsed(Job, Row)
+            return [Parse(Job) for Job in Jobs]
+
+        def Read(Parser: Callable, file: str):
+            # the error of a broken file is passed on to be quarantined, a broken pool ends the scan
+            try:
+                return Parser(file)
+            except BrokenExecutor:
+                raise
+            except Exception as error:
+                return error
+
+        def Walk(Dirs: list):
+            for Root in Dirs:
+                yield from self.WalkEntries(Root, recursive, job.After(Root) if job is not None else None)
+
+        def Reading(limit: Union[int, None] = None):
+            # stages reading the disk, a device limits their threads
+            return [Stage(name, function, min(Threads.get(name, 1), limit or Threads.get(name, 1)),
+                          self.SCAN_QUEUE_SIZE)
+                    for name, function in (("filter", Filter), ("fingerprint", Fingerprint), ("hash", Hash))]
+
+        if Pool is None:
+            Parsing = Stage("parse", Parse, Threads.get("parse", 1), self.SCAN_QUEUE_SIZE)
+        else:
+            Parsing = Stage("parse", ParseBatch, Threads.get("parse", 1), self.SCAN_QUEUE_SIZE,
+                            self.SCAN_PARSE_BATCH * workers)
+        if len(Devices) == 1:
+            Readers = []
+            Pipeline = ScanPipeline(Walk(Roots), [*Reading(), Parsing])
+            Sources = [Pipeline]
+        else:
+            Readers = [ScanPipeline(Walk(Dirs), Reading(device_threads)) for Dirs in Devices]
+            Pipeline = ScanPipeline(None, [Parsing])
+            Pipeline.Source = ScanPipeline.Merge(Readers, Pipeline.Stopped, self.SCAN_QUEUE_SIZE)
+            Sources = Readers
+        if job is not None:
+            for Source in Sources:
+                Source.Source = job.Guard(Source.Source, Pipeline.Stopped)
+        try:
+            for file, Current, Previous, Filehash, Row in Pipeline:
+                if job is not None and not job.Wait():
+                    break
+                if Row is None and Filehash is not None and not (Previous is None and Filehash in FileIDs):
+                    # its file_id was freed by a changed file earlier in the walk
+                    Row = Read(self.ParseFile, file)
+                if isinstance(Row, Exception):
+                    Errors.append([file, *Current[:2], type(Row).__name__, str(Row)[:500]])
+                    Unreadable += 1
+                    Count(failed = 1)
+                    if len(Errors) >= self.INGEST_CHUNK_ROWS:
+                        self.Save_ScanErrors(Errors)
+                        Errors = []
+                    continue
+                if Previous is None and Filehash in FileIDs:
+                    # file already in the library that has no fingerprint yet
+                    Known.append([file, *Current, Filehash])
+                    Count(skipped = 1)
+                    if len(Known) >= self.INGEST_CHUNK_ROWS:
+                        self.Save_Fingerprints(Known)
+                        Known = []
+                    continue
+
+                if file in Quarantine:
+                    self.exec_query("DELETE FROM scan_errors WHERE path = ?", params = [file])
+                Replaces = Previous[3] if Previous is not None else None
+                if Replaces is not None:
+                    FileIDs.discard(Replaces)
+                FileIDs.add(Filehash)
+                Row[path_id] = (hashlib.md5(file.encode())).hexdigest()
+                Row[file_id] = Filehash
+                if Pending is not None:
+                    Pending.append([file, *Current, Filehash, Replaces])
+                elif Replaces is not None:
+                    self.ReplaceRow(Replaces, Row)
+                yield Row
+        finally:
+            if Pool is not None:
+                Pool.shutdown(cancel_futures = True)
+
+        self.Save_Fingerprints(Known)
+        self.Save_ScanErrors(Errors)
+        Slot(f"SKIPPED: {sum([S.Stages[1].dropped for S in Sources]) - len(Quarantined)} Unchanged Files")
+        if Unreadable or Quarantined:
+            Slot(f"FAILED: {Unreadable} Unreadable Files, {len(Quarantined)} Quarantined Files Skipped")
+        for index, Reader in enumerate(Readers):
+            Slot(f"Scan Stages of {', '.join(Devices[index])}: {Reader.Report()}")
+        Slot(f"Scan Stages: {Pipeline.Report()}")
+
     @exe_time
-    def ScanDirectory(self, Dir: str, include: list = [], Slot: Callable = lambda x: ''):
+    def ScanDirectory(self, Dir: Union[str, list], include: list = [], Slot: Callable = lambda x: '',
+                      chunk_rows: Union[int, None] = None, chunk_bytes: Union[int, None] = None,
+                      workers: Union[int, None] = None, recursive: bool = True,
+                      stages: Union[dict, None] = None, job = None, progress = None,
+                      device_threads: Union[int, None] = None):
+        """
+        Scans all the files in a directory and inserts the new and changed ones to the DB in
+        committed chunks, the fingerprints of the files and the checkpoint of the job are
+        saved with their chunk
+
+        Parameters
+        ----------
+        Dir : Union[str, list]
+            dir to scan or dirs to scan together, dirs on different devices are read side by side
+        include : list, optional
+            File Extensions to look for, by default []
+        Slot : Callable, optional
+            Additional Callback with (arg: str) prameter, by default lambda:''
+        chunk_rows: Union[int, None], optional
+            max count of rows per chunk, by default INGEST_CHUNK_ROWS
+        chunk_bytes: Union[int, None], optional
+            max estimated size of a chunk, by default INGEST_CHUNK_BYTES
+        workers: Union[int, None], optional
+            count of worker processes parsing the files, by default SCAN_WORKERS
+        recursive: bool, optional
+            scans the sub directories, by default True
+        stages: Union[dict, None], optional
+            {stage: threads} of the scan pipeline overriding SCAN_STAGES
+        job: Union[ScanJob, None], optional
+            job the scan belongs to, see ScanFiles
+        progress: Union[ScanProgress, None], optional
+            gets the counts of the scan, see ScanFiles
+        device_threads: Union[int, None], optional
+            max threads of a stage reading a device, see ScanFiles
         """
-        Scans all the files in a directory and inserts them to the DB
+        Roots = [Dir] if isinstance(Dir, str) else list(Dir)
+        Bounds = [(Root, self.PathRange(Root)[0]) for Root in Roots]
+
+        def Replace(Chunk: list):
+            # changed files update their old row in the transaction of their chunk
+            for Row, Entry in zip(Chunk, itertools.islice(Pending, len(Chunk))):
+                if Entry[5] is not None:
+                    self.ReplaceRow(Entry[5], Row)
+
+        def Committed(Chunk: list):
+            Done = [Pending.popleft()[:5] for _ in Chunk]
+            self.Save_Fingerprints(Done)
+            if job is not None and isinstance(Dir, str):
+                job.Checkpoint(self, Done[-1][0], len(Done))
+            elif job is not None:
+                # last commited file of every dir, the files of a dir are commited in the order of its walk
+                Cursors = {}
+                for file, *_ in Done:
+                    Cursors[next(Root for Root, lower in Bounds if file.startswith(lower))] = file
+                job.Checkpoint(self, Cursors, len(Done))
+
+        Slot(f"Scanning {', '.join(Roots)}")
+        Pending = deque()
+        Rows = self.ScanFiles(Dir, include, Slot, Pending, workers, recursive, stages, job, progress, device_threads)
+        self.Ingest(Rows, chunk_rows, chunk_bytes, Slot = Slot, Committed = Committed, Before = Replace)
+        Slot(f"Completed Scanning {', '.join(Roots)}")
+
+    def ReplaceRow(self, file_id: str, Row: list):
+        """
+        Replaces the row of a changed file by an UPDATE of its old row, so the rowid, rating,
+        playcount and queue entries of the track are kept. A row with the new file_id is not
+        inserted again, if the new content is in the library already the old row is removed.
+
+        Parameters
+        ----------
+        file_id : str
+            file_id of the old row
+        Row : list
+            metadata of the changed file in DBFIELDS order
+        """
+        new_id = Row[DBFIELDS.index("file_id")]
+        if new_id != file_id and \
+                self.exec_query("SELECT EXISTS(SELECT 1 FROM library WHERE file_id = ?)", 1, params = [new_id]) == [1]:
+            self.exec_query("DELETE FROM library WHERE file_id = ?", params = [file_id])
+            return None
+        fields = [field for field in DBFIELDS if field not in ("rating", "playcount")]
+        self.exec_query(f"UPDATE library SET {', '.join([f'{field} = ?' for field in fields])} WHERE file_id = ?",
+                        params = [Row[DBFIELDS.index(field)] for field in fields] + [file_id])
+        if new_id != file_id:
+            self.exec_query("UPDATE nowplaying_queue SET file_id = ? WHERE file_id = ?", params = [new_id, file_id])
+
+    def MissingFiles(self, Dir: str, recursive: bool = True):
+        """
+        Finds the fingerprinted files below a directory that no longer exist. Without
+        recursive only the files of the directory itself are checked, the files of a sub
+        directory are only reported if the whole sub directory is gone.
 
         Parameters
         ----------
         Dir : str
-            dir to scan
+            dir to check
+        recursive : bool, optional
+            checks every file below the directory, by default True
+
+        Returns
+        -------
+        Dict
+            {path: file_id} of the missing files
+        """
+        Dir = os.path.normpath(Dir)
+        Missing = {}
+        Subdirs = {}
+        for path, Fingerprint in self.Load_Fingerprints(Dir).items():
+            Child = os.path.relpath(path, Dir).split(os.sep)[0]
+            if recursive or Child == os.path.basename(path):
+                Exists = os.path.exists(path)
+            else:
+                if Child not in Subdirs:
+                    Subdirs[Child] = os.path.isdir(os.path.join(Dir, Child))
+                Exists = Subdirs[Child]
+            if not Exists:
+                Missing[path] = Fingerprint[3]
+        return Missing
+
+    def SyncDirectories(self, Dirs: dict, include: list = [], Slot: Callable = lambda x: '',
+                        chunk_rows: Union[int, None] = None, chunk_bytes: Union[int, None] = None):
+        """
+        Applies the changes of a few directories to the library without walking the rest
+        of it, is used by the LibraryWatcher. New and changed files are scanned, files moved
+        between the directories keep their row and deleted files are removed.
+
+        Parameters
+        ----------
+        Dirs : dict
+            {dir: recursive} of the changed directories, recursive ones are synced with their sub directories
         include : list, optional
             File Extensions to look for, by default []
         Slot : Callable, optional
             Additional Callback with (arg: str) prameter, by default lambda:''
+        chunk_rows: Union[int, None], optional
+            max count of rows per chunk, by default INGEST_CHUNK_ROWS
+        chunk_bytes: Union[int, None], optional
+            max estimated size of a chunk, by default INGEST_CHUNK_BYTES
+
+        Returns
+        -------
+        Dict
+            {"moved": count, "deleted": count} of the files that left their path
+        """
+        Missing = {}
+        for Dir, recursive in Dirs.items():
+            Missing.update(self.MissingFiles(Dir, recursive))
+        # the stale fingerprints go first so a moved file is matched by its content
+        self.BulkDelete("file_fingerprints", "path", list(Missing.keys()))
+
+        for Dir, recursive in Dirs.items():
+            if os.path.isdir(Dir):
+                self.ScanDirectory(Dir, include, Slot, chunk_rows, chunk_bytes, workers = 0, recursive = recursive)
+
+        Moved = {}
+        with self.Selection(list(set(Missing.values()))) as Selection:
+            for path, file_id in self.exec_query(f"""
+            SELECT path, file_id FROM file_fingerprints WHERE file_id IN (SELECT item FROM {Selection})
+            """):
+                Moved[file_id] = path
+        with self.Transaction():
+            for file_id, path in Moved.items():
+                self.exec_query("UPDATE library SET file_path = ?, path_id = ? WHERE file_id = ?",
+                                params = [path, (hashlib.md5(path.encode())).hexdigest(), file_id])
+            Deleted = self.BulkDelete("library", "file_id", list(set(Missing.values()) - set(Moved.keys())))
+        return {"moved": len(Moved), "deleted": len(Deleted)}
+
+    @staticmethod
+    def FileExists(path: str):
         """
-        BatchMetadata = []
-        Existing_Paths = []
-        FileHashList = []
+        Checks if a file exists, only a missing file or directory counts as missing so a
+        file that cant be accessed for a while is not pruned
 
-        Slot(f"Scanning {Dir}")
-        if [[0]] != self.exec_query("SELECT COUNT(path_id) FROM library"):
-            Existing_Paths = self.exec_query(f"SELECT path_id FROM library")
-            FileHashList = self.exec_query(f"SELECT file_id FROM library")
+        Parameters
+        ----------
+        path : str
+            path of the file
 
-        for D, SD, F in os.walk(os.path.normpath(Dir)):
-            for file in F:
-                # checks for file ext
-                if (os.path.splitext(file)[1]).upper().replace(".", "") in include:
-                    file = PathUtils.PathJoin(D, file)
+        Returns
+        -------
+        bool
+            False if the file is missing
+        """
+        try:
+            os.stat(path)
+        except (FileNotFoundError, NotADirectoryError):
+            return False
+        except (OSError, ValueError):
+            return True
+        return True
 
-                    # Generates Hashes
-                    path_hash = (hashlib.md5(file.encode())).hexdigest()
-                    Filehash = self.FileHasher(file)
+    def PruneMissing(self, Dir: Union[str, None] = None, Slot: Callable = lambda x: '',
+                     batch_size: Union[int, None] = None, workers: Union[int, None] = None):
+        """
+        Removes the tracks whose file no longer exists. The file paths are streamed from the
+        library and stat'ed in batches on a thread pool, the missing tracks are then deleted
+        in chunks of batch_size, each in its own transaction joined against a temp table.
+        Quarantined files that are gone are removed from scan_errors as well.
 
-                    # checks and add teh files to metadata dict
-                    if ([path_hash] not in Existing_Paths) and ([Filehash] not in FileHashList):
-                        FileHashList.append(Filehash)
-                        Metadata = MediaFile(file).getMetadata()
-                        Metadata["path_id"] = path_hash
-                        Metadata["file_id"] = Filehash
-                        BatchMetadata.append(list(Metadata.values()))
-                    else:
-                        Slot(f"SKIPPED: {file}")
-                else:
-                    Slot(f"SKIPPED: {file}")
+        A directory that doesnt exist is not pruned, so the tracks of an unmounted drive are
+        kept. Without a directory every track is checked.
 
-        self.BatchInsert_Metadata(self.TransposeMeatadata(BatchMetadata))
-        Slot(f"Completed Scanning {Dir}")
+        >>> FileManager.PruneMissing("D:\\music")
 
-    def FileHasher(self, file: str, hashfun: Callable = hashlib.md5):
+        Parameters
+        ----------
+        Dir : Union[str, None], optional
+            only checks the tracks below the directory, by default the whole library
+        Slot : Callable, optional
+            Additional Callback with (arg: str) prameter, by default lambda:''
+        batch_size : Union[int, None], optional
+            count of files stat'ed and deleted at once, by default PRUNE_BATCH
+        workers : Union[int, None], optional
+            count of threads stat'ing the files, by default PRUNE_WORKERS
+
+        Returns
+        -------
+        int
+            count of deleted tracks
+        """
+        batch_size = batch_size or self.PRUNE_BATCH
+        if Dir is not None and not os.path.isdir(Dir):
+            Slot(f"Prune Skipped: {Dir} is not available")
+            return 0
+
+        query = "SELECT file_id, file_path FROM library"
+        params = None
+        if Dir is not None:
+            query += " WHERE file_path >= ? AND file_path < ?"
+            params = list(self.PathRange(Dir))
+
+        Missing = []
+        Checked = 0
+        with ThreadPoolExecutor(max_workers = workers or self.PRUNE_WORKERS) as Pool:
+            # the deletes wait for the end of the stream, its cursor would be moved by them
+            for Batch in self.stream_query(query, params = params, batch_size = batch_size):
+                Exists = Pool.map(self.FileExists, [file_path for _, file_path in Batch])
+                Missing.extend([file_id for (file_id, _), exists in zip(Batch, Exists) if not exists])
+                Checked += len(Batch)
+                Slot(f"Pruning Library: {len(Missing)} of {Checked} Files Missing")
+            Errors = list(self.Load_ScanErrors(Dir).keys())
+            Gone = [path for path, exists in zip(Errors, Pool.map(self.FileExists, Errors)) if not exists]
+
+        Deleted = 0
+        for index in range(0, len(Missing), batch_size):
+            Deleted += len(self.BulkDelete("library", "file_id", Missing[index: index + batch_size]))
+        for index in range(0, len(Gone), batch_size):
+            self.BulkDelete("scan_errors", "path", Gone[index: index + batch_size])
+        Slot(f"Pruned {Deleted} Missing Files")
+        return Deleted
+
+    @staticmethod
+    def PayloadRange(fobj, size: int):
         """
-        Creates a hash id for the file path passed and returns hash id.
-        Hash id is calculated with the 1024 bytes of the file.
+        Finds the audio payload of a media file by skipping its tag blocks, so the id of a
+        file doesnt change when its tags are edited. Skips ID3v2 tags, the FLAC metadata
+        blocks and the ID3v1 and APEv2 tags at the end, MP4 files are reduced to their mdat
+        box. Other formats keep their whole content. Tag sizes that dont fit in the file are
+        ignored, so a damaged tag never gives offsets outside of the file.
+
+        Parameters
+        ----------
+        fobj : BinaryIO
+            file opened in binary mode
+        size : int
+            size of the file
+
+        Returns
+        -------
+        tuple
+            (start, end) offsets of the payload
+        """
+        start, end = 0, size
+
+        fobj.seek(size - 128 if size >= 128 else 0)
+        if size >= 128 and fobj.read(3) == b"TAG":
+            end -= 128
+        if end >= 32:
+            fobj.seek(end - 32)
+            Footer = fobj.read(32)
+            if Footer[:8] == b"APETAGEX":
+                # the tag size covers the items and footer, the header is flagged in bit 31
+                length = int.from_bytes(Footer[12:16], "little")
+                flags = int.from_bytes(Footer[20:24], "little")
+                length += 32 if flags & 0x80000000 else 0
+                if 32 <= length <= end:
+                    end -= length
+
+        fobj.seek(0)
+        Header = fobj.read(12)
+        if Header[4:8] == b"ftyp":
+            while start + 8 <= end:
+                fobj.seek(start)
+                Box = fobj.read(16)
+                length, kind = int.from_bytes(Box[:4], "big"), Box[4:8]
+                header = 8
+                if length == 1:
+                    length, header = int.from_bytes(Box[8:16], "big"), 16
+                elif length == 0:
+                    length = end - start
+                if length < header:
+                    break
+                if kind == b"mdat":
+                    return min(start + header, end), min(start + length, end)
+                start += length
+            return 0, end
+
+        # an ID3v2 tag can be in front of any format, its size is stored as a synchsafe integer
+        while Header[:3] == b"ID3" and len(Header) >= 10:
+            length = (Header[6] << 21) | (Header[7] << 14) | (Header[8] << 7) | Header[9]
+            start += 10 + length + (10 if Header[5] & 0x10 else 0)
+            fobj.seek(start)
+            Header = fobj.read(12)
+
+        if Header[:4] == b"fLaC":
+            start += 4
+            last = False
+            while not last and start + 4 <= end:
+                fobj.seek(start)
+                Block = fobj.read(4)
+                last = bool(Block[0] & 0x80)
+                start += 4 + int.from_bytes(Block[1:4], "big")
+        return min(start, end), end
+
+    def FileHasher(self, file: str, sample_size: int = 4096):
+        """
+        Creates the content id of a media file. The start, middle and end of its audio payload
+        are hashed with a keyed blake2b together with the length of the payload, so editing
+        the tags keeps the id and files with the same tag headers get different ones.
 
         Parameters
         ----------
         file : str
             File for which the hash is generated
-        hashfun : Callable, optional
-            Hashing algorithm method from hashlib, by default hashlib.md5
+        sample_size : int, optional
+            count of bytes read from each sampled region, by default 4096
 
         Returns
         -------
@@ -849,7 +3388,19 @@ class FileManager(DataBaseManager):  # pragma: no cover
             hashval that is generated
         """
         with open(file, "rb") as fobj:
-            return (hashfun(fobj.read(1024))).hexdigest()
+            size = os.fstat(fobj.fileno()).st_size
+            start, end = self.PayloadRange(fobj, size)
+            length = end - start
+            Hash = hashlib.blake2b(length.to_bytes(8, "little"), digest_size = 16, key = self.FILE_ID_KEY)
+            if length <= sample_size * 3:
+                Offsets = [start]
+                sample_size = length
+            else:
+                Offsets = [start, start + (length - sample_size) // 2, end - sample_size]
+            for offset in Offsets:
+                fobj.seek(offset)
+                Hash.update(fobj.read(sample_size))
+            return Hash.hexdigest()
 
 
 class LibraryManager(FileManager):
@@ -11,7 +11,8 @@ from apollo.utils import AppConfig
 from apollo.gui.ui_library_manager_ui import Ui_MainWindow as LibraryManager_UI
 from apollo.gui.ui_LEDT_dialog import LEDT_Dialog as LineEdit_Dialog
 from apollo.app.misc_app import FileExplorer
-from apollo.db import FileManager, Connection, LibraryManager
+from apollo.db import FileManager, Connection, ConnectionPool, LibraryManager, DEFAULT_PRAGMA_PROFILE
+from apollo.db import DataBaseWorker, ScanJob, ScanProgress
 
 
 LBT_FILE_FILTERS = ("MP3", "AAC", "M4A", "MPC", "OGG", "FLAC",
@@ -21,8 +22,13 @@ LBT_FILE_FILTERS = ("MP3", "AAC", "M4A", "MPC", "OGG", "FLAC",
 
 class FileScanner_Thread(Thread):  # untested
     FILE_FILTERS = LBT_FILE_FILTERS
+    # scanners that are running, they are stopped when the app closes and resumed on the next launch
+    Active = []
 
-    def __init__(self, FileQueue: list, Ext: list, DB_name: str, Slot: Callable = lambda x: ''):
+    def __init__(self, FileQueue: list, Ext: list, DB_name: str, Slot: Callable = lambda x: '',
+                 ChunkRows: int = None, ChunkBytes: int = None, Workers: int = None,
+                 Stages: dict = None, Job: ScanJob = None, Progress: ScanProgress = None, Prune: bool = False,
+                 DeviceThreads: int = None):
         super().__init__()
         self.DeclareEvents()
         self.daemon = False
@@ -30,6 +36,16 @@ class FileScanner_Thread(Thread):  # untested
         self.FileQueue = FileQueue
         self.Slot = Slot
         self.Extension = [K for K, V in zip(FileScanner_Thread.FILE_FILTERS, Ext) if V == 1]
+        self.ChunkRows = ChunkRows
+        self.ChunkBytes = ChunkBytes
+        self.Workers = Workers
+        self.Stages = Stages
+        self.Prune = Prune
+        self.DeviceThreads = DeviceThreads
+        self.Job = Job or ScanJob(FileQueue, self.Extension)
+        # created on the GUI thread, its updates reach the Slot through queued signals
+        self.Progress = Progress or ScanProgress()
+        self.Progress.StatusChanged.connect(Slot)
         self.Manager = FileManager()
         self.Manager.connect(DB_name, check = False)
 
@@ -40,15 +56,16 @@ class FileScanner_Thread(Thread):  # untested
         pass
 
     def run(self) -> None:
-        while self.Running.is_set():
-            if self.Pause.is_set():
-                time.sleep(0.1)
-                continue
-            if self.Scanning.is_set():
-                for Dir in self.FileQueue:
-                    self.Manager.ScanDirectory(Dir, self.Extension, self.Slot)
-                self.Scanning.clear()
-                self.exit()
+        try:
+            if self.Running.is_set() and self.Scanning.is_set():
+                self.Job.Run(self.Manager, self.Progress.Message, self.ChunkRows, self.ChunkBytes, self.Workers,
+                             self.Stages, self.Progress, self.Prune, self.DeviceThreads)
+            self.Scanning.clear()
+            self.exit()
+        finally:
+            FileScanner_Thread.Active.remove(self)
+            # connections are owned by this thread and have to be closed by it
+            ConnectionPool.CloseThread()
 
     def exit(self):
         self.Running.clear()
@@ -63,9 +80,35 @@ class FileScanner_Thread(Thread):  # untested
     def start(self):
         self.Running.set()
         self.Scanning.set()
+        FileScanner_Thread.Active.append(self)
         super().start()
         return self
 
+    def pause(self):
+        self.Pause.set()
+        self.Job.Pause()
+
+    def resume(self):
+        self.Pause.clear()
+        self.Job.Resume()
+
+    def cancel(self):
+        self.Job.Cancel()
+
+    def stop(self):
+        self.Job.Stop()
+
+    @classmethod
+    def StopAll(cls):
+        """
+        Stops the running scanners after their current file and waits for them, their jobs are resumed on the next launch
+        """
+        Scanners = list(cls.Active)
+        for Scanner in Scanners:
+            Scanner.stop()
+        for Scanner in Scanners:
+            Scanner.join()
+
 
 class LibraryManager_App(QtWidgets.QMainWindow, LibraryManager_UI):
     LBT_FILE_FILTERS = LBT_FILE_FILTERS
@@ -181,7 +224,9 @@ class DBnameFileExp(FileExplorer):
                     "name": NAME,
                     "db_loc": NEW_path,
                     "file_mon": [],
-                    "filters": [1 for _ in LBT_FILE_FILTERS]
+                    "filters": [1 for _ in LBT_FILE_FILTERS],
+                    "profile": DEFAULT_PRAGMA_PROFILE,
+                    "pragmas": {}
                 }
                 if not os.path.isfile(NEW_path):
                     with Connection.connect(NEW_path) as con:
@@ -373,6 +418,7 @@ class DBManager_Tab:
         if not os.path.isfile(self.UI.LBT_LEDT_dbpath.text()):
             return None
         OG_NAME = self.UI.LBT_CMBX_libname.currentText()
+        ConnectionPool.CloseDatabase(self.UI.Config[f"MONITERED_DB/{OG_NAME}/db_loc"])
         os.remove(self.UI.Config[f"MONITERED_DB/{OG_NAME}/db_loc"])
         del self.UI.Config[f"MONITERED_DB/{OG_NAME}"]
         self.UI.Config[f"CURRENT_DB"] = self.UI.Config[f"MONITERED_DB"].keys()[0]
@@ -391,6 +437,7 @@ class DBManager_Tab:
         NEW_path = PU.PathJoin(os.path.split(OG_path)[0], f"{NEW_NAME}.db".replace(" ", "_").lower())
 
         self.UI.LBT_LEDT_dbpath.setText(NEW_path)
+        ConnectionPool.CloseDatabase(OG_path)
         os.rename(src=OG_path, dst=NEW_path)
 
         # writes new config and deletes the old config
@@ -398,7 +445,9 @@ class DBManager_Tab:
             "name": NEW_NAME,
             "db_loc": NEW_path,
             "file_mon": (self.UI.Config[f"MONITERED_DB/{OG_NAME}/file_mon"]),
-            "filters": (self.UI.Config[f"MONITERED_DB/{OG_NAME}/filters"])
+            "filters": (self.UI.Config[f"MONITERED_DB/{OG_NAME}/filters"]),
+            "profile": (self.UI.Config[f"MONITERED_DB/{OG_NAME}/profile"] or DEFAULT_PRAGMA_PROFILE),
+            "pragmas": (self.UI.Config[f"MONITERED_DB/{OG_NAME}/pragmas"] or {})
         }
         del self.UI.Config[f"MONITERED_DB/{OG_NAME}"]
 
@@ -447,7 +496,9 @@ class DBManager_Tab:
             "name": NEW_NAME,
             "db_loc": NEW_path,
             "file_mon": FILE_MON,
-            "filters": FILTERS
+            "filters": FILTERS,
+            "profile": DEFAULT_PRAGMA_PROFILE,
+            "pragmas": {}
         }
 
         self.LBT_CURRENT_LOADED_DB = NEW_NAME
@@ -487,7 +538,9 @@ class DBManager_Tab:
             "name": NEW_NAME,
             "db_loc": OG_path,
             "file_mon": FILE_MON,
-            "filters": FILTERS
+            "filters": FILTERS,
+            "profile": (self.UI.Config[f"MONITERED_DB/{NEW_NAME}/profile"] or DEFAULT_PRAGMA_PROFILE),
+            "pragmas": (self.UI.Config[f"MONITERED_DB/{NEW_NAME}/pragmas"] or {})
         }
 
         self.LBT_CURRENT_LOADED_DB = NEW_NAME
@@ -509,18 +562,13 @@ class DBManager_Tab:
             self.UI.LBT_LEDT_dbname.setText(str(DB_name))
             self.UI.LBT_LEDT_dbpath.setText(str(path))
 
-            # Updates DB stats
-            self.UI.LibManager.connect(path, check = False)
-            self.UI.LBT_LEDT_totartist.setText(f"{str(self.UI.LibManager.TableArtistcount())} Artists")
-            self.UI.LBT_LEDT_totalbum.setText(f"{str(self.UI.LibManager.TableAlbumcount())} Albums")
-            self.UI.LBT_LEDT_tottrack.setText(f"{str(self.UI.LibManager.TableTrackcount())} Tracks")
-            self.UI.LBT_LEDT_totplaytime.setText(f"{str(self.UI.LibManager.TablePlaytime())}")
-            self.UI.LBT_LEDT_totsize.setText(f"{str(self.UI.LibManager.TableSize())} GB")
-            self.UI.LBT_LEDT_topartist.setText(f"{str(self.UI.LibManager.Topartist())}")
-            self.UI.LBT_LEDT_toptrack.setText(f"{str(self.UI.LibManager.Toptrack())}")
-            self.UI.LBT_LEDT_topalbum.setText(f"{str(self.UI.LibManager.TopAlbum())}")
-            self.UI.LBT_LEDT_topgenre.setText(f"{str(self.UI.LibManager.Topgenre())}")
-            self.UI.LBT_LEDT_totplay.setText(f"{str(self.UI.LibManager.TablePlaycount())} Plays")
+            # Updates DB stats, a manager per DB keeps a running job on the DB it was queued for
+            Manager = LibraryManager()
+            Manager.connect(path, check = False)
+            Manager.SetProfile(self.UI.Config[f"MONITERED_DB/{DB_name}/profile"] or DEFAULT_PRAGMA_PROFILE,
+                               self.UI.Config[f"MONITERED_DB/{DB_name}/pragmas"] or {})
+            self.UI.LibManager = Manager
+            DataBaseWorker.Instance().Submit(Manager.TableStats, slot = self.fillStats, key = "DBManager_Tab.fillStats")
 
             # Updates DB files
             paths = (self.UI.Config[f"MONITERED_DB/{DB_name}/file_mon"])
@@ -545,6 +593,26 @@ class DBManager_Tab:
                 Model.insertRow(R, itm)
             self.UI.LBT_LSV_filters.setModel(Model)
 
+    def fillStats(self, Stats: dict):
+        """
+        Fills the UI with the stats of the loaded DB
+
+        Parameters
+        ----------
+        Stats: dict
+            stats returned by DataBaseManager.TableStats
+        """
+        self.UI.LBT_LEDT_totartist.setText(f"{str(Stats['artists'])} Artists")
+        self.UI.LBT_LEDT_totalbum.setText(f"{str(Stats['albums'])} Albums")
+        self.UI.LBT_LEDT_tottrack.setText(f"{str(Stats['tracks'])} Tracks")
+        self.UI.LBT_LEDT_totplaytime.setText(f"{str(Stats['playtime'])}")
+        self.UI.LBT_LEDT_totsize.setText(f"{str(Stats['size'])} GB")
+        self.UI.LBT_LEDT_topartist.setText(f"{str(Stats['top_artist'])}")
+        self.UI.LBT_LEDT_toptrack.setText(f"{str(Stats['top_track'])}")
+        self.UI.LBT_LEDT_topalbum.setText(f"{str(Stats['top_album'])}")
+        self.UI.LBT_LEDT_topgenre.setText(f"{str(Stats['top_genre'])}")
+        self.UI.LBT_LEDT_totplay.setText(f"{str(Stats['playcount'])} Plays")
+
     def DB_LEDT_TextChange(self, offset: int = 1):
         """
         Cycles through all the DB that are added to the config
@@ -601,7 +669,13 @@ class DBManager_Tab:
             if FILTERS != [] and FILE_MON != []:
                 self.Updated_DB()
                 started()
-                ScannerThread = FileScanner_Thread(FILE_MON, FILTERS, DB, self.UI.statusBar.showMessage)
+                ScanConfig = self.UI.Config["LIBRARY_SCAN"] or {}
+                ScannerThread = FileScanner_Thread(FILE_MON, FILTERS, DB, self.UI.statusBar.showMessage,
+                                                   ScanConfig.get("chunk_rows"), ScanConfig.get("chunk_bytes"),
+                                                   ScanConfig.get("workers"), ScanConfig.get("stages"),
+                                                   Progress = ScanProgress(ScanConfig.get("progress_rate")),
+                                                   Prune = ScanConfig.get("prune", False),
+                                                   DeviceThreads = ScanConfig.get("device_threads"))
                 ScannerThread.finished = finished
                 ScannerThread.start()
             else:
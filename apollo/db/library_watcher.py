@@ -0,0 +1,285 @@
+import os
+from typing import Union
+
+from PySide6 import QtCore
+
+from apollo.db.library_manager import FileManager
+from apollo.db.database_worker import DataBaseWorker
+
+
+class LibraryWatcher(QtCore.QObject):
+    """
+    Keeps a library in sync with its monitored folders while the app is running.
+
+    Every directory below the folders is watched with a QFileSystemWatcher, which uses
+    inotify, FSEvents or ReadDirectoryChangesW depending on the platform. A directory is
+    reported when a file in it is created, deleted, renamed or replaced, the included files
+    are watched as well so a file edited in place (e.g. by a tag editor) reports its
+    directory. Bursts of events are coalesced until the folders have been quiet for the
+    debounce interval. The changed directories are then synced in small batches on the
+    DataBaseWorker, so only their files are looked at and the rest of the library is not
+    walked again, their unchanged files are skipped by the fingerprints of the scan.
+
+    Every watched path takes an inotify watch on Linux, paths past fs.inotify.max_user_watches
+    cant be watched and are synced by the next rescan.
+
+    >>> Watcher = LibraryWatcher(db_path, ["D:\\music"], ["MP3", "FLAC"])
+    >>> Watcher.LibraryChanged.connect(Model.RefreshData_Async)
+    """
+    DEBOUNCE_MS = 2000
+    # count of directories synced by a single worker job
+    BATCH_DIRS = 32
+
+    LibraryChanged = QtCore.Signal(dict)
+    # exception of a batch that failed to be synced
+    SyncFailed = QtCore.Signal(object)
+    # failures formatted for the status bar
+    StatusChanged = QtCore.Signal(str)
+
+    def __init__(self, DB_name: str, Folders: list, include: list, debounce_ms: Union[int, None] = None,
+                 batch_dirs: Union[int, None] = None, chunk_rows: Union[int, None] = None,
+                 parent: Union[QtCore.QObject, None] = None):
+        """
+        Class Constructor
+
+        Parameters
+        ----------
+        DB_name: str
+            path of the library database
+        Folders: list
+            monitored folders of the library
+        include: list
+            File Extensions to look for
+        debounce_ms: Union[int, None], optional
+            quiet time in ms before the changes are applied, by default DEBOUNCE_MS
+        batch_dirs: Union[int, None], optional
+            count of directories synced by a single job, by default BATCH_DIRS
+        chunk_rows: Union[int, None], optional
+            max count of rows committed at once, by default INGEST_CHUNK_ROWS
+        parent: Union[QtCore.QObject, None], optional
+            parent object of the watcher, by default None
+        """
+        super().__init__(parent)
+        self.Folders = [os.path.normpath(Folder) for Folder in Folders]
+        self.Include = include
+        self.BatchDirs = batch_dirs or self.BATCH_DIRS
+        self.ChunkRows = chunk_rows
+        self.Manager = FileManager()
+        self.Manager.connect(DB_name, check = False)
+
+        # {dir: recursive} of the directories waiting to be synced
+        self.Pending = {}
+        self.Syncing = False
+
+        self.Watcher = QtCore.QFileSystemWatcher(self)
+        self.Watcher.directoryChanged.connect(self.Changed)
+        self.Watcher.fileChanged.connect(self.FileChanged)
+        self.Timer = QtCore.QTimer(self)
+        self.Timer.setSingleShot(True)
+        self.Timer.setInterval(debounce_ms or self.DEBOUNCE_MS)
+        self.Timer.timeout.connect(self.Flush)
+
+        # the folder trees are listed on the worker and watched once they are known
+        DataBaseWorker.Instance().Submit(self.ListPaths, self.Folders, slot = self.Watch)
+
+    @staticmethod
+    def ListDirectories(Folders: list):
+        """
+        Lists the folders and all their sub directories
+
+        Parameters
+        ----------
+        Folders: list
+            root folders
+
+        Returns
+        -------
+        list
+            paths of the directories
+        """
+        Dirs = []
+        Stack = [Folder for Folder in Folders if os.path.isdir(Folder)]
+        while Stack:
+            Dir = Stack.pop()
+            Dirs.append(Dir)
+            try:
+                with os.scandir(Dir) as Entries:
+                    Stack.extend([os.path.normpath(Entry.path) for Entry in Entries
+                                  if Entry.is_dir(follow_symlinks = False)])
+            except OSError:
+                continue
+        return Dirs
+
+    def ListFiles(self, Dirs: list):
+        """
+        Lists the included files of directories, their sub directories are not listed
+
+        Parameters
+        ----------
+        Dirs: list
+            paths of the directories
+
+        Returns
+        -------
+        list
+            paths of the files
+        """
+        Files = []
+        for Dir in Dirs:
+            try:
+                with os.scandir(Dir) as Entries:
+                    Files.extend([os.path.normpath(Entry.path) for Entry in Entries
+                                  if (os.path.splitext(Entry.name)[1]).upper().replace(".", "") in self.Include
+                                  and Entry.is_file(follow_symlinks = False)])
+            except OSError:
+                continue
+        return Files
+
+    def ListPaths(self, Folders: list):
+        """
+        Lists the folders with their sub directories and included files, is run on the worker
+
+        Parameters
+        ----------
+        Folders: list
+            root folders
+
+        Returns
+        -------
+        list
+            paths of the directories followed by the paths of the files
+        """
+        Dirs = self.ListDirectories(Folders)
+        return Dirs + self.ListFiles(Dirs)
+
+    def Watch(self, Paths: list):
+        """
+        Adds directories and files to the watcher
+
+        Parameters
+        ----------
+        Paths: list
+            paths of the directories and files
+        """
+        Watched = set(self.Watcher.directories()) | set(self.Watcher.files())
+        Paths = [Path for Path in Paths if Path not in Watched]
+        if Paths:
+            Failed = self.Watcher.addPaths(Paths)
+            if Failed:
+                self.StatusChanged.emit(f"Watching Library: {len(Failed)} paths cant be watched, they are synced on rescan")
+
+    def Changed(self, path: str):
+        """
+        Queues a changed directory and restarts the debounce timer
+
+        Parameters
+        ----------
+        path: str
+            changed directory
+        """
+        path = os.path.normpath(path)
+        # a removed directory is no longer watched, every file below it has to be checked
+        self.Pending[path] = self.Pending.get(path, False) or not os.path.isdir(path)
+        self.Timer.start()
+
+    def FileChanged(self, path: str):
+        """
+        Queues the directory of a file that was changed in place, removed or replaced
+
+        Parameters
+        ----------
+        path: str
+            changed file
+        """
+        self.Changed(os.path.dirname(os.path.normpath(path)))
+
+    def Flush(self):
+        """
+        Syncs the next batch of pending directories on the worker
+        """
+        if self.Syncing or not self.Pending:
+            return None
+        Batch = dict(list(self.Pending.items())[:self.BatchDirs])
+        for Dir in Batch:
+            del self.Pending[Dir]
+        self.Syncing = True
+        DataBaseWorker.Instance().Submit(self.Sync, Batch, set(self.Watcher.directories()),
+                                         priority = DataBaseWorker.PRIORITY_WRITE,
+                                         slot = self.Synced, error = self.Failed)
+
+    def Sync(self, Dirs: dict, Watched: set):
+        """
+        Applies a batch of changed directories to the library, is run on the worker.
+        Sub directories that are not watched yet are new and are synced with their tree.
+
+        Parameters
+        ----------
+        Dirs: dict
+            {dir: recursive} of the changed directories
+        Watched: set
+            directories watched when the batch was taken
+
+        Returns
+        -------
+        dict
+            {"paths": new directories and files to watch, "moved": count, "deleted": count}
+        """
+        Dirs = dict(Dirs)
+        for Dir, recursive in list(Dirs.items()):
+            if recursive or not os.path.isdir(Dir):
+                continue
+            try:
+                with os.scandir(Dir) as Entries:
+                    for Entry in Entries:
+                        path = os.path.normpath(Entry.path)
+                        if Entry.is_dir(follow_symlinks = False) and path not in Watched:
+                            Dirs[path] = True
+            except OSError:
+                continue
+
+        Result = self.Manager.SyncDirectories(Dirs, self.Include, chunk_rows = self.ChunkRows)
+        New = self.ListDirectories([Dir for Dir, recursive in Dirs.items() if recursive])
+        # replaced files lose their watch, so the files of every synced directory are watched again
+        Files = self.ListFiles([Dir for Dir, recursive in Dirs.items() if not recursive] + New)
+        Result["paths"] = New + Files
+        return Result
+
+    def Synced(self, Result: dict):
+        """
+        Watches the new paths of a synced batch and syncs the next one
+
+        Parameters
+        ----------
+        Result: dict
+            result of Sync
+        """
+        self.Syncing = False
+        self.Watch(Result.pop("paths"))
+        self.LibraryChanged.emit(Result)
+        if self.Pending:
+            self.Timer.start()
+
+    def Failed(self, exception: BaseException):
+        """
+        Reports a failed batch through SyncFailed and StatusChanged, its directories are synced by the next rescan
+
+        Parameters
+        ----------
+        exception: BaseException
+            exception raised by the batch
+        """
+        self.Syncing = False
+        self.SyncFailed.emit(exception)
+        self.StatusChanged.emit(f"Syncing Library Failed: {type(exception).__name__}: {exception}")
+        if self.Pending:
+            self.Timer.start()
+
+    def Stop(self):
+        """
+        Stops watching the folders, pending changes are dropped
+        """
+        self.Timer.stop()
+        self.Pending.clear()
+        Watched = self.Watcher.directories() + self.Watcher.files()
+        if Watched:
+            self.Watcher.removePaths(Watched)
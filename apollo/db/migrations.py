@@ -0,0 +1,599 @@
+import os
+from typing import Callable, NamedTuple, Union
+
+# columns of the library table stored as integers, every other column is TEXT
+LIBRARY_INTEGER_FIELDS = ("discnumber", "length", "filesize", "bitrate", "channels",
+                          "sample_rate", "rating", "playcount")
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    apply: Callable
+
+
+class MigrationRegistry:
+    """
+    Ordered schema migrations of an Apollo database.
+
+    The schema version is stored in PRAGMA user_version, so opening an up to date database
+    costs a single pragma read. Every pending migration is applied in version order and the
+    version is written after each one, an interrupted upgrade resumes at the migration that
+    didnt finish. Migrations are called with (Manager, Slot) and have to be safe to run again.
+
+    Large tables should be changed in place with AddColumn and Backfill, a migration that
+    rebuilds the library table also drops its indexes and triggers.
+
+    >>> @MIGRATIONS.Register(7, "album sort key")
+    ... def AlbumSortKey(Manager, Slot):
+    ...     MIGRATIONS.AddColumn(Manager, "library", "album_sort", "TEXT")
+    ...     MIGRATIONS.Backfill(Manager, "album_sort", "library", "album_sort = lower(album)", Slot = Slot)
+
+    Upgrade runs when the database is opened, so a migration that rewrites every row only
+    runs the cheap DDL and schedules a task. Tasks are kept in the schema_progress table and
+    run one step at a time in the background after startup, an interrupted task resumes
+    with the next start of the app.
+
+    >>> @MIGRATIONS.Task("numeric columns")
+    ... def NumericColumnsTask(Manager, Slot):
+    ...     return Manager.Migrate_NumericSchema(Slot = Slot, chunks = 1)
+    >>> MIGRATIONS.Background(Manager, statusBar.showMessage)
+    """
+
+    def __init__(self):
+        """
+        Class Constructor
+        """
+        self.Migrations = {}
+        self.Tasks = {}
+
+    def Register(self, version: int, name: str):
+        """
+        Decorator that registers a migration function
+
+        Parameters
+        ----------
+        version: int
+            schema version the migration upgrades to, has to be unique
+        name: str
+            description of the migration
+
+        Returns
+        -------
+        Callable
+            decorator returning the function unchanged
+
+        Raises
+        ------
+        ValueError
+            if the version is already registered
+        """
+        def Decorator(function: Callable):
+            if version in self.Migrations:
+                raise ValueError(f"Migration {version} is already registered")
+            self.Migrations[version] = Migration(version, name, function)
+            return function
+        return Decorator
+
+    def Task(self, name: str):
+        """
+        Decorator that registers the step function of a background task. The function is
+        called with (Manager, Slot) and returns True once the task is done, every call
+        should only do a chunk of the work.
+
+        Parameters
+        ----------
+        name: str
+            unique name of the task, is the name of its schema_progress row
+
+        Returns
+        -------
+        Callable
+            decorator returning the function unchanged
+
+        Raises
+        ------
+        ValueError
+            if the name is already registered
+        """
+        def Decorator(function: Callable):
+            if name in self.Tasks:
+                raise ValueError(f"Task {name} is already registered")
+            self.Tasks[name] = function
+            return function
+        return Decorator
+
+    @staticmethod
+    def Schedule(Manager, name: str):
+        """
+        Schedules a background task, a task that is already scheduled keeps its progress
+
+        Parameters
+        ----------
+        Manager: DataBaseManager
+            manager connected to the database
+        name: str
+            name of a registered task
+        """
+        Manager.exec_query("CREATE TABLE IF NOT EXISTS schema_progress(name TEXT PRIMARY KEY, cursor INTEGER)")
+        Manager.exec_query("INSERT OR IGNORE INTO schema_progress(name, cursor) VALUES (?, 0)", params = [name])
+
+    def Pending(self, Manager):
+        """
+        Parameters
+        ----------
+        Manager: DataBaseManager
+            manager connected to the database
+
+        Returns
+        -------
+        List
+            names of the scheduled tasks in the order they were scheduled
+        """
+        if Manager.exec_query("SELECT EXISTS(SELECT 1 FROM sqlite_master WHERE name = 'schema_progress')", 1) != [1]:
+            return []
+        names = Manager.exec_query("SELECT name FROM schema_progress ORDER BY rowid", 1)
+        return [name for name in names if name in self.Tasks]
+
+    def Step(self, Manager, name: str, Slot: Callable = lambda x: ''):
+        """
+        Runs a step of a task and removes it from the schedule once it is done
+
+        Parameters
+        ----------
+        Manager: DataBaseManager
+            manager connected to the database
+        name: str
+            name of a scheduled task
+        Slot: Callable, optional
+            Additional Callback with (arg: str) prameter, by default lambda:''
+
+        Returns
+        -------
+        Boolean
+            True if the task is done
+        """
+        if not self.Tasks[name](Manager, Slot):
+            return False
+        Manager.exec_query("DELETE FROM schema_progress WHERE name = ?", params = [name])
+        return True
+
+    def RunTasks(self, Manager, Slot: Callable = lambda x: ''):
+        """
+        Runs every scheduled task to the end on the calling thread
+
+        Parameters
+        ----------
+        Manager: DataBaseManager
+            manager connected to the database
+        Slot: Callable, optional
+            Additional Callback with (arg: str) prameter, by default lambda:''
+
+        Returns
+        -------
+        List
+            names of the tasks that were run
+        """
+        done = []
+        for name in self.Pending(Manager):
+            while not self.Step(Manager, name, Slot):
+                pass
+            done.append(name)
+        return done
+
+    def Background(self, Manager, Slot: Callable = lambda x: '', Error: Union[Callable, None] = None,
+                   Done: Union[Callable, None] = None):
+        """
+        Runs the scheduled tasks on the DataBaseWorker, every step is submitted as its own
+        write job so reads of the GUI are served between the steps. The Slot and Error
+        callbacks are called on the thread that owns the worker.
+
+        Parameters
+        ----------
+        Manager: DataBaseManager
+            manager connected to the database
+        Slot: Callable, optional
+            Additional Callback with (arg: str) prameter, by default lambda:''
+        Error: Union[Callable, None], optional
+            called with the exception of a failed step, the task is stopped until the next start
+        Done: Union[Callable, None], optional
+            called with the name of every finished task
+
+        Returns
+        -------
+        Boolean
+            True if a step was submitted
+        """
+        from apollo.db.database_worker import DataBaseWorker
+
+        Pending = self.Pending(Manager)
+        if not Pending:
+            return False
+        Messages = []
+
+        def Stepped(done: bool):
+            for message in Messages:
+                Slot(message)
+            Messages.clear()
+            if done:
+                Slot(f"Upgrading Library: {Pending[0]} Completed")
+                if Done is not None:
+                    Done(Pending[0])
+            self.Background(Manager, Slot, Error, Done)
+
+        DataBaseWorker.Instance().Submit(self.Step, Manager, Pending[0], Messages.append,
+                                         priority = DataBaseWorker.PRIORITY_WRITE, slot = Stepped, error = Error,
+                                         key = "schema tasks")
+        return True
+
+    @property
+    def Latest(self):
+        """
+        Returns
+        -------
+        int
+            schema version of a fully migrated database
+        """
+        return max(self.Migrations.keys(), default = 0)
+
+    @staticmethod
+    def Version(Manager):
+        """
+        Reads the schema version of the database
+
+        Parameters
+        ----------
+        Manager: DataBaseManager
+            manager connected to the database
+
+        Returns
+        -------
+        int
+            PRAGMA user_version of the database
+        """
+        return Manager.exec_query("PRAGMA user_version", 1)[0]
+
+    @staticmethod
+    def SetVersion(Manager, version: int):
+        """
+        Writes the schema version of the database
+
+        Parameters
+        ----------
+        Manager: DataBaseManager
+            manager connected to the database
+        version: int
+            schema version to store
+        """
+        Manager.exec_query(f"PRAGMA user_version = {int(version)}")
+
+    def Upgrade(self, Manager, force: bool = False, Slot: Callable = lambda x: ''):
+        """
+        Applies the pending migrations of the database
+
+        Parameters
+        ----------
+        Manager: DataBaseManager
+            manager connected to the database
+        force: bool, optional
+            applies every migration again, is used to repair a damaged schema, by default False
+        Slot: Callable, optional
+            Additional Callback with (arg: str) prameter, by default lambda:''
+
+        Returns
+        -------
+        List
+            names of the applied migrations
+
+        Raises
+        ------
+        ValueError
+            if the database was created by a newer schema
+        """
+        current = self.Version(Manager)
+        if current > self.Latest:
+            raise ValueError(f"Schema version {current} is newer than {self.Latest}")
+        if force:
+            current = 0
+
+        applied = []
+        for version in sorted(self.Migrations.keys()):
+            if version <= current:
+                continue
+            migration = self.Migrations[version]
+            Slot(f"Upgrading Library: {migration.name}")
+            migration.apply(Manager, Slot)
+            self.SetVersion(Manager, version)
+            applied.append(migration.name)
+        return applied
+
+    @staticmethod
+    def AddColumn(Manager, table: str, column: str, declaration: str = "TEXT"):
+        """
+        Adds a column to a table in place if it is missing, existing rows are not rewritten
+
+        Parameters
+        ----------
+        Manager: DataBaseManager
+            manager connected to the database
+        table: str
+            table to alter
+        column: str
+            name of the column
+        declaration: str, optional
+            type and constraints of the column, by default TEXT
+
+        Returns
+        -------
+        Boolean
+            True if the column was added
+        """
+        columns = Manager.exec_query(f"SELECT name FROM pragma_table_info({Manager.Quote(table)})", 1)
+        if column in columns:
+            return False
+        Manager.exec_query(f"ALTER TABLE {table} ADD COLUMN {column} {declaration}")
+        return True
+
+    @staticmethod
+    def Backfill(Manager, name: str, table: str, assignments: str, chunk_size: int = 2000,
+                 Slot: Callable = lambda x: ''):
+        """
+        Updates every row of a table in rowid ranges, each range in its own transaction.
+        The last finished rowid is kept in the schema_progress table, an interrupted backfill
+        resumes after it and the library stays usable in between.
+
+        Parameters
+        ----------
+        Manager: DataBaseManager
+            manager connected to the database
+        name: str
+            unique name of the backfill used to store its progress
+        table: str
+            table to update
+        assignments: str
+            SET clause of the update
+        chunk_size: int, optional
+            count of rows updated per transaction, by default 2000
+        Slot: Callable, optional
+            Additional Callback with (arg: str) prameter, by default lambda:''
+        """
+        Manager.exec_query("CREATE TABLE IF NOT EXISTS schema_progress(name TEXT PRIMARY KEY, cursor INTEGER)")
+        cursor = Manager.exec_query("SELECT cursor FROM schema_progress WHERE name = ?", 1, params = [name])
+        cursor = cursor[0] if cursor else 0
+        [total] = Manager.exec_query(f"SELECT count(*) FROM {table}", 1)
+
+        while True:
+            [end] = Manager.exec_query(f"""
+            SELECT IFNULL(max(rowid), 0) FROM (SELECT rowid FROM {table} WHERE rowid > ? ORDER BY rowid LIMIT ?)
+            """, 1, params = [cursor, chunk_size])
+            if not end:
+                break
+            with Manager.Transaction():
+                Manager.exec_query(f"UPDATE {table} SET {assignments} WHERE rowid > ? AND rowid <= ?",
+                                   params = [cursor, end])
+                Manager.exec_query("INSERT OR REPLACE INTO schema_progress(name, cursor) VALUES (?, ?)",
+                                   params = [name, end])
+            cursor = end
+            Slot(f"Upgrading Library: {name} {cursor}/{total}")
+        Manager.exec_query("DELETE FROM schema_progress WHERE name = ?", params = [name])
+
+    @staticmethod
+    def ProcessRows(Manager, name: str, table: str, columns: str, function: Callable, chunk_size: int = 500,
+                    Slot: Callable = lambda x: '', chunks: Union[int, None] = None,
+                    prepare: Union[Callable, None] = None, finish: Union[Callable, None] = None):
+        """
+        Calls a function with the rows of a table in rowid ranges, each range in its own
+        transaction, is used for changes that have to be computed in python. The progress is
+        kept like the one of Backfill and an interrupted run resumes after the last range.
+
+        Parameters
+        ----------
+        Manager: DataBaseManager
+            manager connected to the database
+        name: str
+            unique name of the run used to store its progress
+        table: str
+            table to read
+        columns: str
+            columns passed to the function after the rowid
+        function: Callable
+            called with (Manager, rows) inside the transaction of every range
+        chunk_size: int, optional
+            count of rows per transaction, by default 500
+        Slot: Callable, optional
+            Additional Callback with (arg: str) prameter, by default lambda:''
+        chunks: Union[int, None], optional
+            max count of ranges processed by the call, by default every range
+        prepare: Union[Callable, None], optional
+            called with (Manager, rows) before the transaction of every range, its result is
+            passed to the function, is used for slow work like reading files
+        finish: Union[Callable, None], optional
+            called with (Manager) in the transaction that removes the progress of the run
+
+        Returns
+        -------
+        Boolean
+            True once every row is processed, False if ranges are left
+        """
+        Manager.exec_query("CREATE TABLE IF NOT EXISTS schema_progress(name TEXT PRIMARY KEY, cursor INTEGER)")
+        cursor = Manager.exec_query("SELECT cursor FROM schema_progress WHERE name = ?", 1, params = [name])
+        cursor = cursor[0] if cursor else 0
+        [total] = Manager.exec_query(f"SELECT count(*) FROM {table}", 1)
+
+        processed = 0
+        while chunks is None or processed < chunks:
+            Rows = Manager.exec_query(f"SELECT rowid, {columns} FROM {table} WHERE rowid > ? ORDER BY rowid LIMIT ?",
+                                      params = [cursor, chunk_size])
+            if not Rows:
+                break
+            end = Rows[-1][0]
+            if prepare is not None:
+                Rows = prepare(Manager, Rows)
+            with Manager.Transaction():
+                function(Manager, Rows)
+                Manager.exec_query("INSERT OR REPLACE INTO schema_progress(name, cursor) VALUES (?, ?)",
+                                   params = [name, end])
+            cursor = end
+            processed += 1
+            Slot(f"Upgrading Library: {name} {cursor}/{total}")
+        else:
+            return False
+
+        with Manager.Transaction():
+            if finish is not None:
+                finish(Manager)
+            Manager.exec_query("DELETE FROM schema_progress WHERE name = ?", params = [name])
+        return True
+
+
+MIGRATIONS = MigrationRegistry()
+
+
+@MIGRATIONS.Register(1, "library table")
+def LibraryTable(Manager, Slot: Callable):
+    """
+    Creates the library table, columns missing from an older table are added in place
+    """
+    Manager.Create_LibraryTable()
+    for field in Manager.db_fields:
+        MIGRATIONS.AddColumn(Manager, "library", field, "INTEGER" if field in LIBRARY_INTEGER_FIELDS else "TEXT")
+
+
+@MIGRATIONS.Register(2, "numeric columns")
+def NumericColumns(Manager, Slot: Callable):
+    """
+    Prepares the conversion of a library table with the formatted text columns, the rows are copied by a task
+    """
+    if Manager.LibrarySchema_Outdated():
+        Manager.Prepare_NumericSchema()
+        MIGRATIONS.Schedule(Manager, "numeric columns")
+
+
+@MIGRATIONS.Task("numeric columns")
+def NumericColumnsTask(Manager, Slot: Callable):
+    """
+    Copies a chunk of the text library table into the numeric one, swaps the tables after the last one
+    """
+    return Manager.Migrate_NumericSchema(Slot = Slot, chunks = 1)
+
+
+@MIGRATIONS.Register(3, "secondary indexes")
+def SecondaryIndexes(Manager, Slot: Callable):
+    """
+    Creates the LIBRARY_INDEXES, an empty table is not analyzed as its statistics would mislead the planner
+    """
+    if Manager.Create_Indexes() and Manager.exec_query("SELECT EXISTS(SELECT 1 FROM library)", 1) == [1]:
+        Manager.Analyze("library")
+
+
+@MIGRATIONS.Register(4, "library statistics")
+def LibraryStatistics(Manager, Slot: Callable):
+    """
+    Creates the trigger maintained library statistics
+    """
+    Manager.Create_LibraryStats()
+
+
+@MIGRATIONS.Register(5, "full text search")
+def FullTextSearch(Manager, Slot: Callable):
+    """
+    Creates the full text search index over the library
+    """
+    Manager.Create_SearchIndex()
+
+
+@MIGRATIONS.Register(6, "now playing queue")
+def NowPlayingQueue(Manager, Slot: Callable):
+    """
+    Creates the now playing queue, a legacy nowplaying view is converted into queue rows
+    """
+    Manager.Create_NowPlaying()
+
+
+@MIGRATIONS.Register(7, "file fingerprints")
+def FileFingerprints(Manager, Slot: Callable):
+    """
+    Creates the fingerprint table used by rescans to skip unchanged files
+    """
+    Manager.Create_Fingerprints()
+
+
+@MIGRATIONS.Register(8, "payload file ids")
+def PayloadFileIDs(Manager, Slot: Callable):
+    """
+    Schedules the re-key of the tracks with the payload content ids, every file has to be
+    read so it runs as a task after startup
+    """
+    if Manager.exec_query("SELECT EXISTS(SELECT 1 FROM library)", 1) == [1]:
+        MIGRATIONS.Schedule(Manager, "payload file ids")
+
+
+@MIGRATIONS.Task("payload file ids")
+def PayloadFileIDsTask(Manager, Slot: Callable):
+    """
+    Re-keys a chunk of the tracks with the payload content ids of FileManager.FileHasher,
+    the files are hashed outside of the transaction. Tracks whose file is missing keep their
+    id, a folder that is missing (e.g. an unmounted drive) is only checked once. The audio
+    stored twice keeps its first row. Fingerprints of files that were merged into another
+    track by a colliding header hash are dropped after the last chunk so the next scan adds them.
+    """
+    from apollo.db.library_manager import FileManager
+    Hasher = FileManager()
+    Missing = set()
+
+    def Hash(Manager, Rows: list):
+        Hashed = []
+        for rowid, file_id, file_path in Rows:
+            folder = os.path.dirname(file_path or "")
+            if folder in Missing:
+                continue
+            try:
+                Hashed.append([rowid, file_id, Hasher.FileHasher(file_path)])
+            except OSError:
+                if not os.path.isdir(folder):
+                    Missing.add(folder)
+        return Hashed
+
+    def Rekey(Manager, Rows: list):
+        for rowid, file_id, new_id in Rows:
+            if new_id == file_id:
+                continue
+            if Manager.exec_query("SELECT EXISTS(SELECT 1 FROM library WHERE file_id = ?)", 1, params = [new_id]) == [1]:
+                Manager.exec_query("DELETE FROM library WHERE rowid = ? AND file_id = ?", params = [rowid, file_id])
+                continue
+            for table in ("library", "nowplaying_queue", "file_fingerprints"):
+                Manager.exec_query(f"UPDATE {table} SET file_id = ? WHERE file_id = ?", params = [new_id, file_id])
+
+    def Prune(Manager):
+        Manager.exec_query("""
+        DELETE FROM file_fingerprints
+        WHERE NOT EXISTS (
+            SELECT 1 FROM library WHERE library.file_id = file_fingerprints.file_id AND library.file_path = file_fingerprints.path
+        )""")
+
+    return MIGRATIONS.ProcessRows(Manager, "payload file ids", "library", "file_id, file_path", Rekey, chunk_size = 200,
+                                  Slot = Slot, chunks = 1, prepare = Hash, finish = Prune)
+
+
+@MIGRATIONS.Register(9, "scan jobs")
+def ScanJobs(Manager, Slot: Callable):
+    """
+    Creates the table keeping the checkpoints of resumable scans
+    """
+    Manager.Create_ScanJobs()
+
+
+@MIGRATIONS.Register(10, "scan errors")
+def ScanErrors(Manager, Slot: Callable):
+    """
+    Creates the table quarantining the files that failed to be read by a scan
+    """
+    Manager.Create_ScanErrors()
+
+
+@MIGRATIONS.Register(11, "scan job cursors")
+def ScanJobCursors(Manager, Slot: Callable):
+    """
+    Adds the cursors of the directories scanned side by side to the scan jobs
+    """
+    MIGRATIONS.AddColumn(Manager, "scan_jobs", "cursors", "TEXT")
@@ -0,0 +1,314 @@
+import bisect
+import datetime
+import os
+import re
+import sys
+import threading
+from collections import Counter, OrderedDict, deque
+from functools import lru_cache
+from typing import Callable, Union
+
+# upper bounds in ms of the latency histogram buckets, the last bucket holds everything slower
+HISTOGRAM_BOUNDS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+
+class StatementStats:
+    """
+    Aggregated timings of a single normalized statement
+    """
+    __slots__ = ("sql", "calls", "total_ms", "max_ms", "rows", "histogram", "call_sites")
+
+    def __init__(self, sql: str):
+        """
+        Class Constructor
+
+        Parameters
+        ----------
+        sql: str
+            normalized SQL text of the statement
+        """
+        self.sql = sql
+        self.calls = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.rows = 0
+        self.histogram = [0] * (len(HISTOGRAM_BOUNDS) + 1)
+        self.call_sites = Counter()
+
+    def Add(self, elapsed_ms: float, rows: int, call_site: str):
+        """
+        Adds a single execution to the stats
+
+        Parameters
+        ----------
+        elapsed_ms: float
+            execution time in ms
+        rows: int
+            rows returned or written by the execution
+        call_site: str
+            caller that ran the statement
+        """
+        self.calls += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        self.rows += rows
+        self.histogram[bisect.bisect_left(HISTOGRAM_BOUNDS, elapsed_ms)] += 1
+        self.call_sites[call_site] += 1
+
+    def Percentile(self, percent: float):
+        """
+        Estimates a latency percentile from the histogram
+
+        Parameters
+        ----------
+        percent: float
+            percentile between 0 and 100
+
+        Returns
+        -------
+        float
+            upper bound in ms of the bucket holding the percentile, the max latency for the last bucket
+        """
+        target = self.calls * percent / 100
+        seen = 0
+        for bucket, count in enumerate(self.histogram):
+            seen += count
+            if count and seen >= target:
+                return HISTOGRAM_BOUNDS[bucket] if bucket < len(HISTOGRAM_BOUNDS) else self.max_ms
+        return 0.0
+
+    def Summary(self):
+        """
+        Returns
+        -------
+        dict
+            stats of the statement as plain values
+        """
+        return {
+            "sql": self.sql,
+            "calls": self.calls,
+            "total_ms": round(self.total_ms, 3),
+            "avg_ms": round(self.total_ms / self.calls, 3) if self.calls else 0.0,
+            "p95_ms": self.Percentile(95),
+            "max_ms": round(self.max_ms, 3),
+            "rows": self.rows,
+            "histogram": dict(zip([*(f"<{B}ms" for B in HISTOGRAM_BOUNDS), "slower"], self.histogram)),
+            "call_sites": dict(self.call_sites.most_common())
+        }
+
+
+class QueryProfiler:
+    """
+    Collects the latency, row counts and call sites of every statement run by the
+    DataBaseManager. Statements are grouped by their normalized SQL text, literals are
+    replaced so queries built with f-strings fall into the same group.
+
+    Statements slower than the threshold are kept in a bounded slow query log together
+    with their EXPLAIN QUERY PLAN. At most MAX_STATEMENTS statements are kept, the least
+    recently run one is dropped first, so statements built with unbounded SQL text dont grow
+    the stats for the lifetime of the app.
+
+    The profiler is off by default, it is turned on for a debugging session.
+
+    >>> QueryProfiler.Configure(enabled = True, slow_ms = 50)
+    >>> print(QueryProfiler.Report(10))
+    """
+    ENABLED = False
+    SLOW_MS = 100.0
+    SLOW_LOG_SIZE = 200
+    MAX_STATEMENTS = 500
+    _lock = threading.Lock()
+    _statements = OrderedDict()
+    _slow_log = deque(maxlen = SLOW_LOG_SIZE)
+    # frames from these files are skipped when looking up who ran a statement
+    _internal = {os.path.normcase(os.path.join(os.path.dirname(__file__), name))
+                 for name in ("library_manager.py", "query_profiler.py", "database_worker.py")}
+
+    @classmethod
+    def Configure(cls, enabled: Union[bool, None] = None, slow_ms: Union[float, None] = None,
+                  slow_log_size: Union[int, None] = None, max_statements: Union[int, None] = None):
+        """
+        Changes the profiler settings, settings passed as None are kept
+
+        Parameters
+        ----------
+        enabled: Union[bool, None], optional
+            records statements if set
+        slow_ms: Union[float, None], optional
+            threshold in ms above which statements go to the slow query log
+        slow_log_size: Union[int, None], optional
+            count of slow statements kept, the oldest are dropped first
+        max_statements: Union[int, None], optional
+            count of statements kept, the least recently run are dropped first
+        """
+        with cls._lock:
+            if enabled is not None:
+                cls.ENABLED = bool(enabled)
+            if slow_ms is not None:
+                cls.SLOW_MS = float(slow_ms)
+            if slow_log_size is not None:
+                cls.SLOW_LOG_SIZE = int(slow_log_size)
+                cls._slow_log = deque(cls._slow_log, maxlen = cls.SLOW_LOG_SIZE)
+            if max_statements is not None:
+                cls.MAX_STATEMENTS = max(1, int(max_statements))
+                while len(cls._statements) > cls.MAX_STATEMENTS:
+                    cls._statements.popitem(last = False)
+
+    @staticmethod
+    @lru_cache(maxsize = 1024)
+    def Normalize(sql: str):
+        """
+        Normalizes the SQL text used to group statements
+
+        Parameters
+        ----------
+        sql: str
+            SQL text of the statement
+
+        Returns
+        -------
+        str
+            SQL text with string and numeric literals replaced by ? and collapsed whitespace
+        """
+        sql = re.sub(r"'(?:[^']|'')*'", "?", sql)
+        sql = re.sub(r"\b\d+(?:\.\d+)?\b", "?", sql)
+        sql = re.sub(r"\?(?:\s*,\s*\?)+", "?, ...", sql)
+        return " ".join(sql.split())
+
+    @classmethod
+    def CallSite(cls):
+        """
+        Finds the first caller outside of the DB layer
+
+        Returns
+        -------
+        str
+            file:line function of the caller
+        """
+        frame = sys._getframe(1)
+        while frame is not None:
+            filename = os.path.normcase(frame.f_code.co_filename)
+            if filename not in cls._internal and not filename.endswith("contextlib.py"):
+                return f"{os.path.basename(filename)}:{frame.f_lineno} {frame.f_code.co_name}"
+            frame = frame.f_back
+        return "unknown"
+
+    @classmethod
+    def Record(cls, sql: str, elapsed_ms: float, rows: int = 0, explain: Union[Callable, None] = None):
+        """
+        Records a single execution of a statement
+
+        Parameters
+        ----------
+        sql: str
+            SQL text of the statement
+        elapsed_ms: float
+            execution time in ms
+        rows: int, optional
+            rows returned or written by the execution, by default 0
+        explain: Union[Callable, None], optional
+            returns the query plan of the statement, only called for slow statements
+        """
+        if not cls.ENABLED:
+            return None
+        normalized = cls.Normalize(sql)
+        call_site = cls.CallSite()
+        with cls._lock:
+            stats = cls._statements.get(normalized)
+            if stats is None:
+                stats = cls._statements[normalized] = StatementStats(normalized)
+                if len(cls._statements) > cls.MAX_STATEMENTS:
+                    cls._statements.popitem(last = False)
+            else:
+                cls._statements.move_to_end(normalized)
+            stats.Add(elapsed_ms, rows, call_site)
+
+        if elapsed_ms >= cls.SLOW_MS:
+            plan = []
+            if explain is not None:
+                try:
+                    plan = explain()
+                except Exception as e:
+                    plan = [f"EXPLAIN failed: {e}"]
+            with cls._lock:
+                cls._slow_log.append({
+                    "time": datetime.datetime.now().isoformat(timespec = "seconds"),
+                    "sql": " ".join(sql.split()),
+                    "elapsed_ms": round(elapsed_ms, 3),
+                    "rows": rows,
+                    "call_site": call_site,
+                    "plan": plan
+                })
+
+    @classmethod
+    def Top(cls, count: int = 10, key: str = "total_ms"):
+        """
+        Gets the statements with the highest value of a stat
+
+        Parameters
+        ----------
+        count: int, optional
+            count of statements returned, by default 10
+        key: str, optional
+            stat to order by (total_ms, avg_ms, max_ms, calls or rows), by default total_ms
+
+        Returns
+        -------
+        list
+            summaries of the statements, highest first
+        """
+        with cls._lock:
+            summaries = [stats.Summary() for stats in cls._statements.values()]
+        return sorted(summaries, key = lambda summary: summary[key], reverse = True)[:count]
+
+    @classmethod
+    def SlowLog(cls):
+        """
+        Returns
+        -------
+        list
+            slow statements, oldest first
+        """
+        with cls._lock:
+            return list(cls._slow_log)
+
+    @classmethod
+    def Report(cls, count: int = 10):
+        """
+        Formats the top statements by total time and the slow query log as text
+
+        Parameters
+        ----------
+        count: int, optional
+            count of statements in the report, by default 10
+
+        Returns
+        -------
+        str
+            report to print or show in a debug window
+        """
+        lines = [f"Top {count} statements by total time",
+                 f"{'total ms':>10} {'calls':>7} {'avg ms':>9} {'p95 ms':>8} {'max ms':>9} {'rows':>8}  sql"]
+        for summary in cls.Top(count):
+            lines.append(f"{summary['total_ms']:>10.1f} {summary['calls']:>7} {summary['avg_ms']:>9.3f} "
+                         f"{summary['p95_ms']:>8} {summary['max_ms']:>9.1f} {summary['rows']:>8}  {summary['sql']}")
+            site, calls = next(iter(summary["call_sites"].items()))
+            lines.append(f"{'':>56}from {site} ({calls})")
+
+        slow_log = cls.SlowLog()
+        lines.append("")
+        lines.append(f"Slow statements over {cls.SLOW_MS} ms ({len(slow_log)})")
+        for entry in slow_log[-count:]:
+            lines.append(f"{entry['time']} {entry['elapsed_ms']:.1f} ms {entry['rows']} rows "
+                         f"from {entry['call_site']}: {entry['sql']}")
+            lines.extend([f"    {detail}" for detail in entry["plan"]])
+        return "\n".join(lines)
+
+    @classmethod
+    def Reset(cls):
+        """
+        Clears all the recorded stats and the slow query log
+        """
+        with cls._lock:
+            cls._statements.clear()
+            cls._slow_log.clear()
@@ -0,0 +1,313 @@
+import json
+import os
+import threading
+from typing import Callable, Iterable, Union
+
+
+class ScanJob:
+    """
+    Resumable scan of a list of directories.
+
+    The position of the job is stored in the scan_jobs table, the index of the directory
+    being scanned and the path of the last file commited in it. Checkpoints are written in the
+    transaction of every ingested chunk so the position always matches the rows in the
+    library, a job interrupted by a crash or by closing the app resumes after its last chunk.
+
+    Directories on different devices are scanned side by side, each of them keeps the last
+    file commited in it in the cursors of the job until all of them are done.
+
+    Pause, Cancel and Stop are checked between two files and can be called from any thread.
+    A stopped job stays unfinished and is resumed on the next launch, a cancelled one is not.
+
+    >>> Job = ScanJob(["D:\\music"], ["MP3", "FLAC"])
+    >>> Job.Run(Manager)
+    >>> for Job in ScanJob.Unfinished(Manager):
+    ...     Job.Run(Manager)
+    """
+    RUNNING = "running"
+    CANCELLED = "cancelled"
+    DONE = "done"
+
+    def __init__(self, dirs: list, include: list, job_id: Union[int, None] = None, dir_index: int = 0,
+                 cursor: Union[str, None] = None, chunks: int = 0, files: int = 0, state: str = RUNNING,
+                 cursors: Union[dict, None] = None):
+        """
+        Class Constructor
+
+        Parameters
+        ----------
+        dirs: list
+            directories to scan in order
+        include: list
+            File Extensions to look for
+        job_id: Union[int, None], optional
+            id of a stored job, a new job is stored when it is run
+        dir_index: int, optional
+            index of the directory being scanned, by default 0
+        cursor: Union[str, None], optional
+            last file commited in that directory, by default None
+        chunks: int, optional
+            count of commited chunks, by default 0
+        files: int, optional
+            count of commited files, by default 0
+        state: str, optional
+            state of the job, by default RUNNING
+        cursors: Union[dict, None], optional
+            {dir: last file commited in it} of the directories scanned side by side, by default None
+        """
+        self.Dirs = list(dirs)
+        self.Include = list(include)
+        self.JobID = job_id
+        self.DirIndex = dir_index
+        self.Cursor = cursor
+        self.Chunks = chunks
+        self.Files = files
+        self.State = state
+        self.Cursors = dict(cursors or {})
+
+        # cleared while the job is paused
+        self.Active = threading.Event()
+        self.Active.set()
+        self.Cancelled = threading.Event()
+        self.Stopped = threading.Event()
+
+    @classmethod
+    def Unfinished(cls, Manager):
+        """
+        Loads the jobs that were interrupted before they finished
+
+        Parameters
+        ----------
+        Manager: DataBaseManager
+            manager connected to the library
+
+        Returns
+        -------
+        list
+            ScanJob objects, oldest first
+        """
+        Jobs = Manager.exec_query("""
+        SELECT job_id, dirs, include, dir_index, cursor, chunks, files, cursors
+        FROM scan_jobs
+        WHERE state = ?
+        ORDER BY job_id
+        """, params = [cls.RUNNING])
+        return [cls(json.loads(dirs), json.loads(include), job_id, dir_index, cursor or None, chunks, files,
+                    cursors = json.loads(cursors) if cursors else None)
+                for job_id, dirs, include, dir_index, cursor, chunks, files, cursors in Jobs]
+
+    def Pause(self):
+        """
+        Pauses the job after the file being written
+        """
+        self.Active.clear()
+
+    def Resume(self):
+        """
+        Resumes a paused job
+        """
+        self.Active.set()
+
+    def Cancel(self):
+        """
+        Cancels the job after the file being written, it is not resumed
+        """
+        self.Cancelled.set()
+        self.Active.set()
+
+    def Stop(self):
+        """
+        Stops the job after the file being written, it is resumed by the next launch
+        """
+        self.Stopped.set()
+        self.Active.set()
+
+    def Halted(self):
+        """
+        Returns
+        -------
+        bool
+            True once the job is cancelled or stopped
+        """
+        return self.Cancelled.is_set() or self.Stopped.is_set()
+
+    def Wait(self, Abort: Union[threading.Event, None] = None):
+        """
+        Blocks while the job is paused
+
+        Parameters
+        ----------
+        Abort: Union[threading.Event, None], optional
+            ends the wait once it is set
+
+        Returns
+        -------
+        bool
+            False if the job is cancelled or stopped or the wait was aborted
+        """
+        while not self.Active.wait(0.1):
+            if Abort is not None and Abort.is_set():
+                return False
+        return not self.Halted()
+
+    def Guard(self, Entries: Iterable, Abort: Union[threading.Event, None] = None):
+        """
+        Passes on the entries of a walk until the job is halted, the walk waits while the job is paused
+
+        Parameters
+        ----------
+        Entries: Iterable
+            entries of the walk
+        Abort: Union[threading.Event, None], optional
+            ends the walk once it is set, is used when the consumer of the walk fails
+
+        Yields
+        ------
+        Any
+            entries of the walk
+        """
+        for Entry in Entries:
+            if not self.Wait(Abort):
+                return None
+            yield Entry
+
+    def Save(self, Manager):
+        """
+        Stores the job, a new job gets its job_id
+
+        Parameters
+        ----------
+        Manager: DataBaseManager
+            manager connected to the library
+        """
+        if self.JobID is None:
+            Manager.exec_query("""
+            INSERT INTO scan_jobs(state, dirs, include, dir_index, cursor, chunks, files, cursors)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, params = [self.State, json.dumps(self.Dirs), json.dumps(self.Include), self.DirIndex,
+                           self.Cursor, self.Chunks, self.Files, json.dumps(self.Cursors)])
+            self.JobID = Manager.exec_query("SELECT last_insert_rowid()", 1)[0]
+        else:
+            Manager.exec_query("""
+            UPDATE scan_jobs
+            SET state = ?, dir_index = ?, cursor = ?, chunks = ?, files = ?, cursors = ?, updated = CURRENT_TIMESTAMP
+            WHERE job_id = ?
+            """, params = [self.State, self.DirIndex, self.Cursor, self.Chunks, self.Files, json.dumps(self.Cursors),
+                           self.JobID])
+
+    def After(self, Dir: str):
+        """
+        Parameters
+        ----------
+        Dir: str
+            directory of the job
+
+        Returns
+        -------
+        Union[str, None]
+            last file commited in the directory, its walk resumes after it
+        """
+        if Dir in self.Cursors:
+            return self.Cursors[Dir]
+        return self.Cursor if self.DirIndex < len(self.Dirs) and Dir == self.Dirs[self.DirIndex] else None
+
+    def Checkpoint(self, Manager, cursor: Union[str, dict], files: int):
+        """
+        Moves the job past a commited chunk, is called in the transaction of the chunk
+
+        Parameters
+        ----------
+        Manager: DataBaseManager
+            manager connected to the library
+        cursor: Union[str, dict]
+            path of the last file of the chunk, or {dir: path of its last file} of directories scanned side by side
+        files: int
+            count of files in the chunk
+        """
+        if isinstance(cursor, dict):
+            self.Cursors.update(cursor)
+        else:
+            self.Cursor = cursor
+            self.Cursors.pop(self.Dirs[self.DirIndex], None)
+        self.Chunks += 1
+        self.Files += files
+        self.Save(Manager)
+
+    def Run(self, Manager, Slot: Callable = lambda x: '', chunk_rows: Union[int, None] = None,
+            chunk_bytes: Union[int, None] = None, workers: Union[int, None] = None,
+            stages: Union[dict, None] = None, progress = None, prune: bool = False,
+            device_threads: Union[int, None] = None):
+        """
+        Scans the directories of the job from its position until it is done or halted
+
+        Parameters
+        ----------
+        Manager: FileManager
+            manager connected to the library, owned by the calling thread
+        Slot: Callable, optional
+            Additional Callback with (arg: str) prameter, by default lambda:''
+        chunk_rows: Union[int, None], optional
+            max count of rows per chunk, by default INGEST_CHUNK_ROWS
+        chunk_bytes: Union[int, None], optional
+            max estimated size of a chunk, by default INGEST_CHUNK_BYTES
+        workers: Union[int, None], optional
+            count of worker processes parsing the files, by default SCAN_WORKERS
+        stages: Union[dict, None], optional
+            {stage: threads} of the scan pipeline overriding SCAN_STAGES
+        progress: Union[ScanProgress, None], optional
+            gets the counts of the scan, the files left to scan are pre-counted for its ETA
+        prune: bool, optional
+            removes the tracks of missing files below every scanned directory, by default False
+        device_threads: Union[int, None], optional
+            max threads of a stage reading a device, 0 scans the directories one after another,
+            by default SCAN_DEVICE_THREADS
+
+        Returns
+        -------
+        str
+            state of the job, RUNNING if it was stopped and has to be resumed
+        """
+        self.Save(Manager)
+        if progress is not None:
+            progress.Precount([(Dir, self.After(Dir)) for Dir in self.Dirs[self.DirIndex:]], self.Include)
+        device_threads = Manager.SCAN_DEVICE_THREADS if device_threads is None else device_threads
+        Remaining = self.Dirs[self.DirIndex:]
+        if (device_threads and all([os.path.isdir(Dir) for Dir in Remaining])
+                and len(Manager.DeviceGroups(Remaining)) > 1):
+            # the devices are read side by side, an unavailable directory is left to the serial scan below
+            Manager.ScanDirectory(Remaining, self.Include, Slot, chunk_rows, chunk_bytes, workers, stages = stages,
+                                  job = self, progress = progress, device_threads = device_threads)
+            if not self.Halted():
+                for Dir in Remaining if prune else []:
+                    Manager.PruneMissing(Dir, Slot)
+                self.DirIndex = len(self.Dirs)
+                self.Cursor = None
+                self.Cursors = {}
+                self.Save(Manager)
+        while self.DirIndex < len(self.Dirs) and not self.Halted():
+            Dir = self.Dirs[self.DirIndex]
+            if not os.path.isdir(Dir):
+                # an unmounted drive is retried by the next launch instead of being skipped
+                Slot(f"Scan Paused: {Dir} is not available")
+                if progress is not None:
+                    progress.Finish()
+                return self.State
+            Manager.ScanDirectory(Dir, self.Include, Slot, chunk_rows, chunk_bytes, workers, stages = stages, job = self,
+                                  progress = progress)
+            if self.Halted():
+                break
+            if prune:
+                Manager.PruneMissing(Dir, Slot)
+            self.DirIndex += 1
+            self.Cursor = None
+            self.Cursors.pop(Dir, None)
+            self.Save(Manager)
+
+        if self.Cancelled.is_set():
+            self.State = self.CANCELLED
+        elif not self.Stopped.is_set():
+            self.State = self.DONE
+        self.Save(Manager)
+        if progress is not None:
+            progress.Finish()
+        return self.State
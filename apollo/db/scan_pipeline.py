@@ -0,0 +1,385 @@
+import queue
+import threading
+import time
+from typing import Callable, Iterable, Union
+
+
+class Stage:
+    """
+    Step of a ScanPipeline, its function is run by a pool of threads reading from the
+    bounded queue of the stage. The function returns the item passed to the next stage
+    or None to drop the item.
+
+    A stage with a batch size gets up to batch of the queued items at once, without waiting
+    for more, and returns a list of their results in the same order.
+    """
+
+    def __init__(self, name: str, function: Callable, workers: int = 1, queue_size: int = 256, batch: int = 1):
+        """
+        Class Constructor
+
+        Parameters
+        ----------
+        name: str
+            name of the stage used in the stats
+        function: Callable
+            called with every item, returns the item for the next stage or None to drop it
+        workers: int, optional
+            count of threads running the function, by default 1
+        queue_size: int, optional
+            max count of items waiting for the stage, by default 256
+        batch: int, optional
+            max count of items the function is called with, by default 1 for a single item
+        """
+        self.name = name
+        self.function = function
+        self.workers = max(1, int(workers))
+        self.batch = max(1, int(batch))
+        self.queue = queue.Queue(maxsize = queue_size)
+        self.lock = threading.Lock()
+        self.running = self.workers
+        self.items = 0
+        self.dropped = 0
+        self.busy = 0.0
+
+    def Count(self, elapsed: float, dropped: bool):
+        """
+        Adds a processed item to the counters
+
+        Parameters
+        ----------
+        elapsed: float
+            seconds spent in the function
+        dropped: bool
+            True if the item was dropped
+        """
+        with self.lock:
+            self.items += 1
+            self.dropped += dropped
+            self.busy += elapsed
+
+    def Stats(self, elapsed: float):
+        """
+        Parameters
+        ----------
+        elapsed: float
+            seconds the pipeline has been running
+
+        Returns
+        -------
+        dict
+            counters of the stage, utilization is the busy share of its threads
+        """
+        with self.lock:
+            return {
+                "stage": self.name,
+                "workers": self.workers,
+                "items": self.items,
+                "dropped": self.dropped,
+                "busy_s": round(self.busy, 3),
+                "rate": round(self.items / elapsed, 1) if elapsed else 0.0,
+                "utilization": round(self.busy / (elapsed * self.workers), 3) if elapsed else 0.0,
+                "queued": self.queue.qsize()
+            }
+
+
+class ScanPipeline:
+    """
+    Runs items from a source through a chain of stages on their own threads, connected by
+    bounded queues, so a slow disk and a slow parser overlap instead of adding up. Items are
+    yielded in the order of the source no matter how many threads a stage has, at most
+    window items are between the source and the consumer.
+
+    The stats of the stages show which of them limits a run, the stage with the highest
+    utilization is the bottleneck.
+
+    >>> Pipeline = ScanPipeline(Paths, [Stage("hash", Hasher, 4), Stage("parse", Parser, 2)])
+    >>> for Row in Pipeline:
+    ...     Insert(Row)
+    >>> print(Pipeline.Report())
+    """
+    # ends the worker threads of a stage
+    _DONE = object()
+
+    def __init__(self, Source: Iterable, Stages: list, window: Union[int, None] = None):
+        """
+        Class Constructor
+
+        Parameters
+        ----------
+        Source: Iterable
+            items fed into the first stage, is read on its own thread
+        Stages: list
+            Stage objects in the order they are run
+        window: Union[int, None], optional
+            max count of items in flight, by default the capacity of the queues and threads
+        """
+        self.Source = Source
+        self.Stages = Stages
+        self.Output = queue.Queue()
+        window = window or sum([S.queue.maxsize + S.workers for S in Stages])
+        self.Window = threading.Semaphore(window)
+        self.Stopped = threading.Event()
+        self.Error = None
+        self.Threads = []
+        self.SourceStats = Stage("source", None)
+        self.Started = None
+        self.Finished = None
+
+    def Put(self, target: queue.Queue, item):
+        """
+        Puts an item on a bounded queue, gives up once the pipeline is stopped
+
+        Returns
+        -------
+        bool
+            True if the item was queued
+        """
+        while not self.Stopped.is_set():
+            try:
+                target.put(item, timeout = 0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def Fail(self, error: BaseException):
+        """
+        Stops the pipeline with the first error, it is raised to the consumer
+        """
+        if self.Error is None:
+            self.Error = error
+        self.Stopped.set()
+        self.Output.put(self._DONE)
+
+    def Feed(self):
+        """
+        Reads the source and numbers its items, is run on the source thread
+        """
+        First = self.Stages[0].queue if self.Stages else self.Output
+        try:
+            Source = iter(self.Source)
+            seq = 0
+            while not self.Stopped.is_set():
+                while not self.Window.acquire(timeout = 0.1):
+                    if self.Stopped.is_set():
+                        return None
+                start = time.perf_counter()
+                try:
+                    item = next(Source)
+                except StopIteration:
+                    self.Window.release()
+                    break
+                self.SourceStats.Count(time.perf_counter() - start, False)
+                if not self.Put(First, (seq, item)):
+                    return None
+                seq += 1
+            for _ in range(self.Stages[0].workers if self.Stages else 1):
+                self.Put(First, self._DONE)
+        except BaseException as e:
+            self.Fail(e)
+
+    def Work(self, index: int):
+        """
+        Runs the function of a stage on the items of its queue, is run on the stage threads
+
+        Parameters
+        ----------
+        index: int
+            index of the stage
+        """
+        Current = self.Stages[index]
+        Next = self.Stages[index + 1].queue if index + 1 < len(self.Stages) else self.Output
+        try:
+            while not self.Stopped.is_set():
+                try:
+                    Entry = Current.queue.get(timeout = 0.1)
+                except queue.Empty:
+                    continue
+                if Entry is self._DONE:
+                    break
+                Entries = [Entry]
+                done = False
+                while len(Entries) < Current.batch:
+                    try:
+                        Entry = Current.queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if Entry is self._DONE:
+                        done = True
+                        break
+                    Entries.append(Entry)
+
+                start = time.perf_counter()
+                if Current.batch > 1:
+                    items = Current.function([item for _, item in Entries])
+                else:
+                    items = [Current.function(Entries[0][1])]
+                elapsed = (time.perf_counter() - start) / len(Entries)
+                for (seq, _), item in zip(Entries, items):
+                    Current.Count(elapsed, item is None)
+                    if item is None:
+                        # dropped items skip the later stages, the consumer only needs their seq
+                        self.Output.put((seq, None))
+                    elif not self.Put(Next, (seq, item)):
+                        return None
+                if done:
+                    break
+            with Current.lock:
+                Current.running -= 1
+                last = Current.running == 0
+            if last:
+                for _ in range(self.Stages[index + 1].workers if index + 1 < len(self.Stages) else 1):
+                    self.Put(Next, self._DONE)
+        except BaseException as e:
+            self.Fail(e)
+
+    def Start(self):
+        """
+        Starts the source and stage threads
+        """
+        self.Started = time.perf_counter()
+        self.Threads = [threading.Thread(target = self.Feed, name = "ScanPipeline.source", daemon = True)]
+        for index, S in enumerate(self.Stages):
+            self.Threads.extend([threading.Thread(target = self.Work, args = (index,), daemon = True,
+                                                  name = f"ScanPipeline.{S.name}.{W}") for W in range(S.workers)])
+        for Thread in self.Threads:
+            Thread.start()
+
+    def Stop(self):
+        """
+        Stops every thread of the pipeline and waits for them
+        """
+        self.Stopped.set()
+        for Thread in self.Threads:
+            Thread.join()
+        if self.Finished is None and self.Started is not None:
+            self.Finished = time.perf_counter()
+
+    def __iter__(self):
+        """
+        Runs the pipeline and yields the items that made it through every stage in the
+        order of the source, the pipeline is stopped when the loop ends or breaks
+
+        Yields
+        ------
+        Any
+            result of the last stage
+
+        Raises
+        ------
+        BaseException
+            the first error raised by the source or a stage
+        """
+        self.Start()
+        Buffer = {}
+        expected = 0
+        try:
+            while True:
+                Entry = self.Output.get()
+                if Entry is self._DONE:
+                    break
+                seq, item = Entry
+                Buffer[seq] = item
+                while expected in Buffer:
+                    item = Buffer.pop(expected)
+                    expected += 1
+                    self.Window.release()
+                    if item is not None:
+                        yield item
+            if self.Error is not None:
+                raise self.Error
+        finally:
+            self.Stop()
+
+    @staticmethod
+    def Merge(Pipelines: list, Abort: threading.Event, queue_size: int = 256):
+        """
+        Runs pipelines side by side, each iterated on its own thread, and yields their items
+        as they arrive. The items of one pipeline keep their order, the pipelines are
+        interleaved. Is used as the Source of a pipeline shared by the merged ones.
+
+        Parameters
+        ----------
+        Pipelines: list
+            ScanPipeline objects to merge
+        Abort: threading.Event
+            stops the merged pipelines once it is set, is the Stopped event of the consumer
+        queue_size: int, optional
+            max count of merged items waiting for the consumer, by default 256
+
+        Yields
+        ------
+        Any
+            items of the merged pipelines
+
+        Raises
+        ------
+        BaseException
+            the first error raised by a merged pipeline
+        """
+        Merged = queue.Queue(maxsize = queue_size)
+        # ends the feed of a merged pipeline, carries its error if it failed
+        Done = object()
+
+        def Feed(Pipeline: ScanPipeline):
+            Items = iter(Pipeline)
+            try:
+                for item in Items:
+                    while not Abort.is_set():
+                        try:
+                            Merged.put(item, timeout = 0.1)
+                            break
+                        except queue.Full:
+                            continue
+                    if Abort.is_set():
+                        break
+                Merged.put((Done, None))
+            except BaseException as e:
+                Merged.put((Done, e))
+            finally:
+                Items.close()
+
+        Threads = [threading.Thread(target = Feed, args = (Pipeline,), daemon = True, name = f"ScanPipeline.merge.{N}")
+                   for N, Pipeline in enumerate(Pipelines)]
+        for Thread in Threads:
+            Thread.start()
+        running = len(Threads)
+        while running:
+            try:
+                item = Merged.get(timeout = 0.1)
+            except queue.Empty:
+                if Abort.is_set():
+                    return None
+                continue
+            if isinstance(item, tuple) and len(item) == 2 and item[0] is Done:
+                running -= 1
+                if item[1] is not None:
+                    raise item[1]
+                continue
+            yield item
+
+    def Stats(self):
+        """
+        Returns
+        -------
+        list
+            counters of the source and every stage in pipeline order
+        """
+        End = self.Finished if self.Finished is not None else time.perf_counter()
+        elapsed = (End - self.Started) if self.Started is not None else 0.0
+        return [self.SourceStats.Stats(elapsed), *[S.Stats(elapsed) for S in self.Stages]]
+
+    def Report(self):
+        """
+        Formats the stats of the stages as a single line, the busiest stage is marked
+
+        Returns
+        -------
+        str
+            stats of the stages
+        """
+        Stats = self.Stats()
+        Busiest = max(Stats, key = lambda S: S["utilization"])["stage"]
+        return ", ".join([f"{S['stage']}{'*' if S['stage'] == Busiest else ''} {S['items']} items "
+                          f"{S['rate']}/s {S['utilization']:.0%} busy x{S['workers']}" for S in Stats])
@@ -0,0 +1,168 @@
+import datetime
+import os
+import threading
+import time
+from typing import Union
+
+from PySide6 import QtCore
+
+
+class ScanProgress(QtCore.QObject):
+    """
+    Collects the progress of a scan from its threads and reports it at a limited rate.
+
+    The stages of the scan only add to the counters, the updates are emitted at most rate
+    times per second through signals, so a GUI connected to them gets queued and coalesced
+    updates on its own thread instead of one call per file from the scanner. A pre-count of
+    the files to scan runs alongside the scan on its own thread and gives the ETA.
+
+    >>> Progress = ScanProgress(rate = 4)
+    >>> Progress.StatusChanged.connect(statusBar.showMessage)
+    >>> Manager.ScanDirectory("D:\\music", ["MP3"], Progress.Message, progress = Progress)
+    """
+    RATE = 4
+    COUNTERS = ("seen", "parsed", "skipped", "failed", "bytes")
+
+    Updated = QtCore.Signal(dict)
+    StatusChanged = QtCore.Signal(str)
+
+    def __init__(self, rate: Union[float, None] = None, parent: Union[QtCore.QObject, None] = None):
+        """
+        Class Constructor
+
+        Parameters
+        ----------
+        rate: Union[float, None], optional
+            max count of updates per second, by default RATE
+        parent: Union[QtCore.QObject, None], optional
+            parent object of the progress, by default None
+        """
+        super().__init__(parent)
+        self.Interval = 1 / (rate or self.RATE)
+        self.Lock = threading.Lock()
+        self.Counters = dict.fromkeys(self.COUNTERS, 0)
+        self.Status = ""
+        self.Total = None
+        self.Started = time.monotonic()
+        self.Emitted = 0.0
+        self.Counting = None
+
+    def Add(self, **counts: int):
+        """
+        Adds to the counters, is called by the scan threads
+
+        Parameters
+        ----------
+        counts: int
+            increments of the counters by name, seen, parsed, skipped, failed or bytes
+        """
+        with self.Lock:
+            for name, count in counts.items():
+                self.Counters[name] += count
+        self.Emit()
+
+    def Message(self, message: str):
+        """
+        Sets the status message of the scan, can be used as the Slot of a scan
+
+        Parameters
+        ----------
+        message: str
+            status message
+        """
+        with self.Lock:
+            self.Status = message
+        self.Emit()
+
+    def Snapshot(self):
+        """
+        Returns
+        -------
+        dict
+            counters, status message, total from the pre-count, elapsed seconds, rate in files per second and the ETA in seconds
+        """
+        with self.Lock:
+            Snapshot = dict(self.Counters, status = self.Status, total = self.Total)
+        elapsed = time.monotonic() - self.Started
+        Snapshot["elapsed"] = elapsed
+        Snapshot["rate"] = Snapshot["seen"] / elapsed if elapsed else 0.0
+        Snapshot["eta"] = None
+        if Snapshot["total"] is not None and Snapshot["rate"]:
+            Snapshot["eta"] = max(Snapshot["total"] - Snapshot["seen"], 0) / Snapshot["rate"]
+        return Snapshot
+
+    def Emit(self, force: bool = False):
+        """
+        Emits an update unless the last one is more recent than the interval
+
+        Parameters
+        ----------
+        force: bool, optional
+            emits irrespective of the interval, by default False
+        """
+        now = time.monotonic()
+        with self.Lock:
+            if not force and now - self.Emitted < self.Interval:
+                return None
+            self.Emitted = now
+        Snapshot = self.Snapshot()
+        self.Updated.emit(Snapshot)
+        self.StatusChanged.emit(self.Format(Snapshot))
+
+    def Finish(self):
+        """
+        Emits the final counters of the scan
+        """
+        self.Emit(force = True)
+
+    @staticmethod
+    def Format(Snapshot: dict):
+        """
+        Formats a snapshot as a status bar message
+
+        Parameters
+        ----------
+        Snapshot: dict
+            snapshot of the progress
+
+        Returns
+        -------
+        str
+            status message followed by the counters
+        """
+        seen = f"{Snapshot['seen']}/{Snapshot['total']}" if Snapshot["total"] is not None else f"{Snapshot['seen']}"
+        Parts = [f"{seen} Files", f"{Snapshot['parsed']} Read", f"{Snapshot['skipped']} Unchanged"]
+        if Snapshot["failed"]:
+            Parts.append(f"{Snapshot['failed']} Failed")
+        Parts.append(f"{Snapshot['bytes'] / 1024 ** 2:.1f} MB")
+        Parts.append(f"{Snapshot['rate']:.0f} Files/s")
+        if Snapshot["eta"] is not None:
+            Parts.append(f"ETA {datetime.timedelta(seconds = round(Snapshot['eta']))}")
+        return " | ".join([Part for Part in [Snapshot["status"], ", ".join(Parts)] if Part])
+
+    def Precount(self, Walks: list, include: list):
+        """
+        Counts the files to scan on a background thread, only the directories are listed and no
+        file is stat'ed, so the count is done long before the scan. The ETA is given once it is done.
+
+        Parameters
+        ----------
+        Walks: list
+            (dir, resume path or None) of the directories to scan, see FileManager.WalkEntries
+        include: list
+            File Extensions to look for
+        """
+        from apollo.db.library_manager import FileManager
+
+        def Count():
+            Total = 0
+            for Dir, After in Walks:
+                for Entry in FileManager.WalkEntries(Dir, After = After):
+                    if (os.path.splitext(Entry.name)[1]).upper().replace(".", "") in include:
+                        Total += 1
+            with self.Lock:
+                self.Total = Total
+            self.Emit(force = True)
+
+        self.Counting = threading.Thread(target = Count, name = "ScanProgress.Precount", daemon = True)
+        self.Counting.start()
@@ -1,5 +1,5 @@
 import json
-import os, sys, datetime
+import os, sys
 from pathlib import Path
 
 from mutagen import easyid3
@@ -53,11 +53,11 @@ class MP3:
         metadata['track_gain'] = Media.info.track_gain
         metadata['track_peak'] = Media.info.track_peak
         metadata['version'] = Media.info.version
-        metadata['sample_rate'] = f"{Media.info.sample_rate}Hz"
-        metadata["length"] = str(datetime.timedelta(seconds = Media.info.length))
-        metadata["bitrate"] = f"{int(Media.info.bitrate / 1000)} Kbps"
+        metadata['sample_rate'] = Media.info.sample_rate
+        metadata["length"] = int(round(Media.info.length * 1000))
+        metadata["bitrate"] = Media.info.bitrate
         metadata['channels'] = Media.info.channels
-        metadata["filesize"] = f"{round(os.path.getsize(Media.filename) * 0.00000095367432, 2)} Mb"
+        metadata["filesize"] = os.path.getsize(Media.filename)
         metadata["file_name"] = os.path.split(Media.filename)[1]
         metadata["file_path"] = Media.filename
         metadata["rating"] = 0
@@ -87,11 +87,11 @@ class WAVE:
             metadata[key] = Media.get(key, [""])[0]
 
         Media = mutagen.File(self.FILEPATH, easy = True)
-        metadata['sample_rate'] = f"{Media.info.sample_rate}Hz"
-        metadata["length"] = str(datetime.timedelta(seconds = Media.info.length))
-        metadata["bitrate"] = f"{int(Media.info.bitrate / 1000)} Kbps"
+        metadata['sample_rate'] = Media.info.sample_rate
+        metadata["length"] = int(round(Media.info.length * 1000))
+        metadata["bitrate"] = Media.info.bitrate
         metadata['channels'] = Media.info.channels
-        metadata["filesize"] = f"{round(os.path.getsize(Media.filename) * 0.00000095367432, 2)} Mb"
+        metadata["filesize"] = os.path.getsize(Media.filename)
         metadata["file_name"] = os.path.split(Media.filename)[1]
         metadata["file_path"] = Media.filename
         metadata["rating"] = 0
@@ -121,11 +121,11 @@ class FLAC:
             metadata[key] = Media.get(key, [""])[0]
 
         metadata['encoder_info'] = Media.get("encoder", [""])[0]
-        metadata['sample_rate'] = f"{Media.info.sample_rate}Hz"
-        metadata["length"] = str(datetime.timedelta(seconds = Media.info.length))
-        metadata["bitrate"] = f"{int(Media.info.bitrate / 1000)} Kbps"
+        metadata['sample_rate'] = Media.info.sample_rate
+        metadata["length"] = int(round(Media.info.length * 1000))
+        metadata["bitrate"] = Media.info.bitrate
         metadata['channels'] = Media.info.channels
-        metadata["filesize"] = f"{round(os.path.getsize(Media.filename) * 0.00000095367432, 2)} Mb"
+        metadata["filesize"] = os.path.getsize(Media.filename)
         metadata["file_name"] = os.path.split(Media.filename)[1]
         metadata["file_path"] = Media.filename
         metadata["rating"] = 0
@@ -154,11 +154,11 @@ class MP4:
             metadata[key] = Media.get(key, [""])[0]
         metadata['encoder_info'] = Media.info.codec_description
         metadata['encoder_settings'] = Media.info.codec
-        metadata['sample_rate'] = f"{Media.info.sample_rate}Hz"
-        metadata["length"] = str(datetime.timedelta(seconds = Media.info.length))
-        metadata["bitrate"] = f"{int(Media.info.bitrate / 1000)} Kbps"
+        metadata['sample_rate'] = Media.info.sample_rate
+        metadata["length"] = int(round(Media.info.length * 1000))
+        metadata["bitrate"] = Media.info.bitrate
         metadata['channels'] = Media.info.channels
-        metadata["filesize"] = f"{round(os.path.getsize(Media.filename) * 0.00000095367432, 2)} Mb"
+        metadata["filesize"] = os.path.getsize(Media.filename)
         metadata["file_name"] = os.path.split(Media.filename)[1]
         metadata["file_path"] = Media.filename
         metadata["rating"] = 0
@@ -463,12 +463,39 @@ class ConfigManager:
             "LIBRARY_GROUPORDER": "file_path",
             "ACTIVETHEME": "GRAY_100",
             "CURRENT_DB": "Default",
+            "LIBRARY_SCAN": {
+                "chunk_rows": 500,
+                "chunk_bytes": 8388608,
+                "workers": 0,
+                "progress_rate": 4,
+                "prune": True,
+                "device_threads": 2,
+                "stages": {
+                    "filter": 1,
+                    "fingerprint": 1,
+                    "hash": 2,
+                    "parse": 2
+                }
+            },
+            "LIBRARY_WATCH": {
+                "enabled": True,
+                "debounce_ms": 2000,
+                "batch_dirs": 32
+            },
+            "QUERY_PROFILER": {
+                "enabled": False,
+                "slow_ms": 100,
+                "slow_log_size": 200,
+                "max_statements": 500
+            },
             "MONITERED_DB": {
                 "Default": {
                     "name": "Default",
                     "db_loc": os.path.join(PARENT_DIR, 'db', 'default.db'),
                     "file_mon": [],
-                    "filters": [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1]
+                    "filters": [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
+                    "profile": "interactive",
+                    "pragmas": {}
                 }
             }
         }
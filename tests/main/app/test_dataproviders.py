@@ -5,7 +5,7 @@ import sys
 
 from apollo.app.dataproviders import SQLTableModel
 from apollo.db import DataBaseManager
-from tests.testing_tools.tools import Gen_DbTable_Data, del_TempFilled_DB, TempFilled_DB
+from tests.testing_tools.tools import Gen_DbTable_Data, del_TempFilled_DB, TempFilled_DB, DBManager_Filled
 
 @pytest.fixture
 def getSQLModel(TempFilled_DB):
@@ -15,6 +15,22 @@ def getSQLModel(TempFilled_DB):
     Model.LoadTable("library")
     return (Model, Manager, Table)
 
+@pytest.fixture
+def getFilledModel(DBManager_Filled):
+    Manager = DBManager_Filled
+    Model = SQLTableModel(Manager, QtWidgets.QTableView())
+    Model.LoadTable("library")
+
+    # records the cells that are repainted and the rows that are removed
+    Model.Changed, Model.Removed = [], []
+    Model.dataChanged.connect(lambda TopLeft, BottomRight, *args: Model.Changed.append((TopLeft.row(), TopLeft.column())))
+    Model.rowsRemoved.connect(lambda Parent, First, Last: Model.Removed.append((First, Last)))
+    return (Model, Manager)
+
+def ModelItems(Model):
+    return {Model.item(Row, 0).text(): [Model.item(Row, Col) for Col in range(Model.columnCount())]
+            for Row in range(Model.rowCount())}
+
 #### Tests ####################################################################
 class Test_SQLTableModel:
 
@@ -58,5 +74,44 @@ class Test_SQLTableModel:
 
         assert Table == Model.Data_atIndex(View.selectedIndexes())
 
+    def test_RefreshRows(self, getFilledModel):
+        Model, Manager = getFilledModel
+        Rating = Model.DB_FIELDS.index("rating")
+        Items = ModelItems(Model)
+
+        # a few keys are looked up with findItems, only the rated cells change
+        Model.UpdateTrack_Rating([Model.index(3, 0), Model.index(4, 0)], 4)
+        assert [(3, Rating), (4, Rating)] == sorted(Model.Changed)
+        assert ["4", "4"] == Model.Data_atIndex(Rows = [3, 4], Columns = [Rating])
+        assert Items == ModelItems(Model)
+
+        # many keys take the full scan, unknown keys are skipped
+        Model.Changed.clear()
+        Manager.exec_query("UPDATE library SET album = 'changed' WHERE file_id = 'file_idX7'")
+        Keys = ["file_idX7", "file_idX3"] + [f"missing{Key}" for Key in range(70)]
+        assert {"file_idX7": [7], "file_idX3": [3]} == Model.Rows_forKeys(Keys)
+        Model.RefreshRows(Keys)
+        assert [(7, Model.DB_FIELDS.index("album"))] == Model.Changed
+        assert Items == ModelItems(Model)
+
+    def test_RemoveKeys(self, getFilledModel):
+        Model, Manager = getFilledModel
+        Items = ModelItems(Model)
+
+        # consecutive rows are removed with a single call
+        Model.RemoveKeys(["file_idX2", "file_idX3", "file_idX4", "file_idX9", "missing"])
+        assert [(9, 9), (2, 4)] == Model.Removed
+        for Key in ["file_idX2", "file_idX3", "file_idX4", "file_idX9"]:
+            del Items[Key]
+        assert Items == ModelItems(Model)
+
+        Model.Removed.clear()
+        Model.RemoveKeys(["file_idX0", "file_idX1", "file_idX19"] + [f"missing{Key}" for Key in range(70)])
+        assert [(15, 15), (0, 1)] == Model.Removed
+        for Key in ["file_idX0", "file_idX1", "file_idX19"]:
+            del Items[Key]
+        assert Items == ModelItems(Model)
+        assert [] == Model.Changed
+
 
 class Test_ApolloDataProvider: ...
@@ -0,0 +1,100 @@
+import threading
+import time
+
+import pytest
+from PySide6 import QtCore
+
+from apollo.db import DataBaseWorker
+from tests.testing_tools.tools import Gen_DbTable_Data, TempFilled_DB, del_TempFilled_DB
+
+
+def WaitFor(Condition, timeout = 5):
+    """
+    Runs the event loop until the condition is met so queued results are dispatched
+    """
+    End = time.time() + timeout
+    while not Condition() and time.time() < End:
+        QtCore.QCoreApplication.processEvents()
+        time.sleep(0.005)
+    return Condition()
+
+
+#### Tests ####################################################################
+class Test_DataBaseWorker:
+
+    @classmethod
+    def setup_class(cls):
+        if not QtCore.QCoreApplication.instance():
+            cls.App = QtCore.QCoreApplication()
+
+    @classmethod
+    def teardown_class(cls):
+        DataBaseWorker.Shutdown()
+        del_TempFilled_DB()
+
+    def test_Submit(self, TempFilled_DB):
+        Manager, Data = TempFilled_DB
+        Worker = DataBaseWorker.Instance()
+        Results = []
+
+        # queries run on the worker connection and results are dispatched to the slot
+        Future = Worker.Submit(Manager.exec_query, "SELECT count(*) FROM library", 1, slot = Results.append)
+        assert [len(Data["file_id"])] == Future.result(timeout = 5)
+        assert WaitFor(lambda: Results == [[len(Data["file_id"])]])
+
+        # failures reach the error callback
+        Errors = []
+        Worker.Submit(lambda: 1 / 0, error = Errors.append)
+        assert WaitFor(lambda: len(Errors) == 1)
+        assert isinstance(Errors[0], ZeroDivisionError)
+
+        # failures without an error callback are signalled
+        Failed = []
+        Worker.JobFailed.connect(lambda future, error: Failed.append(error))
+        Worker.Submit(lambda: 1 / 0)
+        assert WaitFor(lambda: len(Failed) == 1)
+        assert 1 == len(Errors)
+
+    def test_Priority(self):
+        Worker = DataBaseWorker.Instance()
+        Release = threading.Event()
+        Order = []
+
+        # reads queued behind writes are run first
+        Worker.Submit(Release.wait, 5)
+        Writes = [Worker.Submit(Order.append, f"write{R}", priority = Worker.PRIORITY_WRITE) for R in range(2)]
+        Reads = [Worker.Submit(Order.append, f"read{R}") for R in range(2)]
+        Release.set()
+        for Future in Writes + Reads:
+            Future.result(timeout = 5)
+        assert ["read0", "read1", "write0", "write1"] == Order
+
+    def test_Cancel(self):
+        Worker = DataBaseWorker.Instance()
+        Release = threading.Event()
+        Results = []
+
+        # pending jobs are cancelled, a newer job with the same key supersedes the older one
+        Worker.Submit(Release.wait, 5)
+        Cancelled = Worker.Submit(Results.append, "cancelled")
+        Older = Worker.Submit(lambda: "older", slot = Results.append, key = "stats")
+        Newer = Worker.Submit(lambda: "newer", slot = Results.append, key = "stats")
+        assert Cancelled.cancel()
+        Release.set()
+        assert "newer" == Newer.result(timeout = 5)
+        assert WaitFor(lambda: Results == ["newer"])
+        assert Older.cancelled()
+
+    def test_Stop(self):
+        Worker = DataBaseWorker()
+        Worker.start()
+        Release = threading.Event()
+        Running = Worker.Submit(Release.wait, 5)
+        Pending = Worker.Submit(lambda: "pending")
+
+        # the running job finishes and the pending ones are cancelled
+        while not Running.running():
+            time.sleep(0.005)
+        threading.Timer(0.05, Release.set).start()
+        assert Worker.Stop()
+        assert Running.result() and Pending.cancelled()
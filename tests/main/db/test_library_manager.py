@@ -7,12 +7,25 @@ from PySide6 import QtWidgets
 from PySide6 import QtGui
 from PySide6 import QtCore
 
-from apollo.db import DataBaseManager, FileManager, LibraryManager
+from apollo.db import DataBaseManager, FileManager, LibraryManager, ConnectionPool
 from apollo.db import DBStructureError, QueryBuildFailed, QueryExecutionFailed
+from apollo.db import LIBRARY_INDEXES
 
-from tests.testing_tools.tools import DBManager, Gen_DbTable_Data
+from tests.testing_tools.tools import DBManager, DBManager_Filled, Gen_DbTable_Data
 from tests.testing_tools.tools import LibraryManager_connected, TempFilled_DB, del_TempFilled_DB
 
+
+class ContentFileManager(FileManager):
+    """
+    reads the metadata from the content of the file, is defined on module level so the
+    worker processes of a parallel scan can unpickle it
+    """
+
+    def ParseFile(self, file):
+        with open(file) as Content:
+            title, artist = Content.read().split(",")
+        return [{"title": title, "artist": artist, "file_path": file}.get(F) for F in self.db_fields]
+
 #### Tests ####################################################################
 class Test_DBStructureError: ...
 
@@ -26,6 +39,94 @@ class Test_QueryExecutionFailed: ...
 class Test_Connection: ...
 
 
+class Test_ConnectionPool:
+
+    def test_Acquire(self):
+        ConnectionPool.CloseDatabase(":memory:")
+
+        # checks that the same thread reuses a single connection
+        CON = ConnectionPool.Acquire(":memory:")
+        assert CON.isOpen()
+        assert CON.connectionName() == ConnectionPool.Acquire(":memory:").connectionName()
+
+        # checks that state is kept between two queries
+        Manager = DataBaseManager()
+        Manager.connect(":memory:")
+        Manager.exec_query("CREATE TABLE pool_check(id INTEGER)")
+        assert ["pool_check"] == Manager.exec_query("SELECT name FROM sqlite_master WHERE name = 'pool_check'")
+        ConnectionPool.CloseDatabase(":memory:")
+
+    def test_CloseDatabase(self):
+        CON = ConnectionPool.Acquire(":memory:")
+        name = CON.connectionName()
+        del CON
+        ConnectionPool.CloseDatabase(":memory:")
+        assert name not in ConnectionPool._connections
+
+    def test_CloseDatabase_OtherThread(self):
+        import threading
+        Opened, Closed, Done = threading.Event(), threading.Event(), threading.Event()
+        Result = {}
+
+        def Owner():
+            Manager = DataBaseManager()
+            Manager.connect(":memory:")
+            Manager.exec_query("CREATE TABLE stale_check(id INTEGER)")
+            Result["name"] = ConnectionPool.Acquire(":memory:").connectionName()
+            Opened.set()
+            Closed.wait(5)
+
+            # the stale connection is dropped by its owner and a fresh one is opened
+            Result["tables"] = Manager.exec_query("SELECT name FROM sqlite_master WHERE name = 'stale_check'")
+            Result["stale"] = Result["name"] in ConnectionPool._stale
+            ConnectionPool.CloseThread()
+            Done.set()
+
+        Thread = threading.Thread(target = Owner)
+        Thread.start()
+        Opened.wait(5)
+
+        # connections of other threads are only marked stale
+        ConnectionPool.CloseDatabase(":memory:")
+        assert Result["name"] in ConnectionPool._connections
+        assert Result["name"] in ConnectionPool._stale
+        Closed.set()
+        Done.wait(5)
+        Thread.join()
+
+        assert [] == Result["tables"]
+        assert not Result["stale"]
+        assert Result["name"] not in ConnectionPool._connections
+        assert Result["name"] not in ConnectionPool._stale
+
+
+    def test_Profiles(self):
+        ConnectionPool.CloseDatabase(":memory:")
+        Manager = DataBaseManager()
+        Manager.connect(":memory:")
+
+        # connections apply the default profile when they open
+        assert {"synchronous": 1, "temp_store": 2, "cache_size": -65536, "busy_timeout": 5000} == \
+               Manager.Pragmas(["synchronous", "temp_store", "cache_size", "busy_timeout"])
+
+        # a changed profile is picked up by the open connection, open only pragmas are kept
+        Manager.SetProfile("low-memory", {"cache_size": -4096})
+        assert {"cache_size": -4096, "temp_store": 2} == Manager.Pragmas(["cache_size", "temp_store"])
+
+        # temporary profiles are restored when the block raises
+        with pytest.raises(RuntimeError):
+            with Manager.PragmaProfile("bulk-import"):
+                assert {"synchronous": 0, "busy_timeout": 30000} == Manager.Pragmas(["synchronous", "busy_timeout"])
+                raise RuntimeError()
+        assert {"synchronous": 1, "cache_size": -4096, "busy_timeout": 5000} == \
+               Manager.Pragmas(["synchronous", "cache_size", "busy_timeout"])
+
+        with pytest.raises(ValueError):
+            Manager.SetProfile("missing")
+        Manager.SetProfile()
+        ConnectionPool.CloseDatabase(":memory:")
+
+
 class Test_DataBaseManager:
 
     @classmethod
@@ -44,9 +145,11 @@ class Test_DataBaseManager:
         # checks for an post connection DB Structure integrity
         assert Manager.db_startup_checks()
 
-        # checks for an post connection drop of main table and still manintains integrity
+        # checks for an post connection drop of main table and still manintains integrity,
+        # an up to date schema is only validated again when it is forced
         Manager.DropTable("library")
-        assert Manager.db_startup_checks()
+        assert Manager.db_startup_checks(force = True)
+        assert [1] == Manager.exec_query("SELECT count(*) FROM sqlite_master WHERE type = 'table' AND name = 'library'", 1)
 
         # checks for a normal connection close
 
@@ -106,6 +209,26 @@ class Test_DataBaseManager:
         del_TempFilled_DB()
 
 
+    def test_ExeQuery_params(self, DBManager):
+        Manager = DBManager
+        Manager.exec_query("CREATE TABLE param_check(name TEXT, value INTEGER)")
+
+        # positional and named values are bound to the placeholders
+        Manager.exec_query("INSERT INTO param_check VALUES(?, ?)", params = ["Rock 'n' Roll", 1])
+        Manager.exec_query("INSERT INTO param_check VALUES(:name, :value)", params = {"name": "Pop", "value": 2})
+        assert [["Rock 'n' Roll", 1]] == Manager.exec_query("SELECT * FROM param_check WHERE name = ?",
+                                                              params = ["Rock 'n' Roll"])
+
+        # repeated statements are served from the connection cache
+        CON = ConnectionPool.Acquire(":memory:")
+        Cache = ConnectionPool._statements[CON.connectionName()]
+        assert "SELECT * FROM param_check WHERE name = ?" in Cache
+        assert [["Pop", 2]] == Manager.exec_query("SELECT * FROM param_check WHERE name = ?", params = ["Pop"])
+        assert len(Cache) <= ConnectionPool.STATEMENT_CACHE_SIZE
+
+    def test_Quote(self):
+        assert "'Rock ''n'' Roll'" == DataBaseManager.Quote("Rock 'n' Roll")
+
     def test_fetchAll(self, TempFilled_DB):
         Manager, _ = TempFilled_DB
 
@@ -118,10 +241,31 @@ class Test_DataBaseManager:
         assert Expected == Manager.exec_query("SELECT cid, name FROM pragma_table_info('library')", 1)
         del_TempFilled_DB()
 
+    def test_stream_query(self, DBManager):
+        Manager = DBManager
+        Manager.exec_query("CREATE TABLE stream_check(id INTEGER, name TEXT)")
+        for R in range(10):
+            Manager.exec_query("INSERT INTO stream_check VALUES(?, ?)", params = [R, f"nameX{R}"])
+
+        # rows are yielded in batches of the given size
+        Batches = list(Manager.stream_query("SELECT * FROM stream_check", batch_size = 3))
+        assert [3, 3, 3, 1] == [len(Batch) for Batch in Batches]
+        assert [[R, f"nameX{R}"] for R in range(10)] == [Row for Batch in Batches for Row in Batch]
+
+        # projection only reads the selected columns
+        Batches = list(Manager.stream_query("SELECT * FROM stream_check WHERE id < ?", params = [2], fields = ["name"]))
+        assert [[["nameX0"], ["nameX1"]]] == Batches
+
+        # projection of a missing column fails
+        try:
+            list(Manager.stream_query("SELECT * FROM stream_check", fields = ["missing"]))
+        except QueryBuildFailed: assert True
+        else: assert False
+
     def test_indexedSelector(self, TempFilled_DB):
         Manager, Data = TempFilled_DB
         # check for getting data for a given column
-        assert [[None]] == Manager.Index_selector("nowplaying", "file_name")
+        assert [] == Manager.Index_selector("nowplaying", "file_name")
         del_TempFilled_DB()
 
     def test_CreateView_normal(self, TempFilled_DB):
@@ -131,7 +275,7 @@ class Test_DataBaseManager:
         Expected = [['file_idX1', 'path_idX1', 'file_nameX1', 'file_pathX1', 'albumX1',
                     'albumartistX1', 'artistX1', 'authorX1', 'bpmX1', 'compilationX1', 'composerX1',
                     'conductorX1', 'dateX1', 1, 'discsubtitleX1', 'encodedbyX1', 'genreX1', 'languageX1',
-                    '0:01:00', '1024', 'lyricistX1', 'mediaX1', 'moodX1', 'organizationX1', 'originaldateX1',
+                    60000, 1024, 'lyricistX1', 'mediaX1', 'moodX1', 'organizationX1', 'originaldateX1',
                     'performerX1', 'releasecountryX1', 'replaygain_gainX1', 'replaygain_peakX1', 'titleX1',
                     'tracknumberX1', 'versionX1', 'websiteX1', 'album_gainX1', 'bitrateX1', 'bitrate_modeX1',
                     1, 'encoder_infoX1', 'encoder_settingsX1', 'frame_offsetX1', 'layerX1', 'modeX1',
@@ -139,6 +283,7 @@ class Test_DataBaseManager:
                     'ratingX1', 'playcountX1']]
         assert (Expected == Manager.SelectAll("nowplaying"))
         Manager.DropView("nowplaying")
+        Manager.Create_NowPlaying()
 
     def test_CreateView_Shuffled(self, TempFilled_DB):
         Manager, Data = TempFilled_DB
@@ -147,7 +292,7 @@ class Test_DataBaseManager:
         Expected = [['file_idX1', 'path_idX1', 'file_nameX1', 'file_pathX1', 'albumX1',
                     'albumartistX1', 'artistX1', 'authorX1', 'bpmX1', 'compilationX1', 'composerX1',
                     'conductorX1', 'dateX1', 1, 'discsubtitleX1', 'encodedbyX1', 'genreX1', 'languageX1',
-                    '0:01:00', '1024', 'lyricistX1', 'mediaX1', 'moodX1', 'organizationX1', 'originaldateX1',
+                    60000, 1024, 'lyricistX1', 'mediaX1', 'moodX1', 'organizationX1', 'originaldateX1',
                     'performerX1', 'releasecountryX1', 'replaygain_gainX1', 'replaygain_peakX1', 'titleX1',
                     'tracknumberX1', 'versionX1', 'websiteX1', 'album_gainX1', 'bitrateX1', 'bitrate_modeX1',
                     1, 'encoder_infoX1', 'encoder_settingsX1', 'frame_offsetX1', 'layerX1', 'modeX1',
@@ -155,6 +300,7 @@ class Test_DataBaseManager:
                     'ratingX1', 'playcountX1']]
         assert (Expected == Manager.SelectAll("nowplaying"))
         Manager.DropView("nowplaying")
+        Manager.Create_NowPlaying()
 
     def test_CreateView_normal_fieldSelector(self, TempFilled_DB):
         Manager, Data = TempFilled_DB
@@ -163,7 +309,7 @@ class Test_DataBaseManager:
         Expected = [['file_idX1', 'path_idX1', 'file_nameX1', 'file_pathX1', 'albumX1',
                     'albumartistX1', 'artistX1', 'authorX1', 'bpmX1', 'compilationX1', 'composerX1',
                     'conductorX1', 'dateX1', 1, 'discsubtitleX1', 'encodedbyX1', 'genreX1', 'languageX1',
-                    '0:01:00', '1024', 'lyricistX1', 'mediaX1', 'moodX1', 'organizationX1', 'originaldateX1',
+                    60000, 1024, 'lyricistX1', 'mediaX1', 'moodX1', 'organizationX1', 'originaldateX1',
                     'performerX1', 'releasecountryX1', 'replaygain_gainX1', 'replaygain_peakX1', 'titleX1',
                     'tracknumberX1', 'versionX1', 'websiteX1', 'album_gainX1', 'bitrateX1', 'bitrate_modeX1',
                     1, 'encoder_infoX1', 'encoder_settingsX1', 'frame_offsetX1', 'layerX1', 'modeX1',
@@ -171,6 +317,7 @@ class Test_DataBaseManager:
                     'ratingX1', 'playcountX1']]
         assert (Expected == Manager.SelectAll("nowplaying"))
         Manager.DropView("nowplaying")
+        Manager.Create_NowPlaying()
 
     def test_CreateView_filter_fieldSelector_fileID(self, TempFilled_DB):
         Manager, Data = TempFilled_DB
@@ -181,7 +328,7 @@ class Test_DataBaseManager:
         Expected = [['file_idX1', 'path_idX1', 'file_nameX1', 'file_pathX1', 'albumX1',
                     'albumartistX1', 'artistX1', 'authorX1', 'bpmX1', 'compilationX1', 'composerX1',
                     'conductorX1', 'dateX1', 1, 'discsubtitleX1', 'encodedbyX1', 'genreX1', 'languageX1',
-                    '0:01:00', '1024', 'lyricistX1', 'mediaX1', 'moodX1', 'organizationX1', 'originaldateX1',
+                    60000, 1024, 'lyricistX1', 'mediaX1', 'moodX1', 'organizationX1', 'originaldateX1',
                     'performerX1', 'releasecountryX1', 'replaygain_gainX1', 'replaygain_peakX1', 'titleX1',
                     'tracknumberX1', 'versionX1', 'websiteX1', 'album_gainX1', 'bitrateX1', 'bitrate_modeX1',
                     1, 'encoder_infoX1', 'encoder_settingsX1', 'frame_offsetX1', 'layerX1', 'modeX1',
@@ -190,7 +337,7 @@ class Test_DataBaseManager:
                     ['file_idX2', 'path_idX2', 'file_nameX2', 'file_pathX2', 'albumX2',
                     'albumartistX2', 'artistX2', 'authorX2', 'bpmX2', 'compilationX2', 'composerX2',
                     'conductorX2', 'dateX2', 2, 'discsubtitleX2', 'encodedbyX2', 'genreX2', 'languageX2',
-                    '0:01:00', '1024', 'lyricistX2', 'mediaX2', 'moodX2', 'organizationX2', 'originaldateX2',
+                    60000, 1024, 'lyricistX2', 'mediaX2', 'moodX2', 'organizationX2', 'originaldateX2',
                     'performerX2', 'releasecountryX2', 'replaygain_gainX2', 'replaygain_peakX2', 'titleX2',
                     'tracknumberX2', 'versionX2', 'websiteX2', 'album_gainX2', 'bitrateX2', 'bitrate_modeX2',
                     2, 'encoder_infoX2', 'encoder_settingsX2', 'frame_offsetX2', 'layerX2', 'modeX2',
@@ -198,15 +345,219 @@ class Test_DataBaseManager:
                     'ratingX2', 'playcountX2']]
         assert all([(E==A) for E, A in zip(Expected, Manager.SelectAll("nowplaying"))])
         Manager.DropView("nowplaying")
+        Manager.Create_NowPlaying()
+
+    def test_BulkSelection(self, DBManager, monkeypatch):
+        Manager = DBManager
+        Manager.exec_query("CREATE TABLE bulk_check(id TEXT PRIMARY KEY, value INTEGER)")
+        Keys = [f"idX{R}" for R in range(60000)]
+        Manager.BatchInsert_Metadata({"id": Keys, "value": [0] * len(Keys)}, "bulk_check")
+
+        # selections past the SQLite variable limit are loaded into the temp table
+        # mutations return the keys they touched
+        assert 50000 == len(Manager.BulkUpdate("bulk_check", "id", Keys[:50000] + ["missing"], {"value": 1}))
+        assert [50000] == Manager.exec_query("SELECT count(*) FROM bulk_check WHERE value = 1", 1)
+        assert 50000 == len(Manager.BulkDelete("bulk_check", "id", Keys[10000:] + ["missing"]))
+        assert [10000] == Manager.exec_query("SELECT count(*) FROM bulk_check", 1)
+
+        # selected rows keep the order and duplicates of the keys
+        assert [["idX5", 1], ["idX2", 1], ["idX5", 1]] == Manager.BulkSelect("bulk_check", "id",
+                                                                            ["idX5", "idX2", "missing", "idX5"])
+        assert [] == Manager.BulkSelect("bulk_check", "id", [])
+
+        # the temp table is emptied after every selection, small selections dont switch the pragmas
+        Applied = []
+        monkeypatch.setattr(ConnectionPool, "ApplyPragmas", lambda CON, pragmas: Applied.append(pragmas))
+        with Manager.Selection(["idX1"]) as Selection:
+            assert [1] == Manager.exec_query(f"SELECT count(*) FROM {Selection}", 1)
+        assert [0] == Manager.exec_query(f"SELECT count(*) FROM {Selection}", 1)
+        assert [] == Applied
+
+    def test_NowPlaying(self, DBManager_Filled):
+        Manager = DBManager_Filled
+
+        def Queue():
+            return Manager.Index_selector("nowplaying", "file_id")
+
+        # the queue keeps the given order
+        Manager.NowPlaying_Fill(["file_idX3", "file_idX1", "file_idX2"])
+        assert ["file_idX3", "file_idX1", "file_idX2"] == Queue()
+
+        # inserts only write the new rows
+        Manager.NowPlaying_Insert(["file_idX5"], 1)
+        Manager.NowPlaying_Insert(["file_idX6"], 0)
+        Manager.NowPlaying_Insert(["file_idX7"])
+        assert ["file_idX6", "file_idX3", "file_idX5", "file_idX1", "file_idX2", "file_idX7"] == Queue()
+
+        # an exhausted gap shifts the following rows
+        for R in range(12):
+            Manager.NowPlaying_Insert([f"file_idX{8 + R}"], 1)
+        assert [f"file_idX{8 + R}" for R in reversed(range(12))] == Queue()[1: 13]
+        assert ["file_idX6", "file_idX3"] == [Queue()[0], Queue()[13]]
+
+        # moves and removes
+        Manager.NowPlaying_Fill(["file_idX0", "file_idX1", "file_idX2", "file_idX3", "file_idX4"])
+        assert 2 == Manager.NowPlaying_Move([0, 1], 4)
+        assert ["file_idX2", "file_idX3", "file_idX0", "file_idX1", "file_idX4"] == Queue()
+        Manager.NowPlaying_Move([4], 0)
+        Manager.NowPlaying_Remove([1, 3])
+        assert ["file_idX4", "file_idX3", "file_idX1"] == Queue()
+
+        # tracks deleted from the library leave the queue
+        Manager.exec_query("DELETE FROM library WHERE file_id = 'file_idX3'")
+        assert ["file_idX4", "file_idX1"] == Queue()
+        assert [2] == Manager.exec_query("SELECT count(*) FROM nowplaying_queue", 1)
+
+    def test_NowPlaying_legacy(self, DBManager_Filled):
+        Manager = DBManager_Filled
+        Manager.DropView("nowplaying")
+        Manager.DropTable("nowplaying_queue")
+        Manager.CreateView("nowplaying", ["file_idX1", "file_idX2"])
+
+        # a legacy view is converted into queue rows
+        Manager.Create_NowPlaying()
+        assert ["file_idX1", "file_idX2"] == Manager.Index_selector("nowplaying", "file_id")
+        assert [2] == Manager.exec_query("SELECT count(*) FROM nowplaying_queue", 1)
+
+    def test_Migrate_NumericSchema(self, DBManager):
+        Manager = DBManager
+        Manager.DropTable("library")
+        Columns = ", ".join([f"{F} TEXT" for F in Manager.db_fields])
+        Manager.exec_query(f"CREATE TABLE library({Columns})")
+        Legacy = {F: [f"{F}X{R}" for R in range(3)] for F in Manager.db_fields}
+        Legacy["length"] = ["0:03:25.500000", "1:02:03", "1 day, 0:00:01"]
+        Legacy["filesize"] = ["12.5 Mb", "1.0 Mb", ""]
+        Legacy["bitrate"] = ["320 Kbps", "128 Kbps", "0 Kbps"]
+        Legacy["sample_rate"] = ["44100Hz", "48000Hz", "96000Hz"]
+        Manager.BatchInsert_Metadata(Legacy)
+        Manager.CreateView("legacy_view", ["file_idX0"])
+
+        # checks for the outdated schema and migrates it in small chunks
+        assert Manager.LibrarySchema_Outdated()
+        Manager.Migrate_NumericSchema(chunk_size = 2)
+        assert not Manager.LibrarySchema_Outdated()
+
+        Expected = [[205500, 13107200, 320000, 44100],
+                    [3723000, 1048576, 128000, 48000],
+                    [86401000, -1, 0, 96000]]
+        assert Expected == Manager.exec_query("SELECT length, IFNULL(filesize, -1), bitrate, sample_rate FROM library")
+        assert ["titleX0"] == Manager.exec_query("SELECT title FROM legacy_view", 1)
+        Manager.DropView("legacy_view")
+
+    def test_Migrate_NumericSchema_Writes(self, DBManager):
+        Manager = DBManager
+        Manager.DropTable("library")
+        Manager.exec_query(f"CREATE TABLE library({', '.join([f'{F} TEXT' for F in Manager.db_fields])})")
+        Legacy = {F: [f"{F}X{R}" for R in range(2)] for F in Manager.db_fields}
+        Legacy.update({"length": ["0:04:05", "0:01:00"], "filesize": ["5.0 Mb", "1.0 Mb"],
+                       "bitrate": ["320 Kbps", "128 Kbps"], "sample_rate": ["44100Hz", "48000Hz"]})
+        Manager.BatchInsert_Metadata(Legacy)
+
+        # rows written in base units while the copy runs are not scaled again by the swap
+        Manager.Prepare_NumericSchema()
+        assert not Manager.Migrate_NumericSchema(chunk_size = 1, chunks = 1)
+        Manager.BatchInsert_Metadata({"file_id": ["file_idX2"], "length": [245000], "filesize": [5242880],
+                                      "bitrate": [320000], "sample_rate": [44100]})
+        Manager.exec_query("UPDATE library SET filesize = 2097152 WHERE file_id = 'file_idX0'")
+        assert Manager.Migrate_NumericSchema(chunk_size = 1)
+        assert [[245000, 2097152, 320000, 44100],
+                [60000, 1048576, 128000, 48000],
+                [245000, 5242880, 320000, 44100]] == \
+            Manager.exec_query("SELECT length, filesize, bitrate, sample_rate FROM library ORDER BY file_id")
+
+    def test_Indexes(self, DBManager):
+        Manager = DBManager
+        Query = "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'library' AND sql NOTNULL ORDER BY name"
+
+        # startup creates all the declared indexes
+        assert sorted(LIBRARY_INDEXES.keys()) == Manager.exec_query(Query, 1)
+        assert [] == Manager.Create_Indexes()
+
+        # dropped and altered indexes are recreated
+        Manager.DropIndex("library_artist_idx")
+        Manager.DropIndex("library_album_idx")
+        Manager.AddIndex("library_album_idx", "library", ["title"])
+        assert ["library_artist_idx", "library_album_idx"] == Manager.Create_Indexes()
+        assert sorted(LIBRARY_INDEXES.keys()) == Manager.exec_query(Query, 1)
+
+        # filters on an indexed column use the index
+        Manager.Analyze()
+        Plan = Manager.exec_query("EXPLAIN QUERY PLAN SELECT * FROM library WHERE genre = 'Rock'")
+        assert any(["library_genre_idx" in str(Row) for Row in Plan])
+
+    def test_LibraryStats(self, DBManager_Filled):
+        Manager = DBManager_Filled
+
+        def Aggregated():
+            [[tracks, artists, albums, genres, playtime, size]] = Manager.exec_query("""
+            SELECT count(*), count(DISTINCT artist), count(DISTINCT album), count(DISTINCT genre),
+                IFNULL(sum(length), 0) / 1000, round(IFNULL(sum(filesize), 0) / 1073741824.0, 2)
+            FROM library
+            """)
+            Stats = Manager.TableStats()
+            assert (tracks, artists, albums, genres) == (Stats["tracks"], Stats["artists"], Stats["albums"], Stats["genres"])
+            assert datetime.timedelta(seconds = playtime) == Stats["playtime"]
+            assert size == Stats["size"]
+            return Stats
+
+        # rows inserted by the fixture are counted by the triggers
+        Stats = Aggregated()
+        assert Stats["tracks"] == 20
+
+        # updates move tracks between groups and change the totals
+        Manager.exec_query("UPDATE library SET playcount = 0")
+        Manager.exec_query("UPDATE library SET artist = 'Top', genre = 'Rock', playcount = 7, length = 120000 "
+                           "WHERE file_id IN ('file_idX1', 'file_idX2', 'file_idX3')")
+        Stats = Aggregated()
+        assert (Stats["top_artist"], Stats["top_genre"], Stats["playcount"]) == ("Top", "Rock", 21)
+        assert Stats["top_track"] in ("titleX1", "titleX2", "titleX3")
+
+        # deletes remove emptied groups
+        Manager.exec_query("DELETE FROM library WHERE artist = 'Top' OR file_id = 'file_idX4'")
+        Stats = Aggregated()
+        assert Stats["tracks"] == 16 and Stats["top_artist"] != "Top"
+
+        # a rebuild from scratch matches the incremental stats
+        Manager.exec_query("UPDATE library_stats SET tracks = 0")
+        Manager.exec_query("DROP TRIGGER library_stats_insert")
+        assert Manager.TableStats()["tracks"] == 16
+        assert Manager.exec_query("SELECT count(*) FROM library_stats_groups WHERE field = 'artist'", 1) == [16]
+
+    def test_SearchLibrary(self, DBManager_Filled):
+        Manager = DBManager_Filled
+
+        # rows inserted before and after the index are searchable by word prefix
+        assert ["file_idX3"] == Manager.SearchLibrary("titlex3")
+        assert ["file_idX3"] == Manager.SearchLibrary("ARTISTX3 alb")
+        assert 20 == len(Manager.SearchLibrary("genre"))
+        assert 5 == len(Manager.SearchLibrary("genre", limit = 5))
+
+        # updates are reindexed, matching ignores case and diacritics
+        Manager.exec_query("UPDATE library SET artist = 'Beyoncé', title = 'Déjà Vu' WHERE file_id = 'file_idX1'")
+        Manager.exec_query("UPDATE library SET title = 'Beyonce Live' WHERE file_id = 'file_idX2'")
+        assert "file_idX1" not in Manager.SearchLibrary("artistx1")
+        assert ["file_idX1"] == Manager.SearchLibrary("deja")
+        assert ["file_idX1", "file_idX2"] == sorted(Manager.SearchLibrary("BEYON"))
+
+        # deleted rows leave the index, operators and quotes are matched literally
+        Manager.exec_query("DELETE FROM library WHERE file_id = 'file_idX1'")
+        assert ["file_idX2"] == Manager.SearchLibrary("beyonce")
+        assert [] == Manager.SearchLibrary('" OR NOT -')
+        assert [] == Manager.SearchLibrary("  ")
+
+        # a dropped index is rebuilt from the library table
+        Manager.exec_query("DROP TABLE library_fts")
+        assert Manager.Create_SearchIndex()
+        assert ["file_idX2"] == Manager.SearchLibrary("beyonce")
 
     def test_DropTable(self, DBManager):
         Manager = DBManager
         Manager.DropTable("library")
 
-        assert not Manager.exec_query("""
+        assert not any(Manager.exec_query("""
 	        SELECT IIF(name = 'library', TRUE, FALSE) AS TABLE_CHECK
         FROM sqlite_master WHERE type = 'table'
-        """)
+        """, 1))
 
 
     def test_DropView(self, DBManager):
@@ -320,7 +671,229 @@ class Test_DataBaseManager:
         assert (Manager.Toptrack("nowplaying") == "")
 
 
-class Test_FileManager: ...
+class Test_FileManager:
+
+    def test_Ingest(self):
+        ConnectionPool.CloseDatabase(":memory:")
+        Manager = FileManager()
+        Manager.connect(":memory:")
+        Committed = []
+
+        def Rows(count, prefix):
+            for R in range(count):
+                # rows of the finished chunks are already commited while the scan goes on
+                Committed.append(Manager.exec_query("SELECT count(*) FROM library", 1)[0])
+                yield [f"{prefix}{R}" if F == "file_id" else None for F in Manager.db_fields]
+
+        # chunks are limited by the row count
+        assert 20 == Manager.Ingest(Rows(20, "rows"), chunk_rows = 8)
+        assert [0] * 8 + [8] * 8 + [16] * 4 == Committed
+        assert [20] == Manager.exec_query("SELECT count(*) FROM library", 1)
+
+        # and by the estimated size of the rows
+        Committed.clear()
+        assert 6 == Manager.Ingest(Rows(6, "bytes"), chunk_rows = 100, chunk_bytes = 100)
+        assert [20, 21, 22, 23, 24, 25] == Committed
+        assert 20 == Manager.RowSize(["1234", 1, None])
+        ConnectionPool.CloseDatabase(":memory:")
+
+    def test_ScanDirectory(self, tmp_path, monkeypatch):
+        ConnectionPool.CloseDatabase(":memory:")
+        Manager = FileManager()
+        Manager.connect(":memory:")
+        Parsed = []
+
+        def ParseFile(file):
+            Parsed.append(os.path.basename(file))
+            return [os.path.basename(file) if F == "title" else (file if F == "file_path" else None)
+                    for F in Manager.db_fields]
+
+        def Count(table):
+            return Manager.exec_query(f"SELECT count(*) FROM {table}", 1)[0]
+
+        def Scan():
+            Parsed.clear()
+            Manager.ScanDirectory(str(tmp_path), ["MP3"], chunk_rows = 2)
+            return sorted(Parsed)
+
+        monkeypatch.setattr(Manager, "ParseFile", ParseFile)
+        os.mkdir(tmp_path / "sub")
+        for R in range(5):
+            (tmp_path / ("sub" if R % 2 else "") / f"track{R}.mp3").write_bytes(f"audio{R}".encode())
+        (tmp_path / "cover.jpg").write_bytes(b"image")
+
+        # new files are parsed once, unchanged files are skipped on a rescan
+        assert [f"track{R}.mp3" for R in range(5)] == Scan()
+        assert [5, 5] == [Count("library"), Count("file_fingerprints")]
+        assert [] == Scan()
+
+        # changed files replace their row and keep its rating
+        Manager.exec_query("UPDATE library SET rating = 4 WHERE title = 'track1.mp3'")
+        (tmp_path / "sub" / "track1.mp3").write_bytes(b"retagged audio1")
+        assert ["track1.mp3"] == Scan()
+        assert [5, [4]] == [Count("library"),
+                            Manager.exec_query("SELECT rating FROM library WHERE title = 'track1.mp3'", 1)]
+
+        # tracks deleted from the library are added again
+        Manager.exec_query("DELETE FROM library WHERE title = 'track2.mp3'")
+        assert ["track2.mp3"] == Scan()
+
+        # libraries scanned before the fingerprints only hash their files
+        Manager.exec_query("DELETE FROM file_fingerprints")
+        assert [] == Scan()
+        assert 5 == Count("file_fingerprints")
+        ConnectionPool.CloseDatabase(":memory:")
+
+    def test_ScanParallel(self, tmp_path):
+        for R in range(40):
+            os.makedirs(tmp_path / "music" / f"album{R % 3}", exist_ok = True)
+            (tmp_path / "music" / f"album{R % 3}" / f"track{R}.mp3").write_text(f"title{R},artist{R % 7}")
+
+        def Scan(db_name, workers):
+            Manager = ContentFileManager()
+            Manager.connect(str(tmp_path / db_name))
+            Manager.ScanDirectory(str(tmp_path / "music"), ["MP3"], chunk_rows = 6, workers = workers)
+            Rows = Manager.exec_query("SELECT * FROM library ORDER BY rowid")
+            ConnectionPool.CloseDatabase(str(tmp_path / db_name))
+            return Rows
+
+        # rows parsed by the process pool are inserted in the order of the serial scan
+        Serial = Scan("serial.db", 0)
+        assert 40 == len(Serial)
+        assert Serial == Scan("parallel.db", 3)
+
+    def test_SyncDirectories(self, tmp_path):
+        ConnectionPool.CloseDatabase(":memory:")
+        Manager = ContentFileManager()
+        Manager.connect(":memory:")
+        for R in range(4):
+            os.makedirs(tmp_path / f"album{R % 2}", exist_ok = True)
+            (tmp_path / f"album{R % 2}" / f"track{R}.mp3").write_text(f"title{R},artist{R}")
+        Manager.ScanDirectory(str(tmp_path), ["MP3"])
+        Manager.exec_query("UPDATE library SET rating = 5 WHERE title = 'title0'")
+
+        def Paths():
+            return Manager.exec_query("SELECT title, file_path FROM library ORDER BY title")
+
+        # a moved file keeps its row, deleted files are removed and new ones are added
+        os.rename(tmp_path / "album0" / "track0.mp3", tmp_path / "album1" / "moved0.mp3")
+        os.remove(tmp_path / "album0" / "track2.mp3")
+        (tmp_path / "album1" / "track4.mp3").write_text("title4,artist4")
+        Dirs = {str(tmp_path / "album0"): False, str(tmp_path / "album1"): False}
+        assert {"moved": 1, "deleted": 1} == Manager.SyncDirectories(Dirs, ["MP3"])
+        assert [["title0", str(tmp_path / "album1" / "moved0.mp3")],
+                ["title1", str(tmp_path / "album1" / "track1.mp3")],
+                ["title3", str(tmp_path / "album1" / "track3.mp3")],
+                ["title4", str(tmp_path / "album1" / "track4.mp3")]] == Paths()
+        assert [5] == Manager.exec_query("SELECT rating FROM library WHERE title = 'title0'", 1)
+
+        # removed sub directories are found from their parent
+        os.rename(tmp_path / "album1", tmp_path / "renamed")
+        assert {"moved": 0, "deleted": 4} == Manager.SyncDirectories({str(tmp_path): False}, ["MP3"])
+        assert {"moved": 0, "deleted": 0} == Manager.SyncDirectories({str(tmp_path / "renamed"): True}, ["MP3"])
+        assert 4 == len(Paths())
+        ConnectionPool.CloseDatabase(":memory:")
+
+    @pytest.mark.parametrize("workers", [0, 2])
+    def test_ScanErrors(self, tmp_path, workers):
+        Manager = ContentFileManager()
+        Manager.connect(str(tmp_path / "library.db"))
+        os.mkdir(tmp_path / "music")
+        for R in range(6):
+            (tmp_path / "music" / f"track{R}.mp3").write_text(f"title{R},artist{R}" if R % 3 else "broken")
+
+        def Scan():
+            Manager.ScanDirectory(str(tmp_path / "music"), ["MP3"], workers = workers)
+            return sorted(Manager.exec_query("SELECT title FROM library", 1))
+
+        # broken files are quarantined instead of ending the scan
+        assert ["title1", "title2", "title4", "title5"] == Scan()
+        Errors = Manager.ScanErrors(str(tmp_path / "music"))
+        assert [str(tmp_path / "music" / "track0.mp3"), str(tmp_path / "music" / "track3.mp3")] == [E[0] for E in Errors]
+        assert {"ValueError"} == {E[3] for E in Errors}
+
+        # they are skipped until they change
+        Messages = []
+        Manager.ScanDirectory(str(tmp_path / "music"), ["MP3"], Messages.append, workers = workers)
+        assert "FAILED: 0 Unreadable Files, 2 Quarantined Files Skipped" in Messages
+        (tmp_path / "music" / "track3.mp3").write_text("fixed3,artist3")
+        assert ["fixed3", "title1", "title2", "title4", "title5"] == Scan()
+        assert [str(tmp_path / "music" / "track0.mp3")] == [E[0] for E in Manager.ScanErrors()]
+        ConnectionPool.CloseDatabase(str(tmp_path / "library.db"))
+
+    def test_PruneMissing(self, tmp_path):
+        ConnectionPool.CloseDatabase(":memory:")
+        Manager = ContentFileManager()
+        Manager.connect(":memory:")
+        for R in range(7):
+            os.makedirs(tmp_path / f"album{R % 2}", exist_ok = True)
+            (tmp_path / f"album{R % 2}" / f"track{R}.mp3").write_text(f"title{R},artist{R}" if R else "broken")
+        Manager.ScanDirectory(str(tmp_path), ["MP3"])
+
+        def Titles():
+            return sorted(Manager.exec_query("SELECT title FROM library", 1))
+
+        # only the missing files below the directory are removed, with their fingerprints
+        for R in (0, 2, 3, 5):
+            os.remove(tmp_path / f"album{R % 2}" / f"track{R}.mp3")
+        assert 1 == Manager.PruneMissing(str(tmp_path / "album0"), batch_size = 1)
+        assert ["title1", "title3", "title4", "title5", "title6"] == Titles()
+        assert [] == Manager.ScanErrors()
+        assert 2 == Manager.PruneMissing(batch_size = 1, workers = 2)
+        assert ["title1", "title4", "title6"] == Titles()
+        assert 3 == Manager.exec_query("SELECT count(*) FROM file_fingerprints", 1)[0]
+
+        # the tracks of an unavailable directory are kept
+        Manager.exec_query("UPDATE library SET file_path = ? WHERE title = 'title1'", params = [str(tmp_path / "nas" / "track1.mp3")])
+        assert 0 == Manager.PruneMissing(str(tmp_path / "nas"))
+        assert 3 == len(Titles())
+        ConnectionPool.CloseDatabase(":memory:")
+
+    def test_FileHasher(self, tmp_path):
+        Manager = FileManager()
+        Audio = bytes(range(256)) * 200
+
+        def ID3(size):
+            return b"ID3\x04\x00\x00" + bytes([0, 0, size >> 7, size & 0x7f]) + b"\x00" * size
+
+        def APE(items):
+            return items + b"APETAGEX" + (2000).to_bytes(4, "little") + (len(items) + 32).to_bytes(4, "little") + b"\x00" * 16
+
+        def FLAC(padding):
+            return b"fLaC" + b"\x00\x00\x00\x22" + b"\x11" * 34 + b"\x81" + padding.to_bytes(3, "big") + b"\x00" * padding
+
+        def MP4(meta):
+            Box = lambda kind, data: (len(data) + 8).to_bytes(4, "big") + kind + data
+            return Box(b"ftyp", b"M4A \x00\x00\x00\x00") + Box(b"moov", meta) + Box(b"mdat", Audio)
+
+        def Hash(name, content):
+            (tmp_path / name).write_bytes(content)
+            return Manager.FileHasher(str(tmp_path / name))
+
+        # editing the tags keeps the id of the file
+        Original = Hash("original.mp3", ID3(100) + Audio)
+        assert 32 == len(Original)
+        assert Original == Hash("retagged.mp3", ID3(300) + Audio + b"TAG" + b"\x00" * 125)
+        assert Original == Hash("ape.mp3", Audio + APE(b"\x01" * 64))
+        assert Hash("flac.flac", FLAC(10) + Audio) == Hash("padded.flac", ID3(20) + FLAC(500) + Audio)
+        assert Hash("meta.m4a", MP4(b"\x01" * 10)) == Hash("udta.m4a", MP4(b"\x02" * 900))
+
+        # files with the same tag header but different audio get different ids
+        Changed = bytearray(Audio)
+        Changed[len(Audio) // 2] ^= 0xff
+        assert Original != Hash("changed.mp3", ID3(100) + bytes(Changed))
+        assert Hash("short.mp3", ID3(100) + b"\x01") != Hash("shorter.mp3", ID3(100) + b"\x02")
+
+        # a damaged APE footer is ignored instead of giving offsets outside of the file
+        def Bogus(length):
+            return b"APETAGEX" + (2000).to_bytes(4, "little") + length.to_bytes(4, "little") + b"\xff" * 16
+
+        for length in (0xffffff00, 16, len(Audio) * 4):
+            assert 32 == len(Hash("bogus.mp3", ID3(100) + Audio + Bogus(length)))
+            assert 32 == len(Hash("bogus.m4a", MP4(b"\x01" * 10) + Bogus(length)))
+            with open(tmp_path / "bogus.m4a", "rb") as fobj:
+                start, end = Manager.PayloadRange(fobj, os.path.getsize(tmp_path / "bogus.m4a"))
+            assert 0 <= start <= end <= os.path.getsize(tmp_path / "bogus.m4a")
 
 
 class Test_LibraryManager:
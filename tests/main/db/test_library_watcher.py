@@ -0,0 +1,84 @@
+import os
+import time
+
+from PySide6 import QtCore
+
+from apollo.db import ConnectionPool, DataBaseWorker, FileManager, LibraryManager, LibraryWatcher
+
+
+def WaitFor(Condition, timeout = 5):
+    """
+    Runs the event loop until the condition is met so watcher events and results are dispatched
+    """
+    End = time.time() + timeout
+    while not Condition() and time.time() < End:
+        QtCore.QCoreApplication.processEvents()
+        time.sleep(0.005)
+    return Condition()
+
+
+#### Tests ####################################################################
+class Test_LibraryWatcher:
+
+    @classmethod
+    def setup_class(cls):
+        if not QtCore.QCoreApplication.instance():
+            cls.App = QtCore.QCoreApplication()
+
+    @classmethod
+    def teardown_class(cls):
+        DataBaseWorker.Shutdown()
+
+    def test_LibraryWatcher(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(FileManager, "ParseFile",
+                            lambda self, file: [os.path.basename(file) if F == "title" else None for F in self.db_fields])
+        os.makedirs(tmp_path / "music" / "album")
+        (tmp_path / "music" / "album" / "track0.mp3").write_bytes(b"audio0")
+        DB = str(tmp_path / "library.db")
+        Manager = LibraryManager(DB)
+        Manager.ScanDirectory(str(tmp_path / "music"), ["MP3"])
+
+        Changes = []
+        Watcher = LibraryWatcher(DB, [str(tmp_path / "music")], ["MP3"], debounce_ms = 50)
+        Watcher.LibraryChanged.connect(Changes.append)
+        assert WaitFor(lambda: len(Watcher.Watcher.directories()) == 2)
+
+        def Titles():
+            return sorted(Manager.exec_query("SELECT title FROM library", 1))
+
+        # a burst of events is applied as one batch
+        for R in range(1, 4):
+            (tmp_path / "music" / "album" / f"track{R}.mp3").write_bytes(f"audio{R}".encode())
+        os.remove(tmp_path / "music" / "album" / "track0.mp3")
+        assert WaitFor(lambda: len(Changes) == 1)
+        assert {"moved": 0, "deleted": 1} == Changes[0]
+        assert ["track1.mp3", "track2.mp3", "track3.mp3"] == Titles()
+
+        # new directories are synced with their files and watched
+        os.makedirs(tmp_path / "music" / "new" / "disc1")
+        (tmp_path / "music" / "new" / "disc1" / "track4.mp3").write_bytes(b"audio4")
+        assert WaitFor(lambda: len(Changes) == 2)
+        assert "track4.mp3" in Titles()
+        assert 4 == len(Watcher.Watcher.directories())
+
+        # files edited in place are synced and keep being watched
+        assert WaitFor(lambda: len(Watcher.Watcher.files()) == 4)
+        Old = Manager.exec_query("SELECT file_id FROM library WHERE title = 'track1.mp3'", 1)
+        with open(tmp_path / "music" / "album" / "track1.mp3", "ab") as fobj:
+            fobj.write(b" edited")
+        assert WaitFor(lambda: len(Changes) == 3)
+        assert Old != Manager.exec_query("SELECT file_id FROM library WHERE title = 'track1.mp3'", 1)
+        assert 4 == len(Titles())
+        assert WaitFor(lambda: len(Watcher.Watcher.files()) == 4)
+
+        # failed batches are reported through the signals
+        Failures, Messages = [], []
+        Watcher.SyncFailed.connect(Failures.append)
+        Watcher.StatusChanged.connect(Messages.append)
+        Watcher.Failed(OSError("unreadable"))
+        assert isinstance(Failures[0], OSError)
+        assert ["Syncing Library Failed: OSError: unreadable"] == Messages
+
+        Watcher.Stop()
+        DataBaseWorker.Shutdown()
+        ConnectionPool.CloseDatabase(DB)
@@ -0,0 +1,143 @@
+import hashlib
+import os
+
+import pytest
+
+from apollo.db import DataBaseManager, ConnectionPool, FileManager, MigrationRegistry, MIGRATIONS
+from apollo.db import DBStructureError, LIBRARY_INDEXES
+from tests.testing_tools.tools import DBManager, DBManager_Filled, Gen_DbTable_Data
+
+
+#### Tests ####################################################################
+class Test_MigrationRegistry:
+
+    def test_Upgrade(self, DBManager):
+        Manager = DBManager
+
+        # a new DB is fully migrated and an up to date DB applies nothing
+        assert MIGRATIONS.Latest == MIGRATIONS.Version(Manager)
+        assert [] == MIGRATIONS.Upgrade(Manager)
+
+        # a forced upgrade repairs dropped objects
+        Manager.DropIndex("library_artist_idx")
+        Manager.exec_query("DROP TRIGGER library_fts_insert")
+        assert len(MIGRATIONS.Migrations) == len(MIGRATIONS.Upgrade(Manager, force = True))
+        MIGRATIONS.RunTasks(Manager)
+        assert [1, 1] == Manager.exec_query("""
+        SELECT count(*) FROM sqlite_master WHERE name IN ('library_artist_idx', 'library_fts_insert') GROUP BY type
+        """, 1)
+
+        # a DB with a newer schema is refused
+        MIGRATIONS.SetVersion(Manager, MIGRATIONS.Latest + 1)
+        with pytest.raises(DBStructureError):
+            Manager.db_startup_checks()
+        with pytest.raises(ValueError):
+            MIGRATIONS.Upgrade(Manager)
+        MIGRATIONS.SetVersion(Manager, MIGRATIONS.Latest)
+
+    def test_Resume(self, DBManager):
+        Manager = DBManager
+
+        # an unversioned DB with a partial library table is upgraded in place
+        Manager.DropTable("library")
+        Manager.exec_query("CREATE TABLE library(file_id TEXT PRIMARY KEY, title TEXT)")
+        Manager.exec_query("INSERT INTO library(file_id, title) VALUES ('file_idX0', 'titleX0')")
+        MIGRATIONS.SetVersion(Manager, 0)
+        assert Manager.db_startup_checks()
+        assert MIGRATIONS.Latest == MIGRATIONS.Version(Manager)
+        assert ["titleX0"] == Manager.exec_query("SELECT title FROM library", 1)
+        assert len(Manager.db_fields) == len(Manager.exec_query("SELECT name FROM pragma_table_info('library')", 1))
+        assert ["file_idX0"] == Manager.SearchLibrary("titlex0")
+
+        # a failed migration leaves the version at the last applied one
+        Registry = MigrationRegistry()
+        Registry.Register(1, "first")(lambda Manager, Slot: None)
+
+        @Registry.Register(2, "failing")
+        def Failing(Manager, Slot):
+            raise RuntimeError()
+
+        with pytest.raises(ValueError):
+            Registry.Register(2, "duplicate")(lambda Manager, Slot: None)
+
+        MIGRATIONS.SetVersion(Manager, 0)
+        with pytest.raises(RuntimeError):
+            Registry.Upgrade(Manager)
+        assert 1 == Registry.Version(Manager)
+        MIGRATIONS.SetVersion(Manager, MIGRATIONS.Latest)
+
+    def test_Backfill(self, DBManager_Filled):
+        Manager = DBManager_Filled
+        Messages = []
+
+        # new columns are added in place and filled in resumable chunks
+        assert MIGRATIONS.AddColumn(Manager, "library", "title_sort", "TEXT")
+        assert not MIGRATIONS.AddColumn(Manager, "library", "title_sort", "TEXT")
+        Manager.exec_query("CREATE TABLE IF NOT EXISTS schema_progress(name TEXT PRIMARY KEY, cursor INTEGER)")
+        Manager.exec_query("INSERT INTO schema_progress VALUES ('title_sort', 5)")
+        MIGRATIONS.Backfill(Manager, "title_sort", "library", "title_sort = upper(title)", chunk_size = 4,
+                            Slot = Messages.append)
+
+        # rows before the stored cursor were done by the interrupted run
+        assert [5] == Manager.exec_query("SELECT count(*) FROM library WHERE title_sort IS NULL AND rowid <= 5", 1)
+        assert "TITLEX19" in Manager.exec_query("SELECT title_sort FROM library", 1)
+        assert 4 == len(Messages)
+        assert [] == Manager.exec_query("SELECT * FROM schema_progress")
+
+    def test_NumericColumns(self, DBManager):
+        Manager = DBManager
+        Manager.DropTable("library")
+        Manager.exec_query(f"CREATE TABLE library({', '.join([f'{F} TEXT' for F in Manager.db_fields])})")
+        Legacy = {F: [f"{F}X{R}" for R in range(3)] for F in Manager.db_fields}
+        Legacy["bitrate"] = ["320 Kbps", "128 Kbps", "0 Kbps"]
+        Manager.BatchInsert_Metadata(Legacy)
+
+        # startup only schedules the copy, the upgrade finishes with the text table in place
+        MIGRATIONS.SetVersion(Manager, 1)
+        assert "numeric columns" in MIGRATIONS.Upgrade(Manager)
+        assert Manager.LibrarySchema_Outdated()
+        assert "numeric columns" == MIGRATIONS.Pending(Manager)[0]
+
+        # rows written while the copy runs are caught up by the swap
+        assert not MIGRATIONS.Step(Manager, "numeric columns")
+        Manager.exec_query("UPDATE library SET bitrate = '256 Kbps' WHERE file_id = 'file_idX1'")
+        Manager.exec_query("DELETE FROM library WHERE file_id = 'file_idX2'")
+        Manager.exec_query("INSERT INTO library(file_id, title, bitrate) VALUES ('file_idX3', 'titleX3', '64 Kbps')")
+        assert "numeric columns" == MIGRATIONS.RunTasks(Manager)[0]
+        assert not Manager.LibrarySchema_Outdated()
+        assert [] == MIGRATIONS.Pending(Manager)
+        assert [320000, 256000, 64000] == Manager.exec_query("SELECT bitrate FROM library ORDER BY file_id", 1)
+
+        # the indexes, triggers and statistics of the library survive the swap
+        assert set(LIBRARY_INDEXES.keys()) <= set(Manager.exec_query("SELECT name FROM sqlite_master", 1))
+        assert ["file_idX3"] == Manager.SearchLibrary("titlex3")
+        assert 3 == Manager.TableStats()["tracks"]
+
+    def test_PayloadFileIDs(self, DBManager, tmp_path):
+        Manager = DBManager
+        Paths = []
+        for R, Audio in enumerate([b"audio0", b"audio1", b"audio0"]):
+            # every file has the same tag header, the first and last one the same audio
+            Paths.append(str(tmp_path / f"track{R}.mp3"))
+            with open(Paths[-1], "wb") as fobj:
+                fobj.write(b"ID3\x04\x00\x00\x00\x00\x00\x10" + b"\x00" * 16 + Audio)
+        Old = [f"header{R}" for R in range(3)] + ["missing"]
+        Manager.BatchInsert_Metadata({"file_id": Old, "file_path": Paths + [str(tmp_path / "missing.mp3")],
+                                      "title": ["title0", "title1", "title2", "title3"]})
+        Manager.NowPlaying_Fill(["header1", "missing"])
+        Manager.Save_Fingerprints([[Path, 1, 1, 1, ID] for Path, ID in zip(Paths, Old)])
+
+        # rows are re-keyed with the payload ids, the queue follows and duplicated audio keeps one row
+        MIGRATIONS.SetVersion(Manager, 7)
+        assert "payload file ids" == MIGRATIONS.Upgrade(Manager)[0]
+
+        # startup only schedules the re-key, the files are hashed by the task
+        assert ["payload file ids"] == MIGRATIONS.Pending(Manager)
+        assert Old == Manager.exec_query("SELECT file_id FROM library ORDER BY title", 1)
+        assert ["payload file ids"] == MIGRATIONS.RunTasks(Manager)
+        assert [] == MIGRATIONS.Pending(Manager)
+        New = [FileManager().FileHasher(Path) for Path in Paths]
+        assert [[New[0], "title0"], [New[1], "title1"], ["missing", "title3"]] == \
+            Manager.exec_query("SELECT file_id, title FROM library ORDER BY title")
+        assert [New[1], "missing"] == Manager.exec_query("SELECT file_id FROM nowplaying_queue ORDER BY position", 1)
+        assert sorted(New[:2]) == sorted(Manager.exec_query("SELECT file_id FROM file_fingerprints", 1))
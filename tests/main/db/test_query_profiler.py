@@ -0,0 +1,62 @@
+import pytest
+
+from apollo.db import QueryProfiler
+from tests.testing_tools.tools import DBManager_Filled, Gen_DbTable_Data
+
+
+@pytest.fixture
+def Profiler():
+    QueryProfiler.Reset()
+    QueryProfiler.Configure(enabled = True)
+    yield QueryProfiler
+    QueryProfiler.Configure(enabled = False, slow_ms = 100, max_statements = 500)
+    QueryProfiler.Reset()
+
+
+#### Tests ####################################################################
+class Test_QueryProfiler:
+
+    def test_Normalize(self):
+        assert "SELECT * FROM library WHERE file_id IN (?, ...) AND rating > ?" == \
+            QueryProfiler.Normalize("SELECT *  FROM library\n WHERE file_id IN ('a', 'it''s', 'c') AND rating > 2.5")
+        assert "SELECT file_idX5 FROM t" == QueryProfiler.Normalize("SELECT file_idX5 FROM t")
+
+    def test_Record(self, DBManager_Filled, Profiler):
+        Manager = DBManager_Filled
+
+        # literals are grouped into one statement with its rows and call site
+        Manager.exec_query("SELECT * FROM library WHERE artist = 'artistX1'")
+        Manager.exec_query("SELECT * FROM library WHERE artist = 'artistX2'")
+        [Top] = [S for S in Profiler.Top(50) if S["sql"] == "SELECT * FROM library WHERE artist = ?"]
+        assert (Top["calls"], Top["rows"]) == (2, 2)
+        assert sum(Top["histogram"].values()) == 2
+        assert list(Top["call_sites"].keys())[0].startswith("test_query_profiler.py")
+
+        # streamed rows are counted once the stream is read
+        for Batch in Manager.stream_query("SELECT file_id FROM library", batch_size = 3):
+            pass
+        assert 20 == Profiler.Top(50, "rows")[0]["rows"]
+
+        # disabled profiler records nothing
+        Profiler.Configure(enabled = False)
+        Manager.exec_query("SELECT count(*) FROM library")
+        assert "SELECT count(*) FROM library" not in [S["sql"] for S in Profiler.Top(50)]
+
+    def test_MaxStatements(self, Profiler):
+        # the least recently run statements are dropped once the limit is reached
+        Profiler.Configure(max_statements = 3)
+        for sql in ("SELECT a FROM t", "SELECT b FROM t", "SELECT c FROM t", "SELECT a FROM t", "SELECT d FROM t"):
+            Profiler.Record(sql, 1.0)
+        assert ["SELECT a FROM t", "SELECT c FROM t", "SELECT d FROM t"] == sorted([S["sql"] for S in Profiler.Top(10)])
+
+    def test_SlowLog(self, DBManager_Filled, Profiler):
+        Manager = DBManager_Filled
+        Profiler.Configure(slow_ms = 0)
+
+        # slow statements keep their query plan
+        Manager.exec_query("SELECT * FROM library WHERE artist = ?", params = ["artistX1"])
+        Manager.exec_query("SELECT * FROM library WHERE title = ?", params = ["titleX1"])
+        Log = Profiler.SlowLog()
+        assert "USING INDEX library_artist_idx" in Log[-2]["plan"][0]
+        assert Log[-1]["plan"][0].startswith("SCAN library")
+        assert "SCAN library" in Profiler.Report(5)
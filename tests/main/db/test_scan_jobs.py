@@ -0,0 +1,157 @@
+import os
+import threading
+
+import pytest
+
+from apollo.db import ConnectionPool, FileManager, ScanJob
+
+
+class CountingFileManager(FileManager):
+    """
+    reads the title from the file name and calls the hook with every parsed file
+    """
+    Hook = staticmethod(lambda file: None)
+
+    def ParseFile(self, file):
+        self.Hook(file)
+        return [os.path.basename(file) if F == "title" else (file if F == "file_path" else None)
+                for F in self.db_fields]
+
+
+@pytest.fixture
+def Library(tmp_path):
+    for Album in ("a", "b"):
+        os.makedirs(tmp_path / "music" / Album / "disc")
+        for R in range(5):
+            (tmp_path / "music" / Album / f"{Album}{R}.mp3").write_bytes(f"{Album}{R}".encode())
+        (tmp_path / "music" / Album / "disc" / f"{Album}_disc.mp3").write_bytes(f"{Album}disc".encode())
+    Manager = CountingFileManager()
+    Manager.connect(str(tmp_path / "library.db"))
+    yield Manager, str(tmp_path / "music")
+    ConnectionPool.CloseDatabase(str(tmp_path / "library.db"))
+
+
+def Titles(Manager):
+    return sorted(Manager.exec_query("SELECT title FROM library", 1))
+
+
+#### Tests ####################################################################
+class Test_ScanJob:
+
+    def test_WalkEntries(self, Library):
+        Manager, Music = Library
+        Walk = [os.path.relpath(Entry.path, Music) for Entry in Manager.WalkEntries(Music)]
+
+        # files of a directory come before its sub directories, both sorted by name
+        assert os.path.join("a", "a0.mp3") == Walk[0]
+        assert Walk.index(os.path.join("a", "disc", "a_disc.mp3")) == 5
+        assert Walk[6] == os.path.join("b", "b0.mp3")
+
+        # a walk resumed after a file continues with the one that follows it
+        for index in (0, 4, 5, 9):
+            After = os.path.join(Music, Walk[index])
+            assert Walk[index + 1:] == [os.path.relpath(Entry.path, Music)
+                                        for Entry in Manager.WalkEntries(Music, After = After)]
+
+    def test_Resume(self, Library, monkeypatch):
+        Manager, Music = Library
+        Parsed = []
+
+        def Slot(Message):
+            # the app closes once the second chunk is commited
+            if Message == "Added 4 Files":
+                Job.Stop()
+
+        monkeypatch.setattr(CountingFileManager, "Hook", staticmethod(lambda file: Parsed.append(file)))
+        Job = ScanJob([Music], ["MP3"])
+        assert ScanJob.RUNNING == Job.Run(Manager, Slot, chunk_rows = 2)
+
+        # the stored position matches the commited chunks
+        [Stored] = ScanJob.Unfinished(Manager)
+        assert (Stored.JobID, Stored.Chunks, Stored.Files) == (Job.JobID, 2, 4)
+        assert ["a0.mp3", "a1.mp3", "a2.mp3", "a3.mp3"] == Titles(Manager)
+        assert Stored.Cursor == os.path.join(Music, "a", "a3.mp3")
+
+        # the next launch resumes after the last chunk and finishes the job
+        Parsed.clear()
+        assert ScanJob.DONE == Stored.Run(Manager, chunk_rows = 2)
+        assert 12 == len(Titles(Manager)) == Stored.Files
+        assert 8 == len(Parsed)
+        assert [] == ScanJob.Unfinished(Manager)
+
+    def test_ChangedFile(self, Library, monkeypatch):
+        Manager, Music = Library
+        Manager.ScanDirectory(Music, ["MP3"])
+        File = os.path.join(Music, "a", "a1.mp3")
+        [Old] = Manager.exec_query("SELECT file_id FROM library WHERE file_path = ?", 1, params = [File])
+        Manager.exec_query("UPDATE library SET rating = 4, playcount = 9 WHERE file_id = ?", params = [Old])
+        Queue = Manager.exec_query("SELECT file_id FROM library ORDER BY title LIMIT 3", 1)
+        Manager.NowPlaying_Fill(Queue)
+        with open(File, "ab") as fobj:
+            fobj.write(b" edited")
+
+        # a chunk that fails leaves the old row as it was
+        def Failing(Fingerprints):
+            raise RuntimeError()
+
+        with monkeypatch.context() as Patch:
+            Patch.setattr(Manager, "Save_Fingerprints", Failing)
+            with pytest.raises(RuntimeError):
+                Manager.ScanDirectory(Music, ["MP3"])
+        assert [[4, 9]] == Manager.exec_query("SELECT rating, playcount FROM library WHERE file_id = ?", params = [Old])
+        assert Queue == Manager.exec_query("SELECT file_id FROM nowplaying_queue ORDER BY position", 1)
+
+        # the rescan replaces the row of the changed file, the rating, playcount and queue position are kept
+        Manager.ScanDirectory(Music, ["MP3"])
+        [New] = Manager.exec_query("SELECT file_id FROM library WHERE file_path = ?", 1, params = [File])
+        assert New != Old
+        assert [[4, 9]] == Manager.exec_query("SELECT rating, playcount FROM library WHERE file_id = ?", params = [New])
+        assert [Queue[0], New, Queue[2]] == Manager.exec_query("SELECT file_id FROM nowplaying_queue ORDER BY position", 1)
+        assert 12 == len(Titles(Manager))
+
+    def test_PauseCancel(self, Library):
+        Manager, Music = Library
+        Job = ScanJob([Music], ["MP3"])
+        Job.Pause()
+
+        # a paused job writes nothing until it is resumed
+        Result = []
+        Scanner = threading.Thread(target = lambda: Result.append(Job.Run(Manager)))
+        Scanner.start()
+        Scanner.join(0.3)
+        assert Scanner.is_alive()
+        Job.Cancel()
+        Scanner.join(5)
+
+        # a cancelled job is not resumed
+        assert [ScanJob.CANCELLED] == Result
+        assert [] == ScanJob.Unfinished(Manager)
+
+    def test_Devices(self, Library, monkeypatch):
+        Manager, Music = Library
+        Parsed = []
+        Dirs = [os.path.join(Music, "a"), os.path.join(Music, "b")]
+
+        def Slot(Message):
+            if Message == "Added 4 Files":
+                Job.Stop()
+
+        # every directory is on a device of its own
+        monkeypatch.setattr(FileManager, "DeviceGroups", staticmethod(lambda Dirs: [[Dir] for Dir in Dirs]))
+        monkeypatch.setattr(CountingFileManager, "Hook", staticmethod(lambda file: Parsed.append(file)))
+        Job = ScanJob(Dirs, ["MP3"])
+        assert ScanJob.RUNNING == Job.Run(Manager, Slot, chunk_rows = 2)
+
+        # both directories keep the last file commited in them
+        [Stored] = ScanJob.Unfinished(Manager)
+        assert 4 == len(Titles(Manager)) == Stored.Files
+        assert set(Stored.Cursors.keys()) <= set(Dirs)
+        Commited = set(Manager.exec_query("SELECT file_path FROM library", 1))
+        assert set(Stored.Cursors.values()) <= Commited
+
+        # the next launch resumes every directory after its cursor
+        Parsed.clear()
+        assert ScanJob.DONE == Stored.Run(Manager, chunk_rows = 2)
+        assert 12 == len(Titles(Manager)) == Stored.Files
+        assert not Commited & set(Parsed)
+        assert [] == ScanJob.Unfinished(Manager)
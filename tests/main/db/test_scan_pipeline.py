@@ -0,0 +1,104 @@
+import random
+import threading
+import time
+
+import pytest
+
+from apollo.db import ScanPipeline, Stage
+
+
+def Sleepy(function):
+    """
+    Delays every item by a random time so the threads of a stage finish out of order
+    """
+    def Wrapped(item):
+        time.sleep(random.random() / 500)
+        return function(item)
+    return Wrapped
+
+
+#### Tests ####################################################################
+class Test_ScanPipeline:
+
+    def test_Order(self):
+        Pipeline = ScanPipeline(range(200), [
+            Stage("even", lambda item: item if item % 2 == 0 else None),
+            Stage("square", Sleepy(lambda item: item * item), workers = 4, queue_size = 4),
+            Stage("label", Sleepy(lambda item: f"item{item}"), workers = 3, queue_size = 2)
+        ])
+
+        # items leave in the order of the source with the dropped ones left out
+        assert [f"item{R * R}" for R in range(0, 200, 2)] == list(Pipeline)
+        Stats = {S["stage"]: S for S in Pipeline.Stats()}
+        assert (200, 100) == (Stats["even"]["items"], Stats["even"]["dropped"])
+        assert (100, 4) == (Stats["square"]["items"], Stats["square"]["workers"])
+        assert "square" in Pipeline.Report()
+
+    def test_Batch(self):
+        Sizes = []
+
+        def Halve(items):
+            Sizes.append(len(items))
+            return [item // 2 if item % 3 else None for item in items]
+
+        # a batched stage gets the queued items at once and keeps their order
+        Pipeline = ScanPipeline(range(300), [Stage("halve", Halve, workers = 2, queue_size = 64, batch = 16)])
+        assert [item // 2 for item in range(300) if item % 3] == list(Pipeline)
+        assert 300 == sum(Sizes)
+        assert max(Sizes) <= 16
+        Stats = {S["stage"]: S for S in Pipeline.Stats()}
+        assert (300, 100) == (Stats["halve"]["items"], Stats["halve"]["dropped"])
+
+    def test_Window(self):
+        Running = []
+        Lock = threading.Lock()
+
+        def Track(item):
+            with Lock:
+                Running.append(item)
+            return item
+
+        # a stalled consumer holds the source back once the window is full
+        Pipeline = ScanPipeline(range(1000), [Stage("track", Track, workers = 2, queue_size = 2)], window = 8)
+        Items = iter(Pipeline)
+        assert 0 == next(Items)
+        time.sleep(0.1)
+        assert len(Running) <= 9
+        Items.close()
+        assert not any([Thread.is_alive() for Thread in Pipeline.Threads])
+
+    def test_Error(self):
+        def Fail(item):
+            if item == 50:
+                raise OSError("unreadable")
+            return item
+
+        # the first error stops every stage and reaches the consumer
+        Pipeline = ScanPipeline(range(100), [Stage("fail", Fail, workers = 2), Stage("pass", lambda item: item)])
+        with pytest.raises(OSError):
+            list(Pipeline)
+        assert not any([Thread.is_alive() for Thread in Pipeline.Threads])
+
+    def test_Merge(self):
+        Devices = [ScanPipeline(range(Start, Start + 50), [Stage("read", Sleepy(lambda item: item), workers = 2)])
+                   for Start in (0, 100, 200)]
+        Pipeline = ScanPipeline(None, [Stage("parse", lambda item: -item, workers = 2)])
+        Pipeline.Source = ScanPipeline.Merge(Devices, Pipeline.Stopped)
+
+        # the merged pipelines are interleaved, each of them keeps its order
+        Items = [-item for item in Pipeline]
+        assert sorted(Items) == [*range(50), *range(100, 150), *range(200, 250)]
+        for Start in (0, 100, 200):
+            assert list(range(Start, Start + 50)) == [item for item in Items if Start <= item < Start + 50]
+
+        # an error of a merged pipeline reaches the consumer
+        def Fail(item):
+            if item == 10:
+                raise OSError("unreadable")
+            return item
+
+        Devices = [ScanPipeline(range(50), [Stage("read", Fail)]), ScanPipeline(range(50), [Stage("read", Sleepy(int))])]
+        Pipeline = ScanPipeline(None, [Stage("parse", lambda item: item)])
+        Pipeline.Source = ScanPipeline.Merge(Devices, Pipeline.Stopped)
+        with pytest.raises(OSError):
+            list(Pipeline)
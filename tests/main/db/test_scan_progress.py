@@ -0,0 +1,87 @@
+import os
+import threading
+import time
+
+import pytest
+
+from apollo.db import ConnectionPool, FileManager, ScanJob, ScanProgress
+
+
+class TitleFileManager(FileManager):
+    """
+    reads the title from the file name
+    """
+
+    def ParseFile(self, file):
+        return [os.path.basename(file) if F == "title" else (file if F == "file_path" else None)
+                for F in self.db_fields]
+
+
+@pytest.fixture
+def Library(tmp_path):
+    os.makedirs(tmp_path / "music" / "disc")
+    for R in range(6):
+        (tmp_path / "music" / f"{R}.mp3").write_bytes(b"x" * (R + 1))
+    (tmp_path / "music" / "disc" / "cover.jpg").write_bytes(b"jpg")
+    (tmp_path / "music" / "disc" / "disc.mp3").write_bytes(b"disc")
+    Manager = TitleFileManager()
+    Manager.connect(str(tmp_path / "library.db"))
+    yield Manager, str(tmp_path / "music")
+    ConnectionPool.CloseDatabase(str(tmp_path / "library.db"))
+
+
+#### Tests ####################################################################
+class Test_ScanProgress:
+
+    def test_RateLimit(self):
+        Updates = []
+        Progress = ScanProgress(rate = 10)
+        Progress.Updated.connect(Updates.append)
+
+        # updates from several threads are coalesced, the counters keep every increment
+        Threads = [threading.Thread(target = lambda: [Progress.Add(seen = 1) or time.sleep(0.0005)
+                                                      for _ in range(200)]) for _ in range(4)]
+        start = time.monotonic()
+        for Thread in Threads:
+            Thread.start()
+        for Thread in Threads:
+            Thread.join()
+        elapsed = time.monotonic() - start
+        assert len(Updates) <= elapsed * 10 + 1
+        Progress.Finish()
+        assert 800 == Updates[-1]["seen"]
+
+    def test_Scan(self, Library):
+        Manager, Music = Library
+        Messages = []
+        Progress = ScanProgress(rate = 1000)
+        Progress.StatusChanged.connect(Messages.append)
+
+        assert "done" == ScanJob([Music], ["MP3"]).Run(Manager, Progress.Message, progress = Progress)
+        Progress.Counting.join()
+        Snapshot = Progress.Snapshot()
+        assert (7, 7, 0, 7) == (Snapshot["total"], Snapshot["seen"], Snapshot["skipped"], Snapshot["parsed"])
+        assert 25 == Snapshot["bytes"]
+        assert 0 == Snapshot["eta"]
+
+        # a rescan skips the unchanged files
+        Progress = ScanProgress(rate = 1000)
+        Progress.StatusChanged.connect(Messages.append)
+        Manager.ScanDirectory(Music, ["MP3"], Progress.Message, progress = Progress)
+        Progress.Finish()
+        Snapshot = Progress.Snapshot()
+        assert (7, 7, 0) == (Snapshot["seen"], Snapshot["skipped"], Snapshot["parsed"])
+        assert Messages[-1].startswith("Completed Scanning")
+
+    def test_Format(self):
+        Progress = ScanProgress()
+        Progress.Add(seen = 25, parsed = 20, skipped = 5, bytes = 3 * 1024 ** 2)
+        Progress.Total = 100
+        Progress.Started -= 5
+        Progress.Message("Scanning D:\\music")
+
+        # 25 files in 5s leave 75 files for 15s
+        Snapshot = Progress.Snapshot()
+        assert 15 == pytest.approx(Snapshot["eta"], abs = 0.5)
+        assert ScanProgress.Format(Snapshot).startswith("Scanning D:\\music | 25/100 Files, 20 Read, 5 Unchanged, 3.0 MB")
+        assert "ETA 0:00:15" in ScanProgress.Format(Snapshot)
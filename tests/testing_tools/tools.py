@@ -7,7 +7,7 @@ from PySide6 import QtWidgets
 from PySide6 import QtGui
 from PySide6 import QtCore
 
-from apollo.db import DataBaseManager, FileManager, LibraryManager
+from apollo.db import DataBaseManager, FileManager, LibraryManager, ConnectionPool
 from apollo.db import DBStructureError, QueryBuildFailed, QueryExecutionFailed
 from apollo import PARENT_DIR
 
@@ -78,10 +78,9 @@ def Gen_DbTable_Data(rows = 20):
             data = [Row for Row in range(rows)]
         else:
             if fields == "filesize":
-                data = [f"1024" for Row in range(rows)]
+                data = [1024 for Row in range(rows)]
             elif fields == "length":
-                data = datetime.timedelta(seconds = 60)
-                data = [f"{data}" for Row in range(rows)]
+                data = [60000 for Row in range(rows)]
             else:
                 data = [f"{fields}X{Row}" for Row in range(rows)]
         DataTable[fields] = data
@@ -89,12 +88,14 @@ def Gen_DbTable_Data(rows = 20):
 
 @pytest.fixture
 def DBManager():
+    ConnectionPool.CloseDatabase(":memory:")
     Manager = DataBaseManager()
     Manager.connect(":memory:")
     return Manager
 
 @pytest.fixture
 def DBManager_Filled(Gen_DbTable_Data):
+    ConnectionPool.CloseDatabase(":memory:")
     Manager = DataBaseManager()
     Manager.connect(":memory:")
     Manager.BatchInsert_Metadata(Gen_DbTable_Data)
@@ -102,6 +103,7 @@ def DBManager_Filled(Gen_DbTable_Data):
 
 @pytest.fixture
 def LibraryManager_connected():
+    ConnectionPool.CloseDatabase(":memory:")
     Manager = LibraryManager(":memory:")
     return Manager
 
@@ -117,5 +119,6 @@ def TempFilled_DB(Gen_DbTable_Data):
     return (Manager, Data)
 
 def del_TempFilled_DB():
+    ConnectionPool.CloseDatabase(f"{TESTFILES}\\test_db.db")
     if os.path.isfile(f"{TESTFILES}\\test_db.db"):
         os.remove(f"{TESTFILES}\\test_db.db")